@@ -0,0 +1,188 @@
+# _*_ coding:utf-8 _*_
+"""
+Lengths of the chromosomes of the reference genomes known to the importer
+
+Chromosome lengths are looked up, in this order, in a process-wide memo,
+in .chrom.sizes files (a cache directory, then the files bundled with this
+package), in the chrom_size table of the database, and finally, if allowed,
+downloaded from UCSC.
+"""
+
+import logging
+import os
+import re
+
+# directory of the .chrom.sizes files bundled with the package
+BUNDLED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'chrom_sizes')
+
+# URL of the .chrom.sizes file of a genome build at UCSC
+UCSC_CHROM_SIZES_URL = ('http://hgdownload.cse.ucsc.edu'
+                        '/goldenPath/{build}/bigZips/{build}.chrom.sizes')
+
+# ids of the reference genomes in the database
+REFERENCE_GENOME_IDS = {'hg19': 1, 'hg38': 2, 'mm10': 3}
+
+# chromosome lengths by genome build, as loaded by this process
+_chrom_size_memo = {}
+
+_logger = logging.getLogger(__name__)
+
+
+def get_chromosome_lengths(genome_build, logger=None, cache_dir=None,
+                           download=True):
+    """
+    get the length of each chromosome of a genome build
+
+    The result does not include unplaced contigs, alternative haplotypes or
+    the mitochondrial chromosome. The chromosome names do not include the
+    'chr' prefix.
+
+    :param: genome_build (String) - UCSC name of the build, e.g. hg19, mandatory
+    :param: logger - logging.Logger instance to report the source to
+    :param: cache_dir (String) - directory of .chrom.sizes files to read
+            first, and to store downloaded files in
+    :param: download (Boolean) - whether to download the lengths from UCSC
+            if they are not found locally
+    :returns: dict mapping chromosome names to lengths (a copy, to be
+              modified by the caller as needed)
+    :raises: IOError if the lengths could not be found or retrieved
+
+    """
+    if logger is None:
+        logger = _logger
+    if genome_build not in _chrom_size_memo:
+        _chrom_size_memo[genome_build] = _load_chromosome_lengths(
+            genome_build, logger, cache_dir, download)
+    return dict(_chrom_size_memo[genome_build])
+
+
+def _load_chromosome_lengths(genome_build, logger, cache_dir, download):
+    """
+    find the chromosome lengths of a genome build in the first source having them
+    """
+    file_name = '{0}.chrom.sizes'.format(genome_build)
+    for dir_path in (cache_dir, BUNDLED_DIR):
+        if dir_path is None:
+            continue
+        chrom_size_path = os.path.join(dir_path, file_name)
+        if os.path.isfile(chrom_size_path):
+            logger.debug("Reading chromosome lengths from '%s'",
+                         chrom_size_path)
+            with open(chrom_size_path, 'rU') as chrom_size_file:
+                return parse_chrom_sizes(chrom_size_file, chrom_size_path)
+    chrom_size_dict = _read_database_chrom_sizes(genome_build, logger)
+    if chrom_size_dict:
+        return chrom_size_dict
+    if not download:
+        raise IOError('No chromosome lengths found for genome build '
+                      '{0}'.format(genome_build))
+    return _download_chrom_sizes(genome_build, logger, cache_dir)
+
+
+def _read_database_chrom_sizes(genome_build, logger):
+    """
+    read the chromosome lengths of a genome build from the chrom_size table
+
+    The database is only used if the importer has been configured to connect
+    to it, as indicated by the CBIO_CONFIG environment variable, and errors
+    reading it are only logged, so that other sources can be tried.
+
+    :returns: dict mapping chromosome names to lengths, or None
+
+    """
+    if (genome_build not in REFERENCE_GENOME_IDS or
+            'CBIO_CONFIG' not in os.environ):
+        return None
+    try:
+        from cbio.core.pgsql import get_chrom_size_dict
+    except ImportError as e:
+        logger.debug('Not reading chromosome lengths from the database: %s',
+                     e)
+        return None
+    logger.debug('Reading chromosome lengths of %s from the database',
+                 genome_build)
+    try:
+        return get_chrom_size_dict(REFERENCE_GENOME_IDS[genome_build])
+    except Exception as e:
+        logger.debug('Could not read chromosome lengths from the database: '
+                     '%s', e)
+        return None
+
+
+def _download_chrom_sizes(genome_build, logger, cache_dir):
+    """
+    download the .chrom.sizes file of a genome build from UCSC
+
+    The file is stored in `cache_dir` if given, to be read from there next time.
+    """
+    import requests
+    chrom_size_url = UCSC_CHROM_SIZES_URL.format(build=genome_build)
+    logger.debug("Retrieving chromosome lengths from '%s'",
+                 chrom_size_url)
+    r = requests.get(chrom_size_url)
+    try:
+        r.raise_for_status()
+    except requests.exceptions.HTTPError as e:
+        raise IOError('Error retrieving chromosome lengths from UCSC: ' +
+                      e.message)
+    chrom_size_dict = parse_chrom_sizes(r.text.splitlines(), chrom_size_url)
+    if cache_dir is not None:
+        chrom_size_path = os.path.join(
+            cache_dir, '{0}.chrom.sizes'.format(genome_build))
+        # write to a temporary file first, so as not to leave a partial one
+        temp_path = '{0}.{1}.tmp'.format(chrom_size_path, os.getpid())
+        with open(temp_path, 'w') as chrom_size_file:
+            chrom_size_file.write(r.content)
+        os.rename(temp_path, chrom_size_path)
+    return chrom_size_dict
+
+
+def parse_chrom_sizes(lines, source):
+    """
+    parse the lines of a .chrom.sizes file
+
+    Unplaced contigs, alternative haplotypes and other sequences that are not
+    chromosomes are skipped, as is the mitochondrial chromosome.
+
+    :param: lines - iterable of the lines of the file, mandatory
+    :param: source (String) - file name or URL for error messages, mandatory
+    :returns: dict mapping chromosome names without 'chr' to lengths
+    :raises: IOError if a line is not a chromosome name and a length
+
+    """
+    chrom_size_dict = {}
+    for line in lines:
+        line = line.rstrip('\r\n')
+        try:
+            # skip comment lines
+            if line.startswith('#'):
+                continue
+            cols = line.split('\t', 1)
+            if not (len(cols) == 2 and
+                    cols[0].startswith('chr')):
+                raise IOError()
+            # skip unplaced sequences
+            if cols[0].endswith('_random') or cols[0].startswith('chrUn_'):
+                continue
+            # skip entries for alternative haplotypes
+            if re.search(r'_hap[0-9]+$', cols[0]):
+                continue
+            # skip the mitochondrial chromosome
+            if cols[0] == 'chrM':
+                continue
+            # remove the 'chr' prefix
+            chrom_name = cols[0][3:]
+            # skip other sequences, such as alternative loci
+            if len(chrom_name) > 2:
+                continue
+            try:
+                chrom_size = int(cols[1])
+            except ValueError:
+                raise IOError()
+            chrom_size_dict[chrom_name] = chrom_size
+        except IOError:
+            raise IOError(
+                "Unexpected line in {source}: {line}".format(
+                    source=source, line=repr(line)))
+    return chrom_size_dict
@@ -0,0 +1,120 @@
+# _*_ coding:utf-8 _*_
+"""
+Incremental reading of large JSON arrays, one element at a time
+"""
+
+import json
+import re
+
+# number of bytes to read from a file at a time
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_SEPARATOR = re.compile(r'[ \t\n\r]*,[ \t\n\r]*')
+# characters that can follow a complete array element
+_DELIMITERS = ' \t\n\r,]'
+
+
+def iter_json_array(source, chunk_size=CHUNK_SIZE):
+    """
+    decode the elements of a JSON array as they are read
+
+    Only the current chunk and the element being decoded are kept in memory,
+    so the caller can process each element before the rest of the document
+    has been read or downloaded.
+
+    :param: source - file-like object with a read() method, or iterable of
+            strings (such as requests' Response.iter_content()), mandatory
+    :param: chunk_size (Integer) - number of bytes to read from a file at a time
+    :returns: generator of the decoded elements
+    :raises: ValueError if the document is not a well-formed JSON array
+
+    """
+    if hasattr(source, 'read'):
+        chunks = iter(lambda: source.read(chunk_size), '')
+    else:
+        chunks = iter(source)
+    raw_decode = json.JSONDecoder().raw_decode
+    buf = ''
+    pos = 0
+    at_eof = False
+    # whether the opening bracket has been read, and the number of elements
+    in_array = False
+    num_elements = 0
+    expect_element = True
+    while True:
+        pos = _WHITESPACE.match(buf, pos).end()
+        if pos == len(buf):
+            if at_eof:
+                raise ValueError('Unexpected end of JSON array')
+            # drop what has been decoded and read the next chunk
+            buf = buf[pos:]
+            pos = 0
+            try:
+                buf += next(chunks)
+            except StopIteration:
+                at_eof = True
+            continue
+        char = buf[pos]
+        if not in_array:
+            if char != '[':
+                raise ValueError('Expected a JSON array')
+            in_array = True
+            pos += 1
+            continue
+        if char == ']' and (num_elements == 0 or not expect_element):
+            pos += 1
+            break
+        if not expect_element:
+            if char != ',':
+                raise ValueError(
+                    'Expected , or ] at position {0} of chunk'.format(pos))
+            expect_element = True
+            pos += 1
+            continue
+        # fast path: decode elements for as long as each is followed by a
+        # comma within the buffer, which means it is complete
+        while True:
+            try:
+                element, end = raw_decode(buf, pos)
+            except ValueError:
+                break
+            separator = _SEPARATOR.match(buf, end)
+            if separator is None:
+                break
+            pos = separator.end()
+            num_elements += 1
+            yield element
+        try:
+            element, end = raw_decode(buf, pos)
+        except ValueError:
+            end = None
+        # a number cut off by the end of the buffer (like 1.5 of 1.5e3) may
+        # continue in the next chunk, so decode it again once more is read
+        if end is None or (not at_eof and
+                           (end == len(buf) or buf[end] not in _DELIMITERS)):
+            if at_eof:
+                raise ValueError(
+                    'Malformed JSON array element: {0}'.format(
+                        buf[pos:pos + 80]))
+            buf = buf[pos:]
+            pos = 0
+            try:
+                buf += next(chunks)
+            except StopIteration:
+                at_eof = True
+            continue
+        pos = end
+        num_elements += 1
+        expect_element = False
+        yield element
+    # only whitespace may follow the array
+    while True:
+        pos = _WHITESPACE.match(buf, pos).end()
+        if pos < len(buf):
+            raise ValueError('Extra data after JSON array')
+        try:
+            buf = next(chunks)
+        except StopIteration:
+            return
+        pos = 0
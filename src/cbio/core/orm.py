@@ -141,4 +141,59 @@ class ChromSize(Base):
     #reference_genome = relationship(ReferenceGenome, backref=backref('chrom_size', order_by=chrom_id))
 
     def __repr__(self):
-        return "<ChromSize('{chrom_name}')>".format(**self.__dict__)
\ No newline at end of file
+        return "<ChromSize('{chrom_name}')>".format(**self.__dict__)
+
+
+class CancerStudy(Base):
+
+    __tablename__ = 'cancer_study'
+
+    CANCER_STUDY_ID = Column(Integer, primary_key=True)
+    CANCER_STUDY_IDENTIFIER = Column(Unicode(255, collation='utf8_bin'), nullable=True)
+
+    def __repr__(self):
+        return "<CancerStudy('{CANCER_STUDY_IDENTIFIER}')>".format(**self.__dict__)
+
+class GeneticProfile(Base):
+
+    __tablename__ = 'genetic_profile'
+
+    GENETIC_PROFILE_ID = Column(Integer, primary_key=True)
+    STABLE_ID = Column(Unicode(255, collation='utf8_bin'), nullable=False)
+    CANCER_STUDY_ID = Column(Integer, ForeignKey('cancer_study.CANCER_STUDY_ID'), nullable=False)
+
+    def __repr__(self):
+        return "<GeneticProfile('{STABLE_ID}')>".format(**self.__dict__)
+
+class SampleList(Base):
+
+    __tablename__ = 'sample_list'
+
+    LIST_ID = Column(Integer, primary_key=True)
+    STABLE_ID = Column(Unicode(255, collation='utf8_bin'), nullable=False)
+    CANCER_STUDY_ID = Column(Integer, ForeignKey('cancer_study.CANCER_STUDY_ID'), nullable=False)
+
+    def __repr__(self):
+        return "<SampleList('{STABLE_ID}')>".format(**self.__dict__)
+
+class Patient(Base):
+
+    __tablename__ = 'patient'
+
+    INTERNAL_ID = Column(Integer, primary_key=True)
+    STABLE_ID = Column(Unicode(50, collation='utf8_bin'), nullable=False)
+    CANCER_STUDY_ID = Column(Integer, ForeignKey('cancer_study.CANCER_STUDY_ID'), nullable=False)
+
+    def __repr__(self):
+        return "<Patient('{STABLE_ID}')>".format(**self.__dict__)
+
+class ClinicalPatient(Base):
+
+    __tablename__ = 'clinical_patient'
+
+    INTERNAL_ID = Column(Integer, ForeignKey('patient.INTERNAL_ID'), primary_key=True)
+    ATTR_ID = Column(Unicode(255, collation='utf8_bin'), primary_key=True)
+    ATTR_VALUE = Column(Text, nullable=False)
+
+    def __repr__(self):
+        return "<ClinicalPatient({INTERNAL_ID}, '{ATTR_ID}')>".format(**self.__dict__)
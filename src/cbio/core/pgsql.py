@@ -1,9 +1,11 @@
 # _*_ coding:utf-8 _*_
 
-import json
+from cbio.core.jsonstream import iter_json_array
 from cbio.core.orm import CancerType
 from cbio.core.orm import GeneticEntity, Gene, GeneAlias
 from cbio.core.orm import ReferenceGenome, ChromSize
+from cbio.core.orm import CancerStudy, GeneticProfile, SampleList
+from cbio.core.orm import Patient, ClinicalPatient
 from sqlalchemy import or_, and_, func, desc
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 from cbio.core.orm import session_scope
@@ -170,8 +172,7 @@ def add_gene(genes):
     
     """
     with open(genes) as fh:
-        data = json.load(fh)
-        for dic in data:
+        for dic in iter_json_array(fh):
             try:
                 logger.info(dic)
                 if not gene_exist(dic['entrez_gene_id'], dic['hugo_gene_symbol']):
@@ -210,8 +211,7 @@ def add_gene_alias(gene_alias_file):
 
     """
     with open(gene_alias_file) as fh:
-        data = json.load(fh)
-        for dic in data:
+        for dic in iter_json_array(fh):
             try:
                 logger.info(dic)
                 if not gene_alias_exist(dic['entrez_gene_id'], dic['gene_alias']):
@@ -259,8 +259,7 @@ def add_cancer_types(cancer_types):
 
     """
     with open(cancer_types) as json_file:
-        data = json.load(json_file)
-        for dic in data:
+        for dic in iter_json_array(json_file):
             try:
                 logger.info(dic)
                 _add_type_of_cancer(dic['id'], dic['name'], dic['color'])
@@ -305,6 +304,18 @@ def add_chrom_sizes(chrom_size_dict, ref_genome_id):
     except ChromSizeError as e:
         logger.error(e.message)
 
+def get_chrom_size_dict(ref_genome_id):
+    """
+    retrieve the chromosome sizes of a reference genome by chromosome name
+
+    :param: ref_genome_id (integer) - id of reference genome, mandatory
+    :returns: dict mapping chromosome names to sizes
+
+    """
+    with session_scope() as session:
+        q = session.query(ChromSize).filter(ChromSize.reference_genome_id == ref_genome_id)
+        return dict((chrom.chrom_name, int(chrom.size)) for chrom in q.all())
+
 def get_chrom_sizes(ref_genome_id):
     with session_scope() as session:
         try:
@@ -314,4 +325,56 @@ def get_chrom_sizes(ref_genome_id):
             return chrom_sizes
         except Exception as e:
             logger.error(e.message)
-            return None
\ No newline at end of file
+            return None
+
+def delete_genetic_profile(STABLE_ID):
+    """
+    delete a genetic profile, and its data through the ON DELETE CASCADE
+    foreign keys of the portal database
+
+    :param: STABLE_ID (String) - stable id of the profile, including the
+            cancer study identifier, mandatory
+    :returns: number of profiles deleted, 0 if there was none
+
+    """
+    with session_scope() as session:
+        return session.query(GeneticProfile) \
+            .filter(GeneticProfile.STABLE_ID == STABLE_ID) \
+            .delete(synchronize_session=False)
+
+def delete_sample_list(STABLE_ID):
+    """
+    delete a case list, and its samples through the ON DELETE CASCADE
+    foreign key of the portal database
+
+    :param: STABLE_ID (String) - stable id of the case list, mandatory
+    :returns: number of case lists deleted, 0 if there was none
+
+    """
+    with session_scope() as session:
+        return session.query(SampleList) \
+            .filter(SampleList.STABLE_ID == STABLE_ID) \
+            .delete(synchronize_session=False)
+
+def delete_patient_clinical_data(CANCER_STUDY_IDENTIFIER, ATTR_IDS):
+    """
+    delete the values of clinical attributes of the patients of a study
+
+    The attribute definitions are kept, for the data to be loaded again.
+
+    :param: CANCER_STUDY_IDENTIFIER (String) - identifier of the study, mandatory
+    :param: ATTR_IDS (list) - ids of the patient attributes, mandatory
+    :returns: number of values deleted
+
+    """
+    with session_scope() as session:
+        patient_ids = [patient.INTERNAL_ID for patient in
+                       session.query(Patient.INTERNAL_ID)
+                       .join(CancerStudy, Patient.CANCER_STUDY_ID == CancerStudy.CANCER_STUDY_ID)
+                       .filter(CancerStudy.CANCER_STUDY_IDENTIFIER == CANCER_STUDY_IDENTIFIER)]
+        if not patient_ids or not ATTR_IDS:
+            return 0
+        return session.query(ClinicalPatient) \
+            .filter(ClinicalPatient.INTERNAL_ID.in_(patient_ids)) \
+            .filter(ClinicalPatient.ATTR_ID.in_(list(ATTR_IDS))) \
+            .delete(synchronize_session=False)
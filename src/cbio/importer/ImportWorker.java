@@ -0,0 +1,150 @@
+/*
+ * Launcher that keeps one JVM running for several steps of a study import.
+ *
+ * Compiled and started by cbioportal_common.start_java_workers(), with the
+ * cBioPortal scripts jar on the classpath. It only uses the scripts classes
+ * through reflection, so it compiles without the jar.
+ */
+
+import java.io.BufferedReader;
+import java.io.FilterOutputStream;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.security.Permission;
+
+/**
+ * Runs the main methods of classes such as the
+ * org.mskcc.cbio.portal.scripts.* importers, one at a time, as commands are
+ * read from standard input.
+ *
+ * A command is a line with the number of arguments, followed by a line with
+ * the class name and one line per argument. Once the main method returns or
+ * calls System.exit(), a line with DONE_MARKER and the exit status is written
+ * to standard output, after a line break if the output of the step did not
+ * end with one. An empty line or the end of the input stops the worker.
+ */
+public class ImportWorker {
+
+    /** Start of the line reporting the exit status of a step. */
+    static final String DONE_MARKER = "#cbio-import-worker-done#";
+
+    /** Whether System.exit() may stop the JVM rather than end a step. */
+    private static volatile boolean allowExit = false;
+
+    /** Whether the last byte written to stdout or stderr was a line break. */
+    private static volatile boolean atLineStart = true;
+
+    /** Passes bytes on, noting whether the last one was a line break. */
+    private static class LineEndTrackingStream extends FilterOutputStream {
+        LineEndTrackingStream(OutputStream out) {
+            super(out);
+        }
+
+        @Override
+        public void write(int b) throws IOException {
+            out.write(b);
+            atLineStart = b == '\n';
+        }
+
+        @Override
+        public void write(byte[] b, int off, int len) throws IOException {
+            out.write(b, off, len);
+            if (len > 0) {
+                atLineStart = b[off + len - 1] == '\n';
+            }
+        }
+    }
+
+    /** Thrown instead of stopping the JVM when a step calls System.exit(). */
+    private static class ExitTrappedException extends SecurityException {
+        private static final long serialVersionUID = 1L;
+        final int status;
+
+        ExitTrappedException(int status) {
+            super("System.exit(" + status + ") called by import step");
+            this.status = status;
+        }
+    }
+
+    public static void main(String[] args) throws IOException {
+        try {
+            System.setSecurityManager(new SecurityManager() {
+                @Override
+                public void checkPermission(Permission perm) {
+                }
+
+                @Override
+                public void checkPermission(Permission perm, Object context) {
+                }
+
+                @Override
+                public void checkExit(int status) {
+                    if (!allowExit) {
+                        throw new ExitTrappedException(status);
+                    }
+                }
+            });
+        } catch (UnsupportedOperationException e) {
+            System.err.println("Cannot trap System.exit() in import steps; "
+                    + "start the worker with -Djava.security.manager=allow");
+            allowExit = true;
+            System.exit(1);
+        }
+        // both streams share the pipe read by cbioportal_common.JavaWorker
+        System.setOut(new PrintStream(
+                new LineEndTrackingStream(System.out), true));
+        System.setErr(new PrintStream(
+                new LineEndTrackingStream(System.err), true));
+        BufferedReader in = new BufferedReader(
+                new InputStreamReader(System.in, "UTF-8"));
+        String line;
+        while ((line = in.readLine()) != null && !line.isEmpty()) {
+            int numArgs = Integer.parseInt(line.trim());
+            String className = in.readLine();
+            String[] stepArgs = new String[numArgs];
+            for (int i = 0; i < numArgs; i++) {
+                stepArgs[i] = in.readLine();
+            }
+            int status = runStep(className, stepArgs);
+            System.err.flush();
+            System.out.flush();
+            if (!atLineStart) {
+                System.out.println();
+            }
+            System.out.println(DONE_MARKER + " " + status);
+            System.out.flush();
+        }
+        allowExit = true;
+        System.exit(0);
+    }
+
+    /**
+     * Runs the main method of a class, returning the exit status a separate
+     * JVM running it would have had.
+     */
+    static int runStep(String className, String[] stepArgs) {
+        try {
+            Class<?> stepClass = Class.forName(className);
+            Method mainMethod = stepClass.getMethod("main", String[].class);
+            mainMethod.invoke(null, (Object) stepArgs);
+            return 0;
+        } catch (InvocationTargetException e) {
+            // the step may have called System.exit() while handling an error
+            for (Throwable cause = e.getCause(); cause != null;
+                    cause = cause.getCause()) {
+                if (cause instanceof ExitTrappedException) {
+                    return ((ExitTrappedException) cause).status;
+                }
+            }
+            e.getCause().printStackTrace();
+            return 1;
+        } catch (Exception e) {
+            e.printStackTrace();
+            return 1;
+        }
+    }
+}
@@ -6,9 +6,17 @@
 import os
 import sys
 import csv
+import gzip
+import hashlib
+import itertools
+import json
 import logging.handlers
-from collections import OrderedDict
-from subprocess import Popen, PIPE, STDOUT
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict, deque, namedtuple
+from subprocess import Popen, PIPE, STDOUT, check_call
 
 
 # ------------------------------------------------------------------------------
@@ -25,6 +33,33 @@ IMPORT_CASE_LIST_CLASS = "org.mskcc.cbio.portal.scripts.ImportSampleList"
 ADD_CASE_LIST_CLASS = "org.mskcc.cbio.portal.scripts.AddCaseList"
 VERSION_UTIL_CLASS = "org.mskcc.cbio.portal.util.VersionUtil"
 
+# launcher class of the persistent JVM workers, and its source file
+JAVA_WORKER_CLASS = 'ImportWorker'
+JAVA_WORKER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  JAVA_WORKER_CLASS + '.java')
+# Java versions from which a JVM worker has to be allowed to install the
+# SecurityManager trapping System.exit(), and from which it cannot anymore
+JAVA_WORKER_SECURITY_MANAGER_FLAG_VERSION = 18
+JAVA_WORKER_NO_SECURITY_MANAGER_VERSION = 24
+# start of the line a JVM worker writes when it has finished a step
+JAVA_WORKER_DONE_MARKER = '#cbio-import-worker-done#'
+# the marker and exit status ending a line of worker output; a step whose
+# output lacks a final line break may still precede them on the same line
+JAVA_WORKER_DONE_RE = re.compile(
+    re.escape(JAVA_WORKER_DONE_MARKER) + r' (-?\d+)\n?$')
+
+# number of the last output lines of a Java step kept for error messages
+OUTPUT_TAIL_LINES = 50
+
+# progress lines printed by the cBioPortal loaders, by kind of progress event
+JAVA_PROGRESS_PATTERNS = (
+    ('percent_complete', re.compile(r'^Percentage Complete:\s+([\d,.]+)%')),
+    ('memory_allocated_mb', re.compile(r'^Mem Allocated:\s+([\d,.]+) MB')),
+    ('memory_used_mb', re.compile(r'^Mem Used:\s+([\d,.]+) MB')),
+)
+# the dots the loaders print between progress lines, one per 100 records
+JAVA_PROGRESS_DOTS_PATTERN = re.compile(r'^\.+$')
+
 class MetaFileTypes(object):
     """how we differentiate between data types."""
     STUDY = 'meta_study'
@@ -223,6 +258,53 @@ IMPORTER_REQUIRES_METADATA = {
     "org.mskcc.cbio.portal.scripts.ImportTimelineData" : True
 }
 
+# meta file type of each combination of genetic_alteration_type and
+# datatype
+META_TYPE_BY_ALT_TYPE_AND_DATATYPE = {
+    # cancer type
+    ("CANCER_TYPE", "CANCER_TYPE"): MetaFileTypes.CANCER_TYPE,
+    # clinical and timeline
+    ("CLINICAL", "PATIENT_ATTRIBUTES"): MetaFileTypes.PATIENT_ATTRIBUTES,
+    ("CLINICAL", "SAMPLE_ATTRIBUTES"): MetaFileTypes.SAMPLE_ATTRIBUTES,
+    ("CLINICAL", "TIMELINE"): MetaFileTypes.TIMELINE,
+    # rppa
+    ("PROTEIN_LEVEL", "LOG2-VALUE"): MetaFileTypes.RPPA,
+    ("PROTEIN_LEVEL", "Z-SCORE"): MetaFileTypes.RPPA,
+    # cna
+    ("COPY_NUMBER_ALTERATION", "DISCRETE"): MetaFileTypes.CNA,
+    ("COPY_NUMBER_ALTERATION", "CONTINUOUS"): MetaFileTypes.CNA_CONTINUOUS, 
+    ("COPY_NUMBER_ALTERATION", "LOG2-VALUE"): MetaFileTypes.CNA_LOG2,
+    ("COPY_NUMBER_ALTERATION", "SEG"): MetaFileTypes.SEG,
+    # expression
+    ("MRNA_EXPRESSION", "CONTINUOUS"): MetaFileTypes.EXPRESSION,
+    ("MRNA_EXPRESSION", "Z-SCORE"): MetaFileTypes.EXPRESSION,
+    ("MRNA_EXPRESSION", "DISCRETE"): MetaFileTypes.EXPRESSION,
+    # mutations
+    ("MUTATION_EXTENDED", "MAF"): MetaFileTypes.MUTATION,
+    # others
+    ("METHYLATION", "CONTINUOUS"): MetaFileTypes.METHYLATION,
+    ("FUSION", "FUSION"): MetaFileTypes.FUSION,
+    # cross-sample molecular statistics (for gene selection)
+    ("GISTIC_GENES_AMP", "Q-VALUE"): MetaFileTypes.GISTIC_GENES,
+    ("GISTIC_GENES_DEL", "Q-VALUE"): MetaFileTypes.GISTIC_GENES,
+    ("MUTSIG", "Q-VALUE"): MetaFileTypes.MUTATION_SIGNIFICANCE
+}
+
+# file listing the stable_ids allowed for each combination of
+# genetic_alteration_type and datatype
+ALLOWED_DATA_TYPES_FILE = os.path.join(os.path.dirname(__file__),
+                                       'allowed_data_types.txt')
+
+# the study schema, once loaded by get_study_schema()
+_study_schema = None
+
+# number of bytes to read at a time when hashing a file
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# SHA-1 digests of the files hashed by this process, with the size and
+# modification time of each file when it was hashed
+_file_hash_memo = {}
+
 # ------------------------------------------------------------------------------
 # class definitions
 
@@ -238,7 +320,8 @@ class ValidationMessageFormatter(logging.Formatter):
 
     If instead a message pertains to multiple values of one of these
     fields (as the result of aggregation by CollapsingLogMessageHandler),
-    these will be expected in the field <fieldname>_list.
+    these will be expected in the field <fieldname>_list, and the number
+    of values left out of it in <fieldname>_num_omitted, if any.
     """
 
     def format(self, record, *args, **kwargs):
@@ -286,7 +369,8 @@ class ValidationMessageFormatter(logging.Formatter):
             if max_join is None:
                 max_join = len(attr_list)
             string_list = list(str(val) for val in attr_list[:max_join])
-            num_skipped = len(attr_list) - len(string_list)
+            num_skipped = (len(attr_list) - len(string_list) +
+                           getattr(record, field_name + '_num_omitted', 0))
             if num_skipped != 0:
                 string_list.append('(%d more)' % num_skipped)
             attr_indicator = multiple_fmt % join_string.join(string_list)
@@ -355,116 +439,456 @@ class LogfileStyleFormatter(ValidationMessageFormatter):
         return formatted_result
 
 
-class CollapsingLogMessageHandler(logging.handlers.MemoryHandler):
+class CollapsingLogMessageHandler(logging.Handler):
 
     """Logging handler that aggregates repeated log messages into one.
 
     This collapses validation LogRecords based on the source code line that
-    emitted them and their formatted message, and flushes the resulting
-    records to another handler.
+    emitted them and their formatted message as they are emitted, and
+    flushes the resulting records to any number of target handlers, each
+    applying its own level, filters and formatter.
+
+    For each group of records, only the fields of the first record are kept,
+    plus at most `max_values` different values for each of the custom
+    fields (such as 'line_number' or 'cause') passed in the `extra` argument
+    of logging calls, except for the `uncapped_fields`, whose values are all
+    kept. Fields that occur with multiple different values are set in a
+    field named <field_name>_list, and the number of different values that
+    did not fit in <field_name>_num_omitted. Records collapsed before, such
+    as those replayed from a validation cache, are merged into their group
+    value by value.
     """
 
-    # TODO make it collapse messages on emit, instead of keeping it all in RAM
-    def flush(self):
+    # attributes set by the logging module rather than by validation calls
+    STANDARD_FIELDS = frozenset(logging.makeLogRecord({}).__dict__.keys() +
+                                ['message', 'asctime'])
 
-        """Aggregate LogRecords by message and send them to the target handler.
+    def __init__(self, targets=(), max_values=1000, capacity=100000,
+                 uncapped_fields=()):
+        """Initialize the handler to flush to the handlers in `targets`.
 
-        Fields that occur with multiple different values in LogRecords
-        emitted from the same line with the same message (and optional
-        'filename_' attribute) will be collected in a field named
-        <field_name>_list.
+        The groups are flushed when `capacity` different ones have been
+        collected, when a debug message is emitted and when the handler is
+        flushed or closed.
         """
+        super(CollapsingLogMessageHandler, self).__init__()
+        self.targets = list(targets)
+        self.max_values = max_values
+        self.uncapped_fields = frozenset(uncapped_fields)
+        self.capacity = capacity
+        self.groups = OrderedDict()
+
+    def addTarget(self, target):
+        """Add a handler to pass the aggregated records on to."""
+        self.targets.append(target)
+
+    def emit(self, record):
+        """Add the record to the group of records with the same message."""
+        identifying_tuple = (record.module,
+                             record.lineno,
+                             getattr(record, 'filename_', None),
+                             record.getMessage())
+        group = self.groups.get(identifying_tuple)
+        if group is None:
+            group = _CollapsedRecordGroup(record)
+            self.groups[identifying_tuple] = group
+        for field_name, value in record.__dict__.iteritems():
+            if field_name in self.STANDARD_FIELDS:
+                continue
+            if field_name.endswith('_list'):
+                base_field_name = field_name[:-len('_list')]
+                for list_value in value:
+                    group.add_value(base_field_name, list_value,
+                                    self._get_max_values(base_field_name))
+            elif field_name.endswith('_num_omitted'):
+                group.add_omitted(field_name[:-len('_num_omitted')], value)
+            else:
+                group.add_value(field_name, value,
+                                self._get_max_values(field_name))
+        if (record.levelno == logging.DEBUG or
+                len(self.groups) >= self.capacity):
+            self.flush()
+
+    def _get_max_values(self, field_name):
+        """Return the number of values to keep for a field, None for all."""
+        if field_name in self.uncapped_fields:
+            return None
+        return self.max_values
+
+    def flush(self):
+        """Send the aggregated records to the target handlers."""
+        self.acquire()
+        try:
+            for group in self.groups.values():
+                aggregated_field_dict = group.get_field_dict()
+                for target in self.targets:
+                    if aggregated_field_dict['levelno'] >= target.level:
+                        target.handle(
+                            logging.makeLogRecord(aggregated_field_dict))
+            self.groups = OrderedDict()
+        finally:
+            self.release()
+
+    def close(self):
+        """Flush the remaining groups and close the handler."""
+        self.flush()
+        super(CollapsingLogMessageHandler, self).close()
+
+
+class _CollapsedRecordGroup(object):
+
+    """Fields of a group of log records collapsed into one."""
+
+    def __init__(self, record):
+        """Start the group with the fields of its first record."""
+        self.field_dict = dict(record.__dict__)
+        # use the keys of OrderedDicts as ordered sets of the values found
+        self.field_values = OrderedDict()
+        # the different values left out of the field values, and the number
+        # of values left out of records that were collapsed before
+        self.omitted_values = {}
+        self.num_omitted_before = {}
+
+    def add_value(self, field_name, value, max_values):
+        """Count a value of a field, storing it if there is room.
+
+        If `max_values` is None, the value is always stored.
+        """
+        values = self.field_values.get(field_name)
+        if values is None:
+            values = self.field_values[field_name] = OrderedDict()
+        if value in values:
+            return
+        if max_values is None or len(values) < max_values:
+            values[value] = None
+        else:
+            self.omitted_values.setdefault(field_name, set()).add(value)
+
+    def add_omitted(self, field_name, num_omitted):
+        """Count values of a field left out of a record collapsed before."""
+        self.num_omitted_before[field_name] = (
+            self.num_omitted_before.get(field_name, 0) + num_omitted)
+
+    def get_num_omitted(self, field_name):
+        """Return the number of different values left out of a field."""
+        return (len(self.omitted_values.get(field_name, ())) +
+                self.num_omitted_before.get(field_name, 0))
+
+    def get_field_dict(self):
+        """Return the fields for a record representing the group."""
+        aggregated_field_dict = dict(self.field_dict)
+        for field_name, values in self.field_values.iteritems():
+            # if this field has the same value in all records
+            num_omitted = self.get_num_omitted(field_name)
+            if len(values) == 1 and not num_omitted:
+                aggregated_field_dict[field_name] = next(iter(values))
+                continue
+            # set a <field>_list field instead
+            aggregated_field_dict.pop(field_name, None)
+            aggregated_field_dict[field_name + '_list'] = list(values.keys())
+            if num_omitted:
+                aggregated_field_dict[field_name + '_num_omitted'] = \
+                    num_omitted
+        return aggregated_field_dict
+
+
+class StudySchema(object):
+
+    """What the meta files of a study may contain, and how they are imported.
+
+    Combines META_FIELD_MAP, META_TYPE_BY_ALT_TYPE_AND_DATATYPE,
+    IMPORTER_CLASSNAME_BY_META_TYPE, IMPORTER_REQUIRES_METADATA and the
+    allowed stable ids into lookups computed once, which return immutable
+    values. Use get_study_schema() for the instance shared by the process.
+    """
 
-        # group buffered LogRecords by their source code line and message
-        grouping_dict = OrderedDict()
-        for record in self.buffer:
-            identifying_tuple = (record.module,
-                                 record.lineno,
-                                 getattr(record, 'filename_', None),
-                                 record.getMessage())
-            if identifying_tuple not in grouping_dict:
-                grouping_dict[identifying_tuple] = []
-            grouping_dict[identifying_tuple].append(record)
-
-        aggregated_buffer = []
-        # for each list of same-message records
-        for record_list in grouping_dict.values():
-            # make a dict to collect the fields for the aggregate record
-            aggregated_field_dict = {}
-            # for each field found in (the first of) the records
-            for field_name in record_list[0].__dict__:
-                # collect the values found for this field across the records.
-                # Use the keys of an OrderedDict, as OrderedSet is for some
-                # reason not to be found in the Python standard library.
-                field_values = OrderedDict((record.__dict__[field_name], None)
-                                           for record in record_list)
-                # if this field has the same value in all records
-                if len(field_values) == 1:
-                    # use that value in the new dict
-                    aggregated_field_dict[field_name] = field_values.popitem()[0]
-                else:
-                    # set a <field>_list field instead
-                    aggregated_field_dict[field_name + '_list'] = \
-                        list(field_values.keys())
-
-            # add a new log record with these fields tot the output buffer
-            aggregated_buffer.append(
-                logging.makeLogRecord(aggregated_field_dict))
-
-        # replace the buffer with the aggregated one and flush
-        self.buffer = aggregated_buffer
-        super(CollapsingLogMessageHandler, self).flush()
-
-    def shouldFlush(self, record):
-        """Collapse and flush every time a debug message is emitted."""
-        return (record.levelno == logging.DEBUG or
-                super(CollapsingLogMessageHandler, self).shouldFlush(record))
+    def __init__(self, meta_field_map, meta_type_by_alt_type_and_datatype,
+                 importer_classname_by_meta_type, importer_requires_metadata,
+                 stable_ids_by_alt_type_and_datatype):
+        """Compute the lookups from the mappings given."""
+        self._fields = {}
+        self._mandatory_fields = {}
+        for meta_type, field_map in meta_field_map.iteritems():
+            self._fields[meta_type] = frozenset(field_map)
+            # in the order in which missing fields used to be reported
+            self._mandatory_fields[meta_type] = tuple(
+                field for field in field_map if field_map[field])
+        self._meta_types = dict(meta_type_by_alt_type_and_datatype)
+        self._importers = dict(importer_classname_by_meta_type)
+        self._importer_requires_metadata = dict(importer_requires_metadata)
+        self._stable_ids = dict(
+            (alt_type_and_datatype, tuple(stable_ids))
+            for alt_type_and_datatype, stable_ids
+            in stable_ids_by_alt_type_and_datatype.iteritems())
+
+    @classmethod
+    def load(cls):
+        """Build the schema from the globals of this module and the allowed
+        data types file."""
+        return cls(META_FIELD_MAP,
+                   META_TYPE_BY_ALT_TYPE_AND_DATATYPE,
+                   IMPORTER_CLASSNAME_BY_META_TYPE,
+                   IMPORTER_REQUIRES_METADATA,
+                   read_allowed_data_types(ALLOWED_DATA_TYPES_FILE))
+
+    def get_meta_type(self, genetic_alteration_type, datatype):
+        """Return the meta file type for a combination, or None."""
+        return self._meta_types.get((genetic_alteration_type, datatype))
+
+    def get_fields(self, meta_type):
+        """Return the frozenset of fields allowed in a meta file type."""
+        return self._fields[meta_type]
+
+    def get_mandatory_fields(self, meta_type):
+        """Return the tuple of fields required in a meta file type."""
+        return self._mandatory_fields[meta_type]
+
+    def get_allowed_stable_ids(self, genetic_alteration_type, datatype):
+        """Return the tuple of stable ids allowed for a combination, or None
+        if allowed_data_types.txt does not list the combination."""
+        return self._stable_ids.get((genetic_alteration_type, datatype))
+
+    def get_importer(self, meta_type):
+        """Return the name of the Java class importing a meta file type."""
+        return self._importers[meta_type]
+
+    def importer_requires_metadata(self, importer):
+        """Tell whether a Java importer class is passed the meta file."""
+        return self._importer_requires_metadata[importer]
+
+
+class PlannedFile(object):
+
+    """A meta file in a StudyPlan, along with its data file if any."""
+
+    def __init__(self, meta_filename, meta_file_type, meta_dict,
+                 meta_hash=None, data_size=None, data_hash=None,
+                 num_records=None):
+        """Describe a meta file by its name relative to the study directory,
+        its type and the fields read from it."""
+        self.meta_filename = meta_filename
+        self.meta_file_type = meta_file_type
+        self.meta_dict = meta_dict
+        self.meta_hash = meta_hash
+        # size and hash of the data file, and the number of data lines in it
+        self.data_size = data_size
+        self.data_hash = data_hash
+        self.num_records = num_records
+
+    @property
+    def data_filename(self):
+        """Name of the data file relative to the study directory, or None."""
+        return self.meta_dict.get('data_filename')
+
+    def to_json_dict(self):
+        """Return the fields of this file to save a plan with."""
+        return {'meta_filename': self.meta_filename,
+                'meta_file_type': self.meta_file_type,
+                'meta_dict': self.meta_dict,
+                'meta_hash': self.meta_hash,
+                'data_size': self.data_size,
+                'data_hash': self.data_hash,
+                'num_records': self.num_records}
+
+
+class StudyPlan(object):
+
+    """The files of a study and what is known about them, to import it by.
+
+    The validator makes a plan of the study it validated: the meta files as
+    parsed, the size and hash of each file, the number of data lines in
+    each data file and the sample ids of the study. The importer can run
+    from the plan without reading the meta files again, and a plan saved to
+    disk allows importing the study later on, if find_changed_files() finds
+    that the files are still the ones that were validated.
+    """
+
+    # increase when the format of saved plans changes
+    FORMAT_VERSION = 1
+
+    def __init__(self, study_dir):
+        """Start an empty plan for the study in `study_dir`."""
+        self.study_dir = os.path.abspath(study_dir)
+        self.study_id = None
+        # frozenset of the sample ids of the study, if known
+        self.sample_ids = None
+        # PlannedFile objects in the order in which the meta files were read
+        self.files = []
+
+    def add_meta_file(self, meta_filename, meta_file_type, meta_dict):
+        """Add a parsed meta file of the study to the plan."""
+        planned_file = PlannedFile(
+            os.path.relpath(meta_filename, self.study_dir),
+            meta_file_type, meta_dict)
+        self.files.append(planned_file)
+        # the first file naming the study determines its id
+        if self.study_id is None and 'cancer_study_identifier' in meta_dict:
+            self.study_id = meta_dict['cancer_study_identifier']
+        return planned_file
+
+    def get_path(self, filename):
+        """Return the path of a file named relative to the study directory."""
+        return os.path.join(self.study_dir, filename)
+
+    def get_files(self, meta_file_type):
+        """Return the list of planned files of a meta file type."""
+        return [planned_file for planned_file in self.files
+                if planned_file.meta_file_type == meta_file_type]
+
+    def set_num_records(self, data_path, num_records):
+        """Set the number of data lines found in a data file."""
+        for planned_file in self.files:
+            if (planned_file.data_filename is not None and
+                    self.get_path(planned_file.data_filename) == data_path):
+                planned_file.num_records = num_records
+
+    def record_file_contents(self):
+        """Store the hashes of the files, and the sizes of the data files."""
+        for planned_file in self.files:
+            planned_file.meta_hash = hash_file(
+                self.get_path(planned_file.meta_filename))
+            data_path = self._get_data_path(planned_file)
+            if data_path is not None:
+                planned_file.data_size = os.path.getsize(data_path)
+                planned_file.data_hash = hash_file(data_path)
+
+    def find_changed_files(self):
+        """Return the list of paths of files changed since they were planned."""
+        changed_paths = []
+        for planned_file in self.files:
+            meta_path = self.get_path(planned_file.meta_filename)
+            if (not os.path.isfile(meta_path) or
+                    hash_file(meta_path) != planned_file.meta_hash):
+                changed_paths.append(meta_path)
+            data_path = self._get_data_path(planned_file)
+            if planned_file.data_hash is None:
+                continue
+            # compare the sizes first, to skip hashing files that differ
+            if (data_path is None or
+                    os.path.getsize(data_path) != planned_file.data_size or
+                    hash_file(data_path) != planned_file.data_hash):
+                changed_paths.append(
+                    self.get_path(planned_file.data_filename))
+        return changed_paths
+
+    def _get_data_path(self, planned_file):
+        """Return the path of the data file of a planned file, if it exists."""
+        if planned_file.data_filename is None:
+            return None
+        data_path = self.get_path(planned_file.data_filename)
+        if not os.path.isfile(data_path):
+            return None
+        return data_path
+
+    def save(self, filename):
+        """Write the plan to a JSON file."""
+        if self.sample_ids is None:
+            sample_ids = None
+        else:
+            sample_ids = sorted(self.sample_ids)
+        plan_dict = {'format_version': self.FORMAT_VERSION,
+                     'study_dir': self.study_dir,
+                     'study_id': self.study_id,
+                     'sample_ids': sample_ids,
+                     'files': [planned_file.to_json_dict()
+                               for planned_file in self.files]}
+        # write to a temporary file first, so as not to leave a partial one
+        temp_filename = '{0}.{1}.tmp'.format(filename, os.getpid())
+        with open(temp_filename, 'w') as plan_file:
+            json.dump(plan_dict, plan_file, indent=1, sort_keys=True)
+        os.rename(temp_filename, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """Read a plan written by save().
+
+        :raises: ValueError if the file is not a plan in the current format
+        """
+        with open(filename, 'rU') as plan_file:
+            plan_dict = json.load(plan_file)
+        if (not isinstance(plan_dict, dict) or
+                plan_dict.get('format_version') != cls.FORMAT_VERSION):
+            raise ValueError(
+                'Not a study plan of format version {0}: {1}'.format(
+                    cls.FORMAT_VERSION, filename))
+        study_plan = cls(plan_dict['study_dir'])
+        study_plan.study_id = plan_dict['study_id']
+        if plan_dict['sample_ids'] is not None:
+            study_plan.sample_ids = frozenset(plan_dict['sample_ids'])
+        study_plan.files = [PlannedFile(**file_dict)
+                            for file_dict in plan_dict['files']]
+        return study_plan
 
 
 # ------------------------------------------------------------------------------
 # sub-routines
 
+def hash_file(filename):
+    """Return the SHA-1 hex digest of the contents of a file.
+
+    The digest is kept for as long as the size and modification time of the
+    file stay the same, so that files are read once by the validation cache
+    and the study plan.
+    """
+    file_stat = os.stat(filename)
+    memo_key = os.path.abspath(filename)
+    file_version = (file_stat.st_size, file_stat.st_mtime)
+    memo_entry = _file_hash_memo.get(memo_key)
+    if memo_entry is not None and memo_entry[0] == file_version:
+        return memo_entry[1]
+    file_hash = hashlib.sha1()
+    with open(filename, 'rb') as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(HASH_CHUNK_SIZE), ''):
+            file_hash.update(chunk)
+    _file_hash_memo[memo_key] = (file_version, file_hash.hexdigest())
+    return file_hash.hexdigest()
+
+
+def get_study_schema():
+    """Return the StudySchema of this process, loading it on first use."""
+    global _study_schema
+    if _study_schema is None:
+        _study_schema = StudySchema.load()
+    return _study_schema
+
+
+def read_allowed_data_types(filename):
+    """Read the stable ids allowed for each genetic_alteration_type and
+    datatype from a file like allowed_data_types.txt.
+
+    Return a dict mapping (genetic_alteration_type, datatype) tuples to
+    lists of stable ids.
+    """
+    alt_type_datatype_and_stable_id = {}
+    data_line_nr = 0
+    with open(filename) as allowed_data_types_file:
+        for line in allowed_data_types_file:
+            if line.startswith("#"):
+                continue
+            data_line_nr += 1
+            # skip header, so if line is not header then process as tab separated:
+            if (data_line_nr > 1):
+                line_cols = csv.reader([line], delimiter='\t').next()
+                genetic_alteration_type = line_cols[0]
+                data_type = line_cols[1]
+                # add to map:
+                alt_type_datatype_and_stable_id.setdefault(
+                    (genetic_alteration_type, data_type), []).append(
+                        line_cols[2])
+    return alt_type_datatype_and_stable_id
+
+
 def get_meta_file_type(metaDictionary, logger, filename):
     """
      Returns one of the metatypes found in MetaFileTypes
     """
-    # GENETIC_ALTERATION_TYPE    DATATYPE    meta
-    alt_type_datatype_to_meta = {
-        # cancer type
-        ("CANCER_TYPE", "CANCER_TYPE"): MetaFileTypes.CANCER_TYPE,
-        # clinical and timeline
-        ("CLINICAL", "PATIENT_ATTRIBUTES"): MetaFileTypes.PATIENT_ATTRIBUTES,
-        ("CLINICAL", "SAMPLE_ATTRIBUTES"): MetaFileTypes.SAMPLE_ATTRIBUTES,
-        ("CLINICAL", "TIMELINE"): MetaFileTypes.TIMELINE,
-        # rppa
-        ("PROTEIN_LEVEL", "LOG2-VALUE"): MetaFileTypes.RPPA,
-        ("PROTEIN_LEVEL", "Z-SCORE"): MetaFileTypes.RPPA,
-        # cna
-        ("COPY_NUMBER_ALTERATION", "DISCRETE"): MetaFileTypes.CNA,
-        ("COPY_NUMBER_ALTERATION", "CONTINUOUS"): MetaFileTypes.CNA_CONTINUOUS, 
-        ("COPY_NUMBER_ALTERATION", "LOG2-VALUE"): MetaFileTypes.CNA_LOG2,
-        ("COPY_NUMBER_ALTERATION", "SEG"): MetaFileTypes.SEG,
-        # expression
-        ("MRNA_EXPRESSION", "CONTINUOUS"): MetaFileTypes.EXPRESSION,
-        ("MRNA_EXPRESSION", "Z-SCORE"): MetaFileTypes.EXPRESSION,
-        ("MRNA_EXPRESSION", "DISCRETE"): MetaFileTypes.EXPRESSION,
-        # mutations
-        ("MUTATION_EXTENDED", "MAF"): MetaFileTypes.MUTATION,
-        # others
-        ("METHYLATION", "CONTINUOUS"): MetaFileTypes.METHYLATION,
-        ("FUSION", "FUSION"): MetaFileTypes.FUSION,
-        # cross-sample molecular statistics (for gene selection)
-        ("GISTIC_GENES_AMP", "Q-VALUE"): MetaFileTypes.GISTIC_GENES,
-        ("GISTIC_GENES_DEL", "Q-VALUE"): MetaFileTypes.GISTIC_GENES,
-        ("MUTSIG", "Q-VALUE"): MetaFileTypes.MUTATION_SIGNIFICANCE
-    }
     result = None
     if 'genetic_alteration_type' in metaDictionary and 'datatype' in metaDictionary:
         genetic_alteration_type = metaDictionary['genetic_alteration_type']
         data_type = metaDictionary['datatype']
-        if (genetic_alteration_type, data_type) in alt_type_datatype_to_meta:
-            result = alt_type_datatype_to_meta[(genetic_alteration_type, data_type)]
-        else:
+        result = get_study_schema().get_meta_type(genetic_alteration_type,
+                                                  data_type)
+        if result is None:
             logger.error(
                 'Could not determine the file type. Please check your meta files for correct configuration.',
                 extra={'filename_': filename,
@@ -489,41 +913,24 @@ def validate_types_and_id(metaDictionary, logger, filename):
     result = True
     # this validation only applies to items that have genetic_alteration_type and datatype and stable_id
     if 'genetic_alteration_type' in metaDictionary and 'datatype' in metaDictionary and 'stable_id' in metaDictionary:
-        alt_type_datatype_and_stable_id = {}
-        script_dir = os.path.dirname(__file__)
-        allowed_data_types_file_name = os.path.join(script_dir, "allowed_data_types.txt")
-        data_line_nr = 0
-        # build up map alt_type_datatype_and_stable_id:
-        with open(allowed_data_types_file_name) as allowed_data_types_file:
-            for line in allowed_data_types_file:
-                if line.startswith("#"):
-                    continue
-                data_line_nr += 1
-                # skip header, so if line is not header then process as tab separated:
-                if (data_line_nr > 1):
-                    line_cols = csv.reader([line], delimiter='\t').next()
-                    genetic_alteration_type = line_cols[0]
-                    data_type = line_cols[1]
-                    # add to map:
-                    if (genetic_alteration_type, data_type) not in alt_type_datatype_and_stable_id:
-                        alt_type_datatype_and_stable_id[(genetic_alteration_type, data_type)] = []
-                    alt_type_datatype_and_stable_id[(genetic_alteration_type, data_type)].append(line_cols[2])
         # init:
         stable_id = metaDictionary['stable_id']
         genetic_alteration_type = metaDictionary['genetic_alteration_type']
         data_type = metaDictionary['datatype']
+        allowed_stable_ids = get_study_schema().get_allowed_stable_ids(
+            genetic_alteration_type, data_type)
         # validate the genetic_alteration_type/data_type combination:
-        if (genetic_alteration_type, data_type) not in alt_type_datatype_and_stable_id:
+        if allowed_stable_ids is None:
             # unexpected as this is already validated in get_meta_file_type
             raise RuntimeError('Unexpected error: genetic_alteration_type and data_type combination not found in allowed_data_types.txt.',
                                genetic_alteration_type, data_type)
         # validate stable_id:
-        elif stable_id not in alt_type_datatype_and_stable_id[(genetic_alteration_type, data_type)]:
+        elif stable_id not in allowed_stable_ids:
             logger.error("Invalid stable id for genetic_alteration_type '%s', "
                          "data_type '%s'; expected one of [%s]",
                         genetic_alteration_type,
                         data_type,
-                        ', '.join(alt_type_datatype_and_stable_id[(genetic_alteration_type, data_type)]),
+                        ', '.join(allowed_stable_ids),
                         extra={'filename_': filename,
                                'cause': stable_id}
                         )
@@ -582,10 +989,10 @@ def parse_metadata_file(filename,
         if meta_file_type is None:
             return metaDictionary, meta_file_type
 
+    schema = get_study_schema()
     missing_fields = []
-    for field in META_FIELD_MAP[meta_file_type]:
-        mandatory = META_FIELD_MAP[meta_file_type][field]
-        if field not in metaDictionary and mandatory:
+    for field in schema.get_mandatory_fields(meta_file_type):
+        if field not in metaDictionary:
             logger.error("Missing field '%s' in %s file",
                          field,
                          {True: 'case list', False: 'meta'}[case_list],
@@ -598,8 +1005,8 @@ def parse_metadata_file(filename,
         return metaDictionary, meta_file_type
 
     # validate genetic_alteration_type, datatype, stable_id
-    stable_id_mandatory = META_FIELD_MAP[meta_file_type].get('stable_id',
-                                                             False)
+    stable_id_mandatory = 'stable_id' in schema.get_mandatory_fields(
+        meta_file_type)
     if stable_id_mandatory:
         valid_types_and_id = validate_types_and_id(metaDictionary, logger, filename)
         if not valid_types_and_id:
@@ -607,8 +1014,9 @@ def parse_metadata_file(filename,
             meta_file_type = None
             return metaDictionary, meta_file_type
 
+    allowed_fields = schema.get_fields(meta_file_type)
     for field in metaDictionary:
-        if field not in META_FIELD_MAP[meta_file_type]:
+        if field not in allowed_fields:
             logger.warning(
                 'Unrecognized field in %s file',
                 {True: 'case list', False: 'meta'}[case_list],
@@ -654,25 +1062,438 @@ def parse_metadata_file(filename,
     return metaDictionary, meta_file_type
 
 
-def run_java(*args):
+def get_java_tool(tool_name):
+    """Return the command of a JDK tool, in JAVA_HOME if set."""
     java_home = os.environ.get('JAVA_HOME', '')
     if java_home:
-        java_command = os.path.join(java_home, 'bin', 'java')
-    else:
-        java_command = 'java'
-    process = Popen([java_command] + list(args), stdout=PIPE, stderr=STDOUT,
-                    universal_newlines=True)
-    ret = []
-    while process.poll() is None:
-        line = process.stdout.readline()
-        if line != '' and line.endswith('\n'):
-            print >> OUTPUT_FILE, line.strip()
-            ret.append(line[:-1])
-    ret.append(process.returncode)
+        return os.path.join(java_home, 'bin', tool_name)
+    return tool_name
+
+
+def check_java_returncode(returncode, step_output=None):
+    """Raise a RuntimeError if a Java step exited with an error status.
+
+    The last lines of the output of the step are added to the message, if
+    given as a StepOutput.
+    """
     # if cmd line parameters error:
-    if process.returncode == 64 or process.returncode == 2:
-        raise RuntimeError('Aborting. Step failed due to wrong parameters passed to subprocess.')
+    if returncode == 64 or returncode == 2:
+        message = 'Aborting. Step failed due to wrong parameters passed to subprocess.'
     # any other error:
-    elif process.returncode != 0:
-        raise RuntimeError('Aborting due to error while executing step.{0}'.format(process.returncode))
-    return ret
+    elif returncode != 0:
+        message = 'Aborting due to error while executing step.{0}'.format(returncode)
+    else:
+        return
+    if step_output is not None:
+        message += step_output.describe_tail()
+    raise RuntimeError(message)
+
+
+def run_java(*args):
+    """Run a Java class, printing its output, and return the last lines of
+    its output followed by the exit status.
+
+    If JVM workers were started for the JVM arguments the call begins with,
+    the class is run in one of them rather than in a new JVM.
+    """
+    worker_pool = _java_worker_pool
+    if worker_pool is not None and worker_pool.accepts(args):
+        return worker_pool.run(*args)
+    step_output = StepOutput(get_java_class_name(args), args)
+    try:
+        process = Popen([get_java_tool('java')] + list(args), stdout=PIPE,
+                        stderr=STDOUT, universal_newlines=True)
+        pump = OutputPump(process.stdout, step_output)
+        pump.start()
+        # the pump reads until the end of the output, which may come after
+        # the process has exited
+        process.wait()
+        pump.join()
+    finally:
+        step_output.close()
+    if pump.error is not None:
+        raise pump.error
+    check_java_returncode(process.returncode, step_output)
+    return list(step_output.tail) + [process.returncode]
+
+
+def get_java_class_name(args):
+    """Return the name of the class a java command line runs."""
+    args = iter(args)
+    for arg in args:
+        if arg in ('-cp', '-classpath'):
+            next(args, None)
+        elif not arg.startswith('-'):
+            return arg
+    return None
+
+
+def get_java_step_label(class_name, args):
+    """Return a short name of a Java step: its class and data file, if any."""
+    label = (class_name or 'java').rsplit('.', 1)[-1]
+    args = list(args)
+    if '--data' in args[:-1]:
+        label += ' ' + os.path.basename(args[args.index('--data') + 1])
+    return label
+
+
+# progress of a Java step, as parsed from a line of its output; `step` is
+# the label of the step, which tells apart steps running the same class
+ProgressEvent = namedtuple('ProgressEvent',
+                           ['class_name', 'step', 'kind', 'value'])
+
+
+def parse_progress_line(class_name, line, step=None):
+    """Return a ProgressEvent for a progress line of a loader, or None."""
+    for kind, pattern in JAVA_PROGRESS_PATTERNS:
+        match = pattern.match(line)
+        if match is not None:
+            return ProgressEvent(class_name, step, kind,
+                                 float(match.group(1).replace(',', '')))
+    return None
+
+
+class StepOutput(object):
+
+    """Destination of the output lines of a Java step.
+
+    Each line is printed to OUTPUT_FILE and written to the log file of the
+    step, if configure_step_output() was given a log directory. If it was
+    given a progress handler, the progress lines of the loaders are passed
+    to it as ProgressEvents instead of being printed. Only the last
+    OUTPUT_TAIL_LINES lines are kept in memory, for error messages, so that
+    memory use does not grow with the length of the output.
+    """
+
+    def __init__(self, class_name, args):
+        self.class_name = class_name
+        self.label = get_java_step_label(class_name, args)
+        self.tail = deque(maxlen=OUTPUT_TAIL_LINES)
+        self.log_filename = None
+        self._log_file = None
+        if _step_log_dir is not None:
+            self._open_log_file(args)
+
+    def _open_log_file(self, args):
+        """Open the log file of the step, numbered in the order of the steps."""
+        with _step_log_lock:
+            step_number = next(_step_log_counter)
+        simple_name = (self.class_name or 'java').rsplit('.', 1)[-1]
+        self.log_filename = os.path.join(
+            _step_log_dir, '{0:03d}_{1}.log'.format(step_number, simple_name))
+        if _compress_step_logs:
+            self.log_filename += '.gz'
+            self._log_file = gzip.open(self.log_filename, 'wb')
+        else:
+            self._log_file = open(self.log_filename, 'w')
+        self._log_file.write('$ java {0}\n'.format(' '.join(args)))
+
+    def add_line(self, line):
+        """Handle a line of output, with or without its line break."""
+        line = line.rstrip('\n')
+        progress_handler = _progress_handler
+        event = None
+        if progress_handler is not None:
+            event = parse_progress_line(self.class_name, line, self.label)
+        if not (progress_handler is not None and
+                (event is not None or JAVA_PROGRESS_DOTS_PATTERN.match(line))):
+            # in a single write, as steps may run in parallel threads
+            OUTPUT_FILE.write(line.strip() + '\n')
+        if self._log_file is not None:
+            self._log_file.write(line + '\n')
+        self.tail.append(line)
+        if event is not None:
+            progress_handler(event)
+
+    def describe_tail(self):
+        """Return the last lines of output and the log file, for messages."""
+        description = ''
+        if self.tail:
+            description += '\nLast lines of output:\n' + '\n'.join(self.tail)
+        if self.log_filename is not None:
+            description += '\nFull output in {0}'.format(self.log_filename)
+        return description
+
+    def close(self):
+        """Close the log file of the step, if any."""
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+
+class OutputPump(threading.Thread):
+
+    """Thread passing the lines of a stream to a StepOutput until it ends.
+
+    Reading in a thread lets the caller block on the process instead of
+    polling it. If handling a line fails, for instance because the disk is
+    full, the rest of the stream is still read so that the process does not
+    block on a full pipe, and the error is kept in `error`.
+    """
+
+    def __init__(self, stream, step_output):
+        super(OutputPump, self).__init__()
+        self.daemon = True
+        self.stream = stream
+        self.step_output = step_output
+        self.error = None
+
+    def run(self):
+        for line in iter(self.stream.readline, ''):
+            if self.error is not None:
+                continue
+            try:
+                self.step_output.add_line(line)
+            except Exception as e:
+                self.error = e
+
+
+class JavaWorker(object):
+
+    """A long-lived process running the main methods of Java classes.
+
+    The process reads commands from its standard input: a line with the
+    number of arguments, a line with the class name and a line per argument.
+    It writes the output of the class, then a line starting with
+    JAVA_WORKER_DONE_MARKER followed by the exit status; the marker is also
+    recognised at the end of a line, after output lacking a line break. An
+    empty line tells it to stop. ImportWorker.java implements this in a JVM,
+    but any program speaking the same protocol can stand in for it.
+    """
+
+    def __init__(self, command):
+        self.process = Popen(command, stdin=PIPE, stdout=PIPE, stderr=STDOUT,
+                             universal_newlines=True)
+
+    def run(self, class_name, *args):
+        """Run a class in the worker, like run_java() in a new JVM."""
+        command = [class_name] + list(args)
+        if any('\n' in arg for arg in command):
+            raise ValueError('Cannot pass line breaks to a JVM worker')
+        try:
+            self.process.stdin.write(
+                '{0}\n{1}\n'.format(len(args), '\n'.join(command)))
+            self.process.stdin.flush()
+        except IOError:
+            # the worker has stopped; report why below
+            pass
+        step_output = StepOutput(class_name, command)
+        try:
+            while True:
+                line = self.process.stdout.readline()
+                if line == '':
+                    self.process.wait()
+                    raise RuntimeError(
+                        'Aborting. JVM worker stopped with exit status {0} '
+                        'while executing step.{1}'.format(
+                            self.process.returncode,
+                            step_output.describe_tail()))
+                match = JAVA_WORKER_DONE_RE.search(line)
+                if match is not None:
+                    if match.start() > 0:
+                        step_output.add_line(line[:match.start()])
+                    returncode = int(match.group(1))
+                    break
+                step_output.add_line(line)
+        finally:
+            step_output.close()
+        check_java_returncode(returncode, step_output)
+        return list(step_output.tail) + [returncode]
+
+    def close(self):
+        """Tell the worker to stop, and wait for it to do so."""
+        try:
+            self.process.stdin.write('\n')
+            self.process.stdin.close()
+        except IOError:
+            pass
+        # discard anything left, such as output after a failed step
+        self.process.stdout.read()
+        self.process.wait()
+
+
+class JavaWorkerPool(object):
+
+    """JVM workers for run_java() calls with given JVM arguments.
+
+    Up to `max_workers` workers are started as needed, so that as many steps
+    can run at the same time. A worker is stopped after a failed step, as
+    the failure may have left its JVM in an unknown state.
+    """
+
+    def __init__(self, jvm_args, worker_command, max_workers=1):
+        self.jvm_args = tuple(jvm_args)
+        self.worker_command = list(worker_command)
+        self.max_workers = max_workers
+        self._idle_workers = []
+        self._num_workers = 0
+        self._condition = threading.Condition()
+
+    def accepts(self, args):
+        """Return whether a run_java() call with `args` can use the pool."""
+        return (len(args) > len(self.jvm_args) and
+                tuple(args[:len(self.jvm_args)]) == self.jvm_args)
+
+    def run(self, *args):
+        """Run a class in an idle worker, given the run_java() arguments."""
+        worker = self._acquire()
+        try:
+            ret = worker.run(*args[len(self.jvm_args):])
+        except:
+            worker.close()
+            with self._condition:
+                self._num_workers -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._idle_workers.append(worker)
+            self._condition.notify()
+        return ret
+
+    def _acquire(self):
+        """Take an idle worker, starting one if there are too few."""
+        with self._condition:
+            while (not self._idle_workers and
+                   self._num_workers >= self.max_workers):
+                self._condition.wait()
+            if self._idle_workers:
+                return self._idle_workers.pop()
+            self._num_workers += 1
+        try:
+            return JavaWorker(self.worker_command)
+        except:
+            with self._condition:
+                self._num_workers -= 1
+                self._condition.notify()
+            raise
+
+    def close(self):
+        """Stop the idle workers."""
+        with self._condition:
+            workers, self._idle_workers = self._idle_workers, []
+            self._num_workers -= len(workers)
+        for worker in workers:
+            worker.close()
+
+
+# where the output of Java steps goes besides OUTPUT_FILE, as set by
+# configure_step_output()
+_step_log_dir = None
+_compress_step_logs = False
+_progress_handler = None
+_step_log_counter = itertools.count(1)
+_step_log_lock = threading.Lock()
+
+
+def configure_step_output(log_dir=None, compress=False, progress_handler=None):
+    """Set where the output of the Java steps run from now on goes.
+
+    :param: log_dir (String) - directory in which to write the output of each
+            step to its own log file, numbered in the order the steps start
+    :param: compress (Boolean) - whether to gzip the log files
+    :param: progress_handler - function to call with a ProgressEvent for each
+            progress line printed by a loader
+
+    """
+    global _step_log_dir, _compress_step_logs, _progress_handler
+    if log_dir is not None and not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+    _step_log_dir = log_dir
+    _compress_step_logs = compress
+    _progress_handler = progress_handler
+
+
+def is_reporting_progress():
+    """Return whether configure_step_output() was given a progress handler."""
+    return _progress_handler is not None
+
+
+# pool of JVM workers that run_java() sends classes to run to, if any
+_java_worker_pool = None
+# directory of the compiled launcher class of the JVM workers
+_java_worker_class_dir = None
+
+
+def start_java_workers(jvm_args, max_workers=1, worker_command=None):
+    """Run the classes that run_java() gets with `jvm_args` in long-lived JVMs.
+
+    This saves starting a JVM, and connecting it to the database, for every
+    step of an import. Steps then share the static state of the classes they
+    use, so only classes that can be run one after the other are suitable.
+
+    :param: jvm_args (list) - JVM arguments the run_java() calls to route to
+            the workers begin with, mandatory
+    :param: max_workers (Integer) - number of workers to start at most, for
+            steps run at the same time
+    :param: worker_command (list) - command starting a worker; by default,
+            ImportWorker.java is compiled and run with `jvm_args`, unless
+            the Java version no longer lets it trap System.exit(), in which
+            case run_java() keeps starting a JVM per class
+    :raises: CalledProcessError if the launcher class could not be compiled
+
+    """
+    global _java_worker_pool, _java_worker_class_dir
+    stop_java_workers()
+    if worker_command is None:
+        java_version = get_java_version()
+        if (java_version is not None and
+                java_version >= JAVA_WORKER_NO_SECURITY_MANAGER_VERSION):
+            print >> ERROR_FILE, (
+                'Java {0} cannot run import steps in long-lived JVMs, as '
+                'they cannot trap System.exit(); starting a JVM per step '
+                'instead'.format(java_version))
+            return
+        security_manager_args = []
+        if (java_version is not None and
+                java_version >= JAVA_WORKER_SECURITY_MANAGER_FLAG_VERSION):
+            security_manager_args = ['-Djava.security.manager=allow']
+        _java_worker_class_dir = tempfile.mkdtemp(prefix='cbio_jvm_worker_')
+        check_call([get_java_tool('javac'), '-d', _java_worker_class_dir,
+                    JAVA_WORKER_SOURCE])
+        worker_command = ([get_java_tool('java')] + security_manager_args +
+                          _add_to_classpath(jvm_args, _java_worker_class_dir) +
+                          [JAVA_WORKER_CLASS])
+    _java_worker_pool = JavaWorkerPool(jvm_args, worker_command, max_workers)
+
+
+def get_java_version():
+    """Return the major version of the java command, such as 8 or 21.
+
+    Return None if `java -version` does not tell, so that callers can go on
+    as if for an older version.
+    """
+    try:
+        process = Popen([get_java_tool('java'), '-version'], stdout=PIPE,
+                        stderr=STDOUT, universal_newlines=True)
+    except OSError:
+        return None
+    output = process.communicate()[0]
+    # such as 'java version "1.8.0_292"' or 'openjdk version "21.0.2"'
+    match = re.search(r'version "(\d+)(?:\.(\d+))?', output)
+    if match is None:
+        return None
+    major_version = int(match.group(1))
+    if major_version == 1 and match.group(2) is not None:
+        major_version = int(match.group(2))
+    return major_version
+
+
+def stop_java_workers():
+    """Stop the workers started by start_java_workers(), if any."""
+    global _java_worker_pool, _java_worker_class_dir
+    if _java_worker_pool is not None:
+        _java_worker_pool.close()
+        _java_worker_pool = None
+    if _java_worker_class_dir is not None:
+        shutil.rmtree(_java_worker_class_dir, ignore_errors=True)
+        _java_worker_class_dir = None
+
+
+def _add_to_classpath(jvm_args, class_dir):
+    """Return a copy of JVM arguments with a directory added to the classpath."""
+    jvm_args = list(jvm_args)
+    for i, arg in enumerate(jvm_args[:-1]):
+        if arg in ('-cp', '-classpath'):
+            jvm_args[i + 1] += os.pathsep + class_dir
+            return jvm_args
+    return jvm_args + ['-cp', class_dir]
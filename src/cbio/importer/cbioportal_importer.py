@@ -1,22 +1,28 @@
+import Queue
 import argparse
+import hashlib
+import json
 import logging
 import os
 import re
 import sys
+import threading
+import time
+import traceback
 
 import cbioportal_common
 from cbioportal_common import ADD_CASE_LIST_CLASS
 from cbioportal_common import ERROR_FILE
-from cbioportal_common import IMPORTER_CLASSNAME_BY_META_TYPE
-from cbioportal_common import IMPORTER_REQUIRES_METADATA
 from cbioportal_common import IMPORT_CANCER_TYPE_CLASS
 from cbioportal_common import IMPORT_CASE_LIST_CLASS
 from cbioportal_common import IMPORT_STUDY_CLASS
 from cbioportal_common import MetaFileTypes
 from cbioportal_common import OUTPUT_FILE
 from cbioportal_common import REMOVE_STUDY_CLASS
+from cbioportal_common import StudyPlan
 from cbioportal_common import UPDATE_STUDY_STATUS_CLASS
 from cbioportal_common import VERSION_UTIL_CLASS
+from cbioportal_common import hash_file
 from cbioportal_common import run_java
 
 # ------------------------------------------------------------------------------
@@ -34,6 +40,300 @@ IMPORT_CASE_LIST = "import-case-list"
 COMMANDS = [IMPORT_CANCER_TYPE, IMPORT_STUDY, REMOVE_STUDY, IMPORT_STUDY_DATA, IMPORT_CASE_LIST]
 PORTAL_HOME = "PORTAL_HOME"
 
+# name of the file in the study directory recording the completed steps
+IMPORT_JOURNAL_FILENAME = '.import_journal'
+# name of the file in the study directory describing the last import that
+# completed, to compare the study with in a delta import
+IMPORT_MANIFEST_FILENAME = '.import_manifest'
+
+# meta file types whose data is loaded into a genetic profile of its own,
+# named after the stable_id of the meta file
+GENETIC_PROFILE_META_FILE_TYPES = (
+    MetaFileTypes.CNA,
+    MetaFileTypes.CNA_LOG2,
+    MetaFileTypes.CNA_CONTINUOUS,
+    MetaFileTypes.EXPRESSION,
+    MetaFileTypes.MUTATION,
+    MetaFileTypes.METHYLATION,
+    MetaFileTypes.FUSION,
+    MetaFileTypes.RPPA)
+
+# meta file types whose loaders number new mutation events from the largest
+# id in the database, DaoMutation.getLargestMutationEventId(), so that two of
+# them running at the same time could insert duplicate ids; their files are
+# loaded one at a time, in this order. The loaders of all other data files
+# are assumed to be safe to run at the same time as each other.
+SERIAL_META_FILE_TYPES = (
+    MetaFileTypes.MUTATION,
+    MetaFileTypes.FUSION)
+
+# how many percent a loader has to progress before its progress is reported
+PROGRESS_REPORT_PERCENT = 10
+
+# number of seconds to wait for a step to finish before checking again, so
+# that the main thread can be interrupted while waiting for import steps
+STEP_POLL_INTERVAL = 1
+
+# ------------------------------------------------------------------------------
+# class definitions
+
+class ImportStep(object):
+
+    """A step of importing a study, run once the steps it depends on succeed.
+
+    The step calls `function` with the arguments `args`. Its status is one
+    of the STATUS_* values, and once it has run, `start_time` and `end_time`
+    tell when, and `error` holds the exception it raised, if any. Steps with
+    `inputs` are recorded in the ImportJournal under their name, and in the
+    ImportManifest with their `target`.
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    # not run because a step it depends on failed
+    STATUS_SKIPPED = 'skipped'
+
+    def __init__(self, name, function, args, depends_on=(), inputs=None,
+                 target=None):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.depends_on = list(depends_on)
+        # hashes of the files the step reads by path, for steps to record
+        # in the ImportJournal once completed
+        self.inputs = inputs
+        # what the step loads, if it can be loaded again on its own, as a
+        # dict with one of the keys 'genetic_profile', 'patient_attributes',
+        # 'case_list' or 'cancer_types'
+        self.target = target
+        self.status = self.STATUS_PENDING
+        self.start_time = None
+        self.end_time = None
+        self.error = None
+
+    def run(self):
+        """Call the function of the step, recording when and how it ended."""
+        self.start_time = time.time()
+        try:
+            self.function(*self.args)
+        except Exception as e:
+            self.error = e
+            self.status = self.STATUS_FAILED
+            print >> ERROR_FILE, 'Import step failed: {0}\n{1}'.format(
+                self.name, traceback.format_exc())
+        else:
+            self.status = self.STATUS_SUCCEEDED
+        finally:
+            self.end_time = time.time()
+
+    def get_duration(self):
+        """Return the number of seconds the step ran, or 0 if it did not."""
+        if self.start_time is None or self.end_time is None:
+            return 0
+        return self.end_time - self.start_time
+
+
+class ImportJournal(object):
+
+    """Record of the steps an import has started and completed, to resume it.
+
+    The journal is a file in the study directory, with a header line naming
+    the study and the scripts jar, then a line for each step when it starts,
+    and a line for each completed step with the hashes of the files the step
+    read. Lines are written as soon as steps start or complete, so the
+    journal survives the import being interrupted; a last line cut off by
+    the interruption is ignored when reading it.
+    """
+
+    FORMAT_VERSION = 2
+
+    def __init__(self, path, study_id, jar_hash):
+        self.path = path
+        self.study_id = study_id
+        self.jar_hash = jar_hash
+        # inputs of the completed steps, by journal key
+        self.completed_steps = {}
+        # keys of the steps that have started, whether completed or not
+        self.started_steps = set()
+        self._journal_file = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def read(cls, path):
+        """Read a journal, returning None if there is no usable one."""
+        try:
+            with open(path) as journal_file:
+                lines = journal_file.readlines()
+            header = json.loads(lines[0])
+        except (IOError, IndexError, ValueError):
+            return None
+        if header.get('format_version') != cls.FORMAT_VERSION:
+            return None
+        journal = cls(path, header['study_id'], header['jar_hash'])
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if 'started' in record:
+                journal.started_steps.add(record['started'])
+            else:
+                journal.completed_steps[record['step']] = record['inputs']
+        return journal
+
+    def find_changed_steps(self, steps):
+        """Return the keys of completed steps whose inputs have changed.
+
+        A completed step that is no longer part of the import counts as
+        changed, as its data would have to be removed.
+        """
+        current_inputs = dict((step.name, step.inputs) for step in steps
+                              if step.inputs is not None)
+        return sorted(key for key, inputs in self.completed_steps.items()
+                      if current_inputs.get(key) != inputs)
+
+    def find_interrupted_steps(self, steps):
+        """Return the steps that have started but not completed.
+
+        These may have loaded part of their data, which has to be deleted
+        before they can run again.
+        """
+        return [step for step in steps
+                if step.name in self.started_steps and
+                not self.is_completed(step)]
+
+    def is_completed(self, step):
+        """Return whether a step has completed with the same inputs."""
+        return (step.inputs is not None and
+                self.completed_steps.get(step.name) == step.inputs)
+
+    def start(self):
+        """Write the journal anew, with the steps it has completed so far."""
+        self._journal_file = open(self.path, 'w')
+        self._write_line({'format_version': self.FORMAT_VERSION,
+                          'study_id': self.study_id,
+                          'jar_hash': self.jar_hash})
+        for key in sorted(self.started_steps):
+            if key not in self.completed_steps:
+                self._write_line({'started': key})
+        for key, inputs in sorted(self.completed_steps.items()):
+            self._write_line({'step': key, 'inputs': inputs})
+
+    def record_start(self, step):
+        """Record that a step has started, if it is to be journaled."""
+        if step.inputs is None:
+            return
+        with self._lock:
+            self.started_steps.add(step.name)
+            self._write_line({'started': step.name})
+
+    def record(self, step):
+        """Record that a step has completed, if it is to be journaled."""
+        if step.inputs is None:
+            return
+        with self._lock:
+            self.completed_steps[step.name] = step.inputs
+            self._write_line({'step': step.name, 'inputs': step.inputs})
+
+    def _write_line(self, record):
+        """Write a line to the journal and make sure it is on disk."""
+        self._journal_file.write(json.dumps(record, sort_keys=True) + '\n')
+        self._journal_file.flush()
+        os.fsync(self._journal_file.fileno())
+
+    def close(self):
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+
+
+class ProgressReporter(object):
+
+    """Printer of the progress of the loaders, from their ProgressEvents.
+
+    The loaders report their progress every thousand records, which is
+    printed here as a line per step every `percent_step` percent, with the
+    memory used by the JVM as last reported.
+    """
+
+    def __init__(self, percent_step=PROGRESS_REPORT_PERCENT):
+        self.percent_step = percent_step
+        # last percentage printed and memory used, by step label
+        self._reported_percent = {}
+        self._memory_used = {}
+        # events come from the threads of steps run at the same time
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            if event.kind == 'memory_used_mb':
+                self._memory_used[event.step] = event.value
+                return
+            if event.kind != 'percent_complete':
+                return
+            percent = (int(event.value) // self.percent_step *
+                       self.percent_step)
+            if self._reported_percent.get(event.step) == percent:
+                return
+            self._reported_percent[event.step] = percent
+            message = '{0}: {1}% complete'.format(event.step, percent)
+            if event.step in self._memory_used:
+                message += ', {0:.0f} MB used'.format(
+                    self._memory_used[event.step])
+            print >> OUTPUT_FILE, message
+
+
+class ImportManifest(object):
+
+    """Description of a study as imported by the last import that completed.
+
+    For each journaled ImportStep, the manifest keeps the hashes of the
+    files the step read, and its target. A delta import compares the study
+    with the manifest to find the steps to run again.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, path, study_id):
+        self.path = path
+        self.study_id = study_id
+        # inputs and target of the steps, by step name
+        self.entries = {}
+
+    def add_step(self, step):
+        """Describe a step in the manifest, if it is journaled."""
+        if step.inputs is not None:
+            self.entries[step.name] = {'inputs': step.inputs,
+                                       'target': step.target}
+
+    @classmethod
+    def read(cls, path):
+        """Read a manifest, returning None if there is no usable one."""
+        try:
+            with open(path) as manifest_file:
+                manifest_dict = json.load(manifest_file)
+        except (IOError, ValueError):
+            return None
+        if (not isinstance(manifest_dict, dict) or
+                manifest_dict.get('format_version') != cls.FORMAT_VERSION):
+            return None
+        manifest = cls(path, manifest_dict['study_id'])
+        manifest.entries = manifest_dict['entries']
+        return manifest
+
+    def save(self):
+        """Write the manifest, replacing that of the previous import."""
+        # write to a temporary file first, so as not to leave a partial one
+        temp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        with open(temp_path, 'w') as manifest_file:
+            json.dump({'format_version': self.FORMAT_VERSION,
+                       'study_id': self.study_id,
+                       'entries': self.entries},
+                      manifest_file, indent=1, sort_keys=True)
+        os.rename(temp_path, self.path)
+
 # ------------------------------------------------------------------------------
 # sub-routines
 
@@ -42,14 +342,14 @@ def import_cancer_type(jvm_args, data_filename):
     args.append(IMPORT_CANCER_TYPE_CLASS)
     args.append(data_filename)
     args.append("false") # don't clobber existing table
-    args.append("--noprogress") # don't report memory usage and % progress
+    append_progress_args(args)
     run_java(*args)
 
 def import_study(jvm_args, meta_filename):
     args = jvm_args.split(' ')
     args.append(IMPORT_STUDY_CLASS)
     args.append(meta_filename)
-    args.append("--noprogress") # don't report memory usage and % progress
+    append_progress_args(args)
     run_java(*args)
 
 def update_study_status(jvm_args, study_id):
@@ -57,27 +357,34 @@ def update_study_status(jvm_args, study_id):
     args.append(UPDATE_STUDY_STATUS_CLASS)
     args.append(study_id)
     args.append("AVAILABLE")
-    args.append("--noprogress") # don't report memory usage and % progress
+    append_progress_args(args)
     run_java(*args)
 
 def remove_study(jvm_args, meta_filename):
-    args = jvm_args.split(' ')
-    args.append(REMOVE_STUDY_CLASS)
     meta_dict, meta_type = cbioportal_common.parse_metadata_file(
         meta_filename, logger=LOGGER)
     if meta_type != MetaFileTypes.STUDY:
         # invalid file, skip
         print >> ERROR_FILE, 'Not a study meta file: ' + meta_filename
         return
-    args.append(meta_dict['cancer_study_identifier'])
-    args.append("--noprogress") # don't report memory usage and % progress
+    remove_study_by_id(jvm_args, meta_dict['cancer_study_identifier'])
+
+def remove_study_by_id(jvm_args, study_id):
+    args = jvm_args.split(' ')
+    args.append(REMOVE_STUDY_CLASS)
+    args.append(study_id)
+    append_progress_args(args)
     run_java(*args)
 
-def import_study_data(jvm_args, meta_filename, data_filename):
+def import_study_data(jvm_args, meta_filename, data_filename,
+                      meta_file_dict=None, meta_file_type=None):
+
+    """Import a data file, parsing its meta file unless it has been parsed."""
 
     args = jvm_args.split(' ')
-    meta_file_dict, meta_file_type = cbioportal_common.parse_metadata_file(
-        meta_filename, logger=LOGGER)
+    if meta_file_type is None:
+        meta_file_dict, meta_file_type = cbioportal_common.parse_metadata_file(
+            meta_filename, logger=LOGGER)
     if meta_file_type is None:
         # invalid file, skip
         return
@@ -87,10 +394,11 @@ def import_study_data(jvm_args, meta_filename, data_filename):
                               "data filename in command, skipping file")
         return
 
-    importer = IMPORTER_CLASSNAME_BY_META_TYPE[meta_file_type]
+    schema = cbioportal_common.get_study_schema()
+    importer = schema.get_importer(meta_file_type)
 
     args.append(importer)
-    if IMPORTER_REQUIRES_METADATA[importer]:
+    if schema.importer_requires_metadata(importer):
         args.append("--meta")
         args.append(meta_filename)
         args.append("--loadMode")
@@ -104,14 +412,14 @@ def import_study_data(jvm_args, meta_filename, data_filename):
         args.append("--data")
         args.append(data_filename)
 
-    args.append("--noprogress") # don't report memory usage and % progress
+    append_progress_args(args)
     run_java(*args)
 
 def import_case_list(jvm_args, meta_filename):
     args = jvm_args.split(' ')
     args.append(IMPORT_CASE_LIST_CLASS)
     args.append(meta_filename)
-    args.append("--noprogress") # don't report memory usage and % progress
+    append_progress_args(args)
     run_java(*args)
     
 def add_global_case_list(jvm_args, study_id):
@@ -119,9 +427,16 @@ def add_global_case_list(jvm_args, study_id):
     args.append(ADD_CASE_LIST_CLASS)
     args.append(study_id)
     args.append("all")
-    args.append("--noprogress") # don't report memory usage and % progress
+    append_progress_args(args)
     run_java(*args)
 
+def append_progress_args(args):
+
+    """Ask a loader not to print its progress, unless it is being reported."""
+
+    if not cbioportal_common.is_reporting_progress():
+        args.append("--noprogress") # don't report memory usage and % progress
+
 def check_version(jvm_args):
     args = jvm_args.split(' ')
     args.append(VERSION_UTIL_CLASS)
@@ -131,11 +446,15 @@ def check_version(jvm_args):
         print >> OUTPUT_FILE, 'Error, probably due to this version of the portal being out of sync with the database. Run the database migration script located at PORTAL_HOME/core/src/main/scripts/migrate_db.py before continuing.'
         raise
 
+def list_case_lists(case_list_dir):
+    # skip "temp"/backup files made by some text editors:
+    return [os.path.join(case_list_dir, case_list) for
+            case_list in os.listdir(case_list_dir) if
+            not (case_list.startswith('.') or case_list.endswith('~'))]
+
 def process_case_lists(jvm_args, case_list_dir):
-    for case_list in os.listdir(case_list_dir):
-        # skip "temp"/backup files made by some text editors:
-        if not (case_list.startswith('.') or case_list.endswith('~')):
-            import_case_list(jvm_args, os.path.join(case_list_dir, case_list))
+    for case_list_filename in list_case_lists(case_list_dir):
+        import_case_list(jvm_args, case_list_filename)
 
 def process_command(jvm_args, command, meta_filename, data_filename):
     if command == IMPORT_CANCER_TYPE:
@@ -149,9 +468,9 @@ def process_command(jvm_args, command, meta_filename, data_filename):
     elif command == IMPORT_CASE_LIST:
         import_case_list(jvm_args, meta_filename)
 
-def process_directory(jvm_args, study_directory):
+def read_study_plan(study_directory):
 
-    """Import an entire study directory based on meta files found."""
+    """Make a StudyPlan of a study directory based on meta files found."""
 
     meta_filenames = (
         os.path.join(study_directory, f) for
@@ -159,79 +478,576 @@ def process_directory(jvm_args, study_directory):
         re.search(r'(\b|_)meta(\b|[_0-9])', f,
                   flags=re.IGNORECASE) and
         not (f.startswith('.') or f.endswith('~')))
-    study_id = None
-    study_metafile = None
-    study_metadata = None
-    cancer_type_filepairs = []
-    sample_attr_filepair = None
-    regular_filepairs = []
+    study_plan = StudyPlan(study_directory)
 
     # read all meta files (excluding case lists) to determine what to import
     for f in meta_filenames:
         # parse meta file
         metadata, meta_file_type = cbioportal_common.parse_metadata_file(
-            f, study_id=study_id, logger=LOGGER)
+            f, study_id=study_plan.study_id, logger=LOGGER)
         if meta_file_type is None:
             # invalid meta file, let's die
             raise RuntimeError('Invalid meta file: ' + f)
-        # remember study id to give an error in case any other file is referencing a different one
-        if study_id is None and 'cancer_study_identifier' in metadata:
-            study_id = metadata['cancer_study_identifier']
+        study_plan.add_meta_file(f, meta_file_type, metadata)
+    return study_plan
 
+def process_directory(jvm_args, study_directory, max_jobs=1, resume=False,
+                      delta=False):
+
+    """Import an entire study directory based on meta files found."""
+
+    process_study_plan(jvm_args, read_study_plan(study_directory), max_jobs,
+                       resume, delta)
+
+def process_study_plan(jvm_args, study_plan, max_jobs=1, resume=False,
+                       delta=False):
+
+    """Import the study described by a StudyPlan, without reading its meta files again.
+
+    Up to `max_jobs` data files are loaded at the same time once the study
+    and its samples have been defined. The completed steps are recorded in
+    the journal of the import; if `resume` is true, the steps the journal of
+    the previous import records as completed with the same files are skipped,
+    and the data of the steps it records as started but not completed is
+    deleted before they run again.
+    If `delta` is true, only the data that changed since the last import
+    that completed is deleted and loaded again, if possible, without
+    removing the study.
+    """
+
+    study_directory = study_plan.study_dir
+    study_id = study_plan.study_id
+    study_file = None
+    cancer_type_files = []
+    sample_attr_file = None
+    regular_files = []
+
+    # sort the files by what has to be imported first
+    for planned_file in study_plan.files:
+        meta_file_type = planned_file.meta_file_type
         if meta_file_type == MetaFileTypes.CANCER_TYPE:
-            cancer_type_filepairs.append(
-                (f, os.path.join(study_directory, metadata['data_filename'])))
+            cancer_type_files.append(planned_file)
         elif meta_file_type == MetaFileTypes.STUDY:
-            if study_metafile is not None:
+            if study_file is not None:
                 raise RuntimeError(
                     'Multiple meta_study files found: {} and {}'.format(
-                        study_metafile, f))
-            study_metafile = f
-            study_metadata = metadata
+                        study_plan.get_path(study_file.meta_filename),
+                        study_plan.get_path(planned_file.meta_filename)))
+            study_file = planned_file
         elif meta_file_type == MetaFileTypes.SAMPLE_ATTRIBUTES:
-            if sample_attr_filepair is not None:
+            if sample_attr_file is not None:
                 raise RuntimeError(
                     'Multiple sample attribute files found: {} and {}'.format(
-                        sample_attr_filepair[0], f))
-            sample_attr_filepair = (
-                f, os.path.join(study_directory, metadata['data_filename']))
+                        study_plan.get_path(sample_attr_file.meta_filename),
+                        study_plan.get_path(planned_file.meta_filename)))
+            sample_attr_file = planned_file
         else:
-            regular_filepairs.append(
-                (f, os.path.join(study_directory, metadata['data_filename'])))
-
-    # First, import cancer types
-    for meta_filename, data_filename in cancer_type_filepairs:
-        import_cancer_type(jvm_args, data_filename)
+            regular_files.append(planned_file)
 
-    # Then define the study
-    if study_metafile is None:
+    if study_file is None:
         raise RuntimeError('No meta_study file found')
-    else:
-        # First remove study if exists
-        remove_study(jvm_args, study_metafile)
-        import_study(jvm_args, study_metafile)
-
-    # Next, we need to import sample definitions
-    if sample_attr_filepair is None:
+    if sample_attr_file is None:
         raise RuntimeError('No sample attribute file found')
-    else:
-        meta_filename, data_filename = sample_attr_filepair
-        import_study_data(jvm_args, meta_filename, data_filename)
+    if any(planned_file.meta_hash is None for planned_file in study_plan.files):
+        study_plan.record_file_contents()
 
-    # Now, import everything else
-    for meta_filename, data_filename in regular_filepairs:
-        import_study_data(jvm_args, meta_filename, data_filename)
-
-    # do the case lists
+    # the steps that have to wait for the study, its samples and their
+    # case lists; other than that, data files are independent of each other,
+    # but for those of SERIAL_META_FILE_TYPES
+    steps = []
+    cancer_type_steps = []
+    for planned_file in cancer_type_files:
+        cancer_type_steps.append(ImportStep(
+            'import cancer types ' + planned_file.data_filename,
+            import_cancer_type,
+            (jvm_args, study_plan.get_path(planned_file.data_filename)),
+            inputs=get_planned_file_inputs(planned_file),
+            target=get_planned_file_target(study_plan, planned_file)))
+    steps.extend(cancer_type_steps)
+    # remove the study if it exists, before defining it again
+    remove_step = ImportStep(
+        'remove study ' + study_id,
+        remove_study_by_id,
+        (jvm_args, study_file.meta_dict['cancer_study_identifier']))
+    study_step = ImportStep(
+        'import study ' + study_file.meta_filename,
+        import_study,
+        (jvm_args, study_plan.get_path(study_file.meta_filename)),
+        depends_on=cancer_type_steps + [remove_step],
+        inputs=get_planned_file_inputs(study_file))
+    sample_step = ImportStep(
+        'import data ' + sample_attr_file.meta_filename,
+        import_planned_file,
+        (jvm_args, study_plan, sample_attr_file),
+        depends_on=[study_step],
+        inputs=get_planned_file_inputs(sample_attr_file))
+    steps.extend([remove_step, study_step, sample_step])
+    serial_steps = []
+    for planned_file in regular_files:
+        data_step = ImportStep(
+            'import data ' + planned_file.meta_filename,
+            import_planned_file,
+            (jvm_args, study_plan, planned_file),
+            depends_on=[sample_step],
+            inputs=get_planned_file_inputs(planned_file),
+            target=get_planned_file_target(study_plan, planned_file))
+        steps.append(data_step)
+        if planned_file.meta_file_type in SERIAL_META_FILE_TYPES:
+            serial_steps.append(
+                (SERIAL_META_FILE_TYPES.index(planned_file.meta_file_type),
+                 data_step))
+    serial_steps.sort(key=lambda serial_step: serial_step[0])
+    for (_, previous_step), (_, data_step) in zip(serial_steps,
+                                                   serial_steps[1:]):
+        data_step.depends_on.append(previous_step)
+    case_list_steps = []
     case_list_dirname = os.path.join(study_directory, 'case_lists')
     if os.path.isdir(case_list_dirname):
-        process_case_lists(jvm_args, case_list_dirname)
+        for case_list_filename in list_case_lists(case_list_dirname):
+            case_list_steps.append(ImportStep(
+                'import case list ' + os.path.basename(case_list_filename),
+                import_case_list,
+                (jvm_args, case_list_filename),
+                depends_on=[sample_step],
+                inputs={os.path.relpath(case_list_filename, study_directory):
+                        hash_file(case_list_filename)},
+                target=get_case_list_target(case_list_filename)))
+    steps.extend(case_list_steps)
+    if study_file.meta_dict.get('add_global_case_list', 'false').lower() == 'true':
+        steps.append(ImportStep(
+            'add global case list',
+            add_global_case_list,
+            (jvm_args, study_id),
+            depends_on=[sample_step] + case_list_steps,
+            inputs={}))
+    # enable study once everything has been loaded
+    steps.append(ImportStep(
+        'update study status',
+        update_study_status,
+        (jvm_args, study_id),
+        depends_on=list(steps),
+        inputs={}))
 
-    if study_metadata.get('add_global_case_list', 'false').lower() == 'true':
-        add_global_case_list(jvm_args, study_id)
-        
-    # enable study
-    update_study_status(jvm_args, study_id)
+    manifest = ImportManifest(
+        os.path.join(study_directory, IMPORT_MANIFEST_FILENAME), study_id)
+    for step in steps:
+        manifest.add_step(step)
+    delta_plan = None
+    if delta:
+        delta_plan = plan_delta_import(
+            steps, manifest, ImportManifest.read(manifest.path))
+    if delta_plan is not None:
+        steps, unchanged_steps = delta_plan
+        journal = start_import_journal(jvm_args, study_plan, steps,
+                                       completed_steps=unchanged_steps)
+    else:
+        journal = start_import_journal(jvm_args, study_plan, steps, resume)
+        if journal is not None:
+            completed_steps = [step for step in steps
+                               if journal.is_completed(step)]
+            # the study is only removed to be imported again
+            if study_step in completed_steps:
+                completed_steps.append(remove_step)
+            steps = skip_completed_steps(steps, completed_steps)
+            # removing the study deletes what interrupted steps loaded
+            if study_step in completed_steps:
+                steps = add_interrupted_step_deletions(
+                    study_id, steps, journal)
+    try:
+        run_import_steps(steps, max_jobs, journal)
+    finally:
+        if journal is not None:
+            journal.close()
+    try:
+        manifest.save()
+    except (IOError, OSError) as e:
+        print >> ERROR_FILE, ('Cannot write the import manifest, the next '
+                              'import cannot be a delta import: {0}'.format(e))
+
+def get_planned_file_inputs(planned_file):
+
+    """Return the hashes of the meta and data files of a PlannedFile by path."""
+
+    inputs = {planned_file.meta_filename: planned_file.meta_hash}
+    if planned_file.data_hash is not None:
+        inputs[planned_file.data_filename] = planned_file.data_hash
+    return inputs
+
+def get_planned_file_target(study_plan, planned_file):
+
+    """Return the target of the ImportStep loading a PlannedFile, if any."""
+
+    meta_file_type = planned_file.meta_file_type
+    if meta_file_type in GENETIC_PROFILE_META_FILE_TYPES:
+        return {'genetic_profile': '{0}_{1}'.format(
+            study_plan.study_id, planned_file.meta_dict['stable_id'])}
+    elif meta_file_type == MetaFileTypes.PATIENT_ATTRIBUTES:
+        return {'patient_attributes': read_clinical_attribute_ids(
+            study_plan.get_path(planned_file.data_filename))}
+    elif meta_file_type == MetaFileTypes.CANCER_TYPE:
+        return {'cancer_types': planned_file.data_filename}
+    return None
+
+def get_case_list_target(case_list_filename):
+
+    """Return the target of the ImportStep loading a case list file, if any."""
+
+    case_list_dict, meta_file_type = cbioportal_common.parse_metadata_file(
+        case_list_filename, LOGGER, case_list=True)
+    if meta_file_type is None or 'stable_id' not in case_list_dict:
+        return None
+    return {'case_list': case_list_dict['stable_id']}
+
+def read_clinical_attribute_ids(data_filename):
+
+    """Return the ids of the attributes in the columns of a clinical data file."""
+
+    with open(data_filename, 'rU') as data_file:
+        for line in data_file:
+            if line.startswith('#') or not line.strip():
+                continue
+            attr_ids = [column.strip().upper() for column in
+                        line.rstrip('\r\n').split('\t')]
+            return [attr_id for attr_id in attr_ids
+                    if attr_id not in ('PATIENT_ID', 'SAMPLE_ID')]
+    return []
+
+def get_classpath_hash(jvm_args):
+
+    """Return a hash of the jar files on the classpath of the JVM arguments."""
+
+    args = jvm_args.split(' ')
+    classpath = ''
+    for i, arg in enumerate(args[:-1]):
+        if arg in ('-cp', '-classpath'):
+            classpath = args[i + 1]
+    classpath_hash = hashlib.sha1()
+    for classpath_entry in classpath.split(os.pathsep):
+        if os.path.isfile(classpath_entry):
+            classpath_hash.update(hash_file(classpath_entry))
+    return classpath_hash.hexdigest()
+
+def start_import_journal(jvm_args, study_plan, steps, resume=False,
+                         completed_steps=()):
+
+    """Start the ImportJournal of the import of a study, made of ImportSteps.
+
+    If `resume` is true, the journal starts with the steps the journal of
+    the previous import records as completed, provided that it was an import
+    of the same study with the same scripts jar, and that none of those
+    steps would read changed files now, and that the data of the steps it
+    records as started but not completed can be deleted. Otherwise, the
+    whole study has to be imported again, and the journal starts empty, but
+    for the `completed_steps` given. If the journal cannot be written, None is
+    returned and the import goes ahead without one.
+    """
+
+    journal_path = os.path.join(study_plan.study_dir, IMPORT_JOURNAL_FILENAME)
+    journal = ImportJournal(journal_path, study_plan.study_id,
+                            get_classpath_hash(jvm_args))
+    if resume:
+        previous_journal = ImportJournal.read(journal_path)
+        if previous_journal is None:
+            print >> OUTPUT_FILE, ('No import journal found, importing the '
+                                   'whole study')
+        elif (previous_journal.study_id != journal.study_id or
+                previous_journal.jar_hash != journal.jar_hash):
+            print >> OUTPUT_FILE, ('The import journal is of another study or '
+                                   'scripts jar, importing the whole study')
+        else:
+            changed_steps = previous_journal.find_changed_steps(steps)
+            undeletable_steps = [
+                step.name for step in
+                previous_journal.find_interrupted_steps(steps)
+                if step.target is None]
+            if changed_steps:
+                print >> OUTPUT_FILE, (
+                    'Files read by completed import steps have changed, '
+                    'importing the whole study: ' + ', '.join(changed_steps))
+            elif undeletable_steps:
+                print >> OUTPUT_FILE, (
+                    'Import steps that cannot be run again on their own were '
+                    'interrupted, importing the whole study: ' +
+                    ', '.join(undeletable_steps))
+            else:
+                journal.completed_steps = previous_journal.completed_steps
+                journal.started_steps = previous_journal.started_steps
+    for step in completed_steps:
+        journal.completed_steps[step.name] = step.inputs
+    try:
+        journal.start()
+    except IOError as e:
+        print >> ERROR_FILE, ('Cannot write the import journal, the import '
+                              'will not be resumable: {0}'.format(e))
+        return None
+    return journal
+
+def plan_delta_import(steps, manifest, previous_manifest):
+
+    """Plan the ImportSteps that update the study from its last import.
+
+    The journaled steps whose files have not changed since the import
+    described by `previous_manifest` are left out, as is removing the
+    study. Before a changed step runs again, and for a step that is no
+    longer part of the study, what the step loaded last time is deleted
+    from the database. This is only possible for targets other than
+    cancer types, which are loaded again over the existing ones.
+
+    :returns: tuple of the steps to run and the unchanged steps, or None if
+              the whole study has to be imported again
+    """
+
+    if previous_manifest is None:
+        print >> OUTPUT_FILE, ('No import manifest found, importing the '
+                               'whole study')
+        return None
+    if previous_manifest.study_id != manifest.study_id:
+        print >> OUTPUT_FILE, ('The import manifest is of another study, '
+                               'importing the whole study')
+        return None
+    previous_entries = previous_manifest.entries
+    changed_names = [name for name, entry in sorted(manifest.entries.items())
+                     if name in previous_entries and
+                     previous_entries[name]['inputs'] != entry['inputs']]
+    removed_names = sorted(name for name in previous_entries
+                           if name not in manifest.entries)
+    undeletable_names = [name for name in changed_names + removed_names
+                         if previous_entries[name]['target'] is None]
+    if undeletable_names:
+        print >> OUTPUT_FILE, (
+            'Files read by import steps that cannot be run again on their '
+            'own have changed, importing the whole study: ' +
+            ', '.join(undeletable_names))
+        return None
+    deletion_steps = {}
+    for name in changed_names + removed_names:
+        deletion_step = make_deletion_step(manifest.study_id,
+                                           previous_entries[name]['target'])
+        if deletion_step is not None:
+            deletion_steps[name] = deletion_step
+    # the deletions come first, so that steps follow those they depend on
+    steps_to_run = [deletion_steps[name] for name in removed_names
+                    if name in deletion_steps]
+    unchanged_steps = []
+    for step in steps:
+        if step.name in changed_names:
+            print >> OUTPUT_FILE, 'Changed since the last import: ' + step.name
+            if step.name in deletion_steps:
+                steps_to_run.insert(0, deletion_steps[step.name])
+                step.depends_on.append(deletion_steps[step.name])
+            steps_to_run.append(step)
+        elif step.inputs is not None and step.name not in previous_entries:
+            print >> OUTPUT_FILE, 'New since the last import: ' + step.name
+            steps_to_run.append(step)
+        elif step.inputs is not None:
+            unchanged_steps.append(step)
+    # only the order among the steps that run again still matters, such as
+    # that of the files of SERIAL_META_FILE_TYPES
+    for step in steps_to_run:
+        step.depends_on = [dependency for dependency in step.depends_on
+                           if dependency in steps_to_run]
+    for name in removed_names:
+        print >> OUTPUT_FILE, 'Removed since the last import: ' + name
+    print >> OUTPUT_FILE, (
+        'Delta import: running {0} steps, skipping {1} unchanged '
+        'steps'.format(len(steps_to_run), len(unchanged_steps)))
+    return steps_to_run, unchanged_steps
+
+def make_deletion_step(study_id, target):
+
+    """Return an ImportStep deleting the data of an ImportStep target.
+
+    The deletion goes through the database layer of cbio.core, as the Java
+    loaders cannot remove a single genetic profile or attribute.
+
+    :returns: the ImportStep, or None if nothing has to be deleted
+    """
+
+    if 'cancer_types' in target:
+        return None
+    if 'CBIO_CONFIG' not in os.environ:
+        raise RuntimeError('Deleting data loaded by a previous import needs '
+                           'the database configured in CBIO_CONFIG')
+    from cbio.core import pgsql
+    if 'genetic_profile' in target:
+        return ImportStep(
+            'delete genetic profile ' + target['genetic_profile'],
+            pgsql.delete_genetic_profile,
+            (target['genetic_profile'],))
+    elif 'case_list' in target:
+        return ImportStep(
+            'delete case list ' + target['case_list'],
+            pgsql.delete_sample_list,
+            (target['case_list'],))
+    elif 'patient_attributes' in target:
+        return ImportStep(
+            'delete patient attributes ' +
+            ', '.join(target['patient_attributes']),
+            pgsql.delete_patient_clinical_data,
+            (study_id, target['patient_attributes']))
+    raise ValueError('Unknown import step target: {0}'.format(target))
+
+def skip_completed_steps(steps, completed_steps):
+
+    """Return the ImportSteps left to run once the completed ones are skipped."""
+
+    for step in completed_steps:
+        print >> OUTPUT_FILE, 'Skipping import step completed before: ' + step.name
+    remaining_steps = [step for step in steps if step not in completed_steps]
+    for step in remaining_steps:
+        step.depends_on = [dependency for dependency in step.depends_on
+                           if dependency not in completed_steps]
+    return remaining_steps
+
+def add_interrupted_step_deletions(study_id, steps, journal):
+
+    """Return the ImportSteps with deletions before the interrupted ones.
+
+    A step the journal records as started but not completed may have loaded
+    part of its data, which the loaders would refuse to load again, so it
+    is made to depend on a step deleting its target.
+    """
+
+    steps_to_run = []
+    interrupted_steps = journal.find_interrupted_steps(steps)
+    for step in steps:
+        if step in interrupted_steps:
+            print >> OUTPUT_FILE, ('Import step interrupted before, loading '
+                                   'it again: ' + step.name)
+            deletion_step = make_deletion_step(study_id, step.target)
+            if deletion_step is not None:
+                steps_to_run.append(deletion_step)
+                step.depends_on.append(deletion_step)
+        steps_to_run.append(step)
+    return steps_to_run
+
+def import_planned_file(jvm_args, study_plan, planned_file):
+    import_study_data(jvm_args,
+                      study_plan.get_path(planned_file.meta_filename),
+                      study_plan.get_path(planned_file.data_filename),
+                      meta_file_dict=planned_file.meta_dict,
+                      meta_file_type=planned_file.meta_file_type)
+
+def run_import_steps(steps, max_jobs=1, journal=None):
+
+    """Run ImportSteps in threads, up to `max_jobs` at a time.
+
+    A step is started once all the steps it depends on have succeeded, and
+    skipped if any of them fails. Steps that are ready at the same time are
+    started in the order of the list, so that with one job at a time they
+    run in that order. Steps are recorded in `journal`, if given, when they
+    start and when they succeed. Afterwards, the critical path of the run
+    is reported.
+
+    :raises: RuntimeError if any of the steps failed or was skipped
+    """
+
+    finished_queue = Queue.Queue()
+    pending_steps = list(steps)
+    num_running = 0
+
+    def run_step(step):
+        try:
+            if journal is not None:
+                journal.record_start(step)
+            step.run()
+            if (journal is not None and
+                    step.status == ImportStep.STATUS_SUCCEEDED):
+                journal.record(step)
+        finally:
+            finished_queue.put(step)
+
+    start_time = time.time()
+    while pending_steps or num_running:
+        # skip the steps that depend on a step that did not succeed
+        for step in list(pending_steps):
+            if any(dependency.status in (ImportStep.STATUS_FAILED,
+                                         ImportStep.STATUS_SKIPPED)
+                   for dependency in step.depends_on):
+                step.status = ImportStep.STATUS_SKIPPED
+                print >> ERROR_FILE, 'Skipping import step: ' + step.name
+                pending_steps.remove(step)
+        # start the steps that are ready, as far as there is room
+        for step in list(pending_steps):
+            if num_running >= max_jobs:
+                break
+            if all(dependency.status == ImportStep.STATUS_SUCCEEDED
+                   for dependency in step.depends_on):
+                pending_steps.remove(step)
+                step.status = ImportStep.STATUS_RUNNING
+                step_thread = threading.Thread(target=run_step, args=(step,),
+                                               name=step.name)
+                step_thread.daemon = True
+                step_thread.start()
+                num_running += 1
+        if not num_running:
+            # nothing can be started anymore
+            break
+        # wait for a step to finish, without blocking KeyboardInterrupt
+        while True:
+            try:
+                finished_queue.get(timeout=STEP_POLL_INTERVAL)
+            except Queue.Empty:
+                continue
+            num_running -= 1
+            break
+
+    report_critical_path(steps, time.time() - start_time)
+    unsuccessful_steps = [step for step in steps
+                          if step.status != ImportStep.STATUS_SUCCEEDED]
+    if unsuccessful_steps:
+        raise RuntimeError(
+            'Aborting. {0} of {1} import steps failed or were skipped: '
+            '{2}'.format(len(unsuccessful_steps), len(steps),
+                         ', '.join(step.name for step in unsuccessful_steps)))
+
+def report_critical_path(steps, wall_time):
+
+    """Print the longest chain of dependent steps by the time they took."""
+
+    # the longest duration of a chain of steps ending with each step, and
+    # the step before it in that chain, computed in the order of the list,
+    # in which steps come after those they depend on
+    chain_durations = {}
+    previous_steps = {}
+    for step in steps:
+        previous_step = None
+        for dependency in step.depends_on:
+            if (previous_step is None or
+                    chain_durations[dependency] > chain_durations[previous_step]):
+                previous_step = dependency
+        chain_durations[step] = step.get_duration()
+        if previous_step is not None:
+            chain_durations[step] += chain_durations[previous_step]
+        previous_steps[step] = previous_step
+    if not steps:
+        return
+    step = max(steps, key=lambda step: chain_durations[step])
+    critical_path = []
+    while step is not None:
+        critical_path.append(step)
+        step = previous_steps[step]
+    critical_path.reverse()
+    print >> OUTPUT_FILE, (
+        'Imported in {0:.1f} s, of which {1:.1f} s on the critical path: '
+        '{2}'.format(
+            wall_time,
+            chain_durations[critical_path[-1]],
+            ' -> '.join('{0} ({1:.1f} s)'.format(step.name,
+                                                 step.get_duration())
+                        for step in critical_path)))
+
+def load_study_plan(study_plan_filename):
+
+    """Read a saved StudyPlan, checking that the study has not changed since."""
+
+    study_plan = StudyPlan.load(study_plan_filename)
+    changed_paths = study_plan.find_changed_files()
+    if changed_paths:
+        raise RuntimeError(
+            'Files changed since the study plan was made, validate the '
+            'study again: ' + ', '.join(changed_paths))
+    return study_plan
 
 
 def usage():
@@ -276,6 +1092,36 @@ def interface():
                         help='Path to meta file')
     parser.add_argument('-data', '--data_filename', type=str, required=False,
                         help='Path to Data file')
+    parser.add_argument('-j', '--jobs', type=int, dest='import_jobs',
+                        default=1,
+                        help='number of data files and case lists to load at '
+                             'the same time, once the study and its samples '
+                             'have been loaded (default: 1)')
+    parser.add_argument('-plan', '--study_plan_file', type=str, required=False,
+                        help='Path to a study plan written by the validator, '
+                             'to import the study it describes without '
+                             'reading its meta files again')
+    parser.add_argument('--persistent_jvm', action='store_true',
+                        help='run the import steps in long-lived JVMs, one '
+                             'per job, instead of starting a JVM per step')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the steps that the previous import of the '
+                             'study directory completed with the same files, '
+                             'as recorded in its import journal')
+    parser.add_argument('--delta', action='store_true',
+                        help='without removing the study, delete and load '
+                             'again only the genetic profiles, patient '
+                             'attributes and case lists that changed since '
+                             'the last import that completed')
+    parser.add_argument('--step_log_dir', type=str, required=False,
+                        help='directory in which to write the output of each '
+                             'import step to its own log file')
+    parser.add_argument('--compress_step_logs', action='store_true',
+                        help='gzip the log files of the import steps')
+    parser.add_argument('--progress', action='store_true',
+                        help='print how far each loader has got every {0}%% '
+                             'of its data file'.format(
+                                 PROGRESS_REPORT_PERCENT))
     # TODO - add same argument to metaimporter
     # TODO - harmonize on - and _
 
@@ -283,7 +1129,13 @@ def interface():
     return parser
 
 
-def main(args):
+def main(args, study_plan=None):
+
+    """Import a study directory, a study plan or a single file as the args say.
+
+    If `study_plan` is a StudyPlan made while validating the study, the
+    study is imported from it.
+    """
 
     global LOGGER
 
@@ -317,16 +1169,36 @@ def main(args):
     jvm_args = "-Dspring.profiles.active=dbcp -cp " + args.jar_path
     study_directory = args.study_directory
 
-    # check if DB version and application version are in sync
-    check_version(jvm_args)
+    max_jobs = getattr(args, 'import_jobs', None) or 1
+    resume = getattr(args, 'resume', False)
+    delta = getattr(args, 'delta', False)
+    progress_handler = None
+    if getattr(args, 'progress', False):
+        progress_handler = ProgressReporter()
+    cbioportal_common.configure_step_output(
+        getattr(args, 'step_log_dir', None),
+        getattr(args, 'compress_step_logs', False),
+        progress_handler)
+    if getattr(args, 'persistent_jvm', False):
+        cbioportal_common.start_java_workers(jvm_args.split(' '), max_jobs)
+    try:
+        # check if DB version and application version are in sync
+        check_version(jvm_args)
 
-    if study_directory != None:
-        check_dir(study_directory)
-        process_directory(jvm_args, study_directory)
-    else:
-        check_args(args.command)
-        check_files(args.meta_filename, args.data_filename)
-        process_command(jvm_args, args.command, args.meta_filename, args.data_filename)
+        if study_plan is None and getattr(args, 'study_plan_file', None):
+            study_plan = load_study_plan(args.study_plan_file)
+        if study_plan is not None:
+            process_study_plan(jvm_args, study_plan, max_jobs, resume, delta)
+        elif study_directory != None:
+            check_dir(study_directory)
+            process_directory(jvm_args, study_directory, max_jobs, resume,
+                              delta)
+        else:
+            check_args(args.command)
+            check_files(args.meta_filename, args.data_filename)
+            process_command(jvm_args, args.command, args.meta_filename, args.data_filename)
+    finally:
+        cbioportal_common.stop_java_workers()
 
 # ------------------------------------------------------------------------------
 # ready to roll
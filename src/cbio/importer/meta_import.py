@@ -65,8 +65,62 @@ def interface():
                         help='report status info messages while validating')
     parser.add_argument('-o', '--override_warning', action='store_true',
                         help='override warnings and continue importing')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of worker processes in which to validate '
+                             'the data files (default: 1)')
+    parser.add_argument('--import_jobs', type=int, default=1,
+                        help='number of data files and case lists to load at '
+                             'the same time, once the study and its samples '
+                             'have been loaded (default: 1)')
+    parser.add_argument('--persistent_jvm', action='store_true',
+                        help='run the import steps in long-lived JVMs, one '
+                             'per import job, instead of starting a JVM per '
+                             'step')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the import steps that the previous import '
+                             'of the study completed with the same files')
+    parser.add_argument('--delta', action='store_true',
+                        help='without removing the study, delete and load '
+                             'again only the genetic profiles, patient '
+                             'attributes and case lists that changed since '
+                             'the last import')
+    parser.add_argument('--step_log_dir', type=str, required=False,
+                        help='directory in which to write the output of each '
+                             'import step to its own log file')
+    parser.add_argument('--compress_step_logs', action='store_true',
+                        help='gzip the log files of the import steps')
+    parser.add_argument('-m', '--max_errors_per_file', type=int,
+                        help='stop validating a data file after this many '
+                             'errors (default: no limit)')
+    parser.add_argument('-M', '--max_errors_per_message', type=int,
+                        help='stop validating a data file after this many '
+                             'errors of the same type (default: no limit)')
+    parser.add_argument('-f', '--fail_fast', action='store_true',
+                        help='stop validating the study at the first data '
+                             'file that cannot be parsed entirely')
+    parser.add_argument('-C', '--cache_dir', type=str,
+                        help='directory in which to keep a cache of '
+                             'validation messages, to skip reading data files '
+                             'that have not changed since the previous run, '
+                             'and of the information retrieved from the '
+                             'portal')
+    parser.add_argument('--portal_info_ttl', type=int,
+                        help='number of seconds for which to use cached '
+                             'portal information before checking the server '
+                             'for changes (default: one hour)')
+    parser.add_argument('--portal_timeout', type=float,
+                        help='number of seconds to wait for a response from '
+                             'the portal (default: 60)')
+    parser.add_argument('--portal_retries', type=int,
+                        help='number of times to retry a failed request to '
+                             'the portal (default: 3)')
     parser.add_argument('-c', '--config_file', type=str, required=False,
                         help='Path to extra configuration file')
+    parser.add_argument('--study_plan_file', type=str, required=False,
+                        help='file to which to write a plan of the study if '
+                             'it is valid, to import it from later on with '
+                             'cbioportal_importer.py without validating it '
+                             'again')
     parser = parser.parse_args()
     return parser
 
@@ -103,7 +157,7 @@ def main():
     # Validate the study directory.
     logger.info("Starting validation...")
     try:
-        exitcode = validate_data.main_validate(args)
+        exitcode, study_plan = validate_data.main_validate_with_plan(args)
     except KeyboardInterrupt:
         logger.info("Process interrupted. " + Color.END)
         logger.info("#" * 71)
@@ -128,7 +182,7 @@ def main():
             if args.override_warning:
                 logger.error(Color.BOLD + "Overriding Warnings. Importing study now" + Color.END)
                 logger.error("#" * 71)
-                cbioportal_importer.main(args)
+                cbioportal_importer.main(args, study_plan=study_plan)
                 exitcode = 0
             else:
                 logger.error(Color.BOLD + "Warnings. Please fix your files or import with override warning option" + Color.END)
@@ -136,14 +190,14 @@ def main():
         elif exitcode == 0:
             logger.error(Color.BOLD + "Everything looks good. Importing study now" + Color.END)
             logger.error("#" * 71)
-            cbioportal_importer.main(args)
+            cbioportal_importer.main(args, study_plan=study_plan)
     except KeyboardInterrupt:
-        logger.info(Color.BOLD + "\nProcess interrupted. You will have to run this again to make sure study is completely loaded." + Color.END)
+        logger.info(Color.BOLD + "\nProcess interrupted. You will have to run this again to make sure study is completely loaded, with --resume to skip the steps already completed." + Color.END)
         logger.info("#" * 71)
         raise
     except:
         logger.error("!" * 71)
-        logger.error(Color.RED + "Error occurred during data loading step. Please fix the problem and run this again to make sure study is completely loaded." + Color.END)
+        logger.error(Color.RED + "Error occurred during data loading step. Please fix the problem and run this again to make sure study is completely loaded, with --resume to skip the steps already completed." + Color.END)
         raise
     sys.exit(exitcode)
 
@@ -30,16 +30,49 @@ Run with the command line option --help for usage information.
 
 # imports
 import argparse
+import cPickle
 import csv
+import functools
+import hashlib
+import heapq
 import itertools
 import json
 import logging.handlers
+import mmap
+import multiprocessing
+import multiprocessing.pool
 import os
 import re
+import sqlite3
+import string
+import struct
 import sys
+import tempfile
+import time
+import zlib
 from collections import OrderedDict
 
 import requests
+from requests.packages.urllib3.util.retry import Retry
+try:
+    from cbio.core import chromsizes
+    from cbio.core.jsonstream import CHUNK_SIZE as JSON_CHUNK_SIZE
+    from cbio.core.jsonstream import iter_json_array
+except ImportError:
+    # run as a script, without the cbio package on the path; the modules
+    # used from cbio.core only need the standard library, so they are
+    # imported from the core directory next to this one
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 os.pardir, 'core'))
+    import chromsizes
+    from jsonstream import CHUNK_SIZE as JSON_CHUNK_SIZE
+    from jsonstream import iter_json_array
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is optional, without it matrix values are checked one by one
+    np = None
 
 import cbioportal_common
 
@@ -52,6 +85,56 @@ DEFINED_SAMPLE_ATTRIBUTES = None
 PATIENTS_WITH_SAMPLES = None
 DEFINED_CANCER_TYPES = None
 
+# approximate size in bytes of the parts that a data file is split into for
+# validation in multiple processes; smaller files are checked as a whole
+SHARD_SIZE = 32 * 1024 * 1024
+
+# approximate size in bytes of the chunks in which data lines are read
+READ_CHUNK_SIZE = 1024 * 1024
+
+# maximum number of distinct gene identifier pairs to memoize the outcome of
+# gene identification for
+GENE_RESOLUTION_CACHE_SIZE = 100000
+
+# number of seconds for which portal information from a server is used from
+# the local cache before checking whether it has changed
+PORTAL_INFO_TTL = 60 * 60
+
+# number of seconds to wait for the portal's web API to respond, number of
+# times to retry a failed request and factor for the (exponentially
+# increasing) delays between retries
+PORTAL_API_TIMEOUT = 60
+PORTAL_API_RETRIES = 3
+PORTAL_API_BACKOFF = 0.5
+
+# HTTP response statuses from the portal's web API that are worth retrying
+PORTAL_API_RETRY_STATUSES = (500, 502, 503, 504)
+
+# number of segments sorted in memory at a time to check the overlap of
+# segments in a seg file that is not sorted by sample, chromosome and position
+SEG_SORT_RUN_SIZE = 250000
+
+# fraction of the genome below which the coverage of a sample's segments is
+# reported as low
+MIN_SEG_GENOME_COVERAGE = 0.5
+
+# rows of tab-separated values that are all real numbers in the usual
+# notation, or NA; float() accepts these, as well as some other notations
+NUMERIC_ROW_PATTERN = re.compile(
+    r'(?:{0})(?:\t(?:{0}))*\Z'.format(
+        r'[-+]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][-+]?[0-9]+)?|NA'))
+
+# patterns that csv.Sniffer tries in turn to find quoted fields, along with
+# the delimiter and space around them
+QUOTED_FIELD_PATTERNS = [
+    re.compile(pattern, re.DOTALL | re.MULTILINE) for pattern in (
+        r'(?P<delim>[^\w\n"\'])(?P<space> ?)(?P<quote>["\']).*?(?P=quote)(?P=delim)',
+        r'(?:^|\n)(?P<quote>["\']).*?(?P=quote)(?P<delim>[^\w\n"\'])(?P<space> ?)',
+        r'(?P<delim>[^\w\n"\'])(?P<space> ?)(?P<quote>["\']).*?(?P=quote)(?:$|\n)',
+        r'(?:^|\n)(?P<quote>["\']).*?(?P=quote)(?:$|\n)')]
+# a quote character at the start of a line or after a character that is not
+# part of a word, where a match of any of the patterns above would begin
+QUOTE_OPENING_PATTERN = re.compile(r'(?:^|[^\w"\'])["\']', re.MULTILINE)
 
 # ----------------------------------------------------------------------------
 
@@ -130,6 +213,41 @@ class LineCountHandler(logging.Handler):
     def get_nr_lines_with_issue(self):
         """Return the number of lines with an error or warning."""
         return len(self.error_lines | self.warning_lines)
+
+
+class ErrorBudgetHandler(logging.Handler):
+
+    """Handler that tracks whether a file has used up its error budget.
+
+    Errors about the file are counted in total and per message type, which
+    is taken to be the logging call that emitted them. Either limit may be
+    None to leave it unlimited.
+    """
+
+    def __init__(self, filename, max_errors, max_errors_per_message):
+        """Initialize the handler with the limits and no errors counted."""
+        super(ErrorBudgetHandler, self).__init__(level=logging.ERROR)
+        self.filename = filename
+        self.max_errors = max_errors
+        self.max_errors_per_message = max_errors_per_message
+        self.num_errors = 0
+        self.message_error_counts = {}
+        self.exceeded = False
+
+    def emit(self, record):
+        """Count the error and check it against the budget."""
+        if getattr(record, 'filename_', None) != self.filename:
+            return
+        self.num_errors += 1
+        if (self.max_errors is not None and
+                self.num_errors > self.max_errors):
+            self.exceeded = True
+        message_type = (record.module, record.lineno)
+        message_count = self.message_error_counts.get(message_type, 0) + 1
+        self.message_error_counts[message_type] = message_count
+        if (self.max_errors_per_message is not None and
+                message_count > self.max_errors_per_message):
+            self.exceeded = True
     
 
 class Jinja2HtmlHandler(logging.handlers.BufferingHandler):
@@ -203,11 +321,43 @@ class ErrorFileFormatter(cbioportal_common.ValidationMessageFormatter):
         return super(ErrorFileFormatter, self).format(record)
 
 
+class RecordCollectingHandler(logging.Handler):
+
+    """Handler that keeps picklable copies of the records emitted to it.
+
+    Used in worker processes to send their log records back to the main
+    process, which will replay them through its own handlers.
+    """
+
+    def __init__(self):
+        """Initialize the handler with an empty list of records."""
+        super(RecordCollectingHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        """Store the fields of the record, with its message merged."""
+        record_dict = dict(record.__dict__)
+        record_dict['msg'] = record.getMessage()
+        record_dict['args'] = None
+        if record.exc_info:
+            record_dict['exc_text'] = logging.Formatter().formatException(
+                record.exc_info)
+            record_dict['exc_info'] = None
+        self.records.append(record_dict)
+
+    def pop_records(self):
+        """Return the list of records collected so far and start a new one."""
+        records = self.records
+        self.records = []
+        return records
+
+
 class LineMessageFilter(logging.Filter):
     """Filter that selects only validation messages about a line in a file."""
     def filter(self, record):
         return int(hasattr(record, 'filename_') and
-                   hasattr(record, 'line_number'))
+                   (hasattr(record, 'line_number') or
+                    hasattr(record, 'line_number_list')))
 
 
 class CombiningLoggerAdapter(logging.LoggerAdapter):
@@ -228,20 +378,27 @@ class PortalInstance(object):
 
     This holds a number of dictionaries representing the particular
     datatypes queried from the portal, each of which may be None
-    if the checks are to be skipped.
+    if the checks are to be skipped. The gene symbol and alias maps are
+    stored as a compact GeneIndex.
     """
 
-    def __init__(self, cancer_type_dict, hugo_entrez_map, alias_entrez_map):
-        """Represent a portal instance with the given dictionaries."""
+    def __init__(self, cancer_type_dict, hugo_entrez_map, alias_entrez_map,
+                 gene_index=None):
+        """Represent a portal instance with the given dictionaries.
+
+        The gene maps are not kept, but indexed unless a GeneIndex of them is
+        given. Gene checks are skipped if `hugo_entrez_map` or
+        `alias_entrez_map` is None and no index is given.
+        """
         self.cancer_type_dict = cancer_type_dict
-        self.hugo_entrez_map = hugo_entrez_map
-        self.alias_entrez_map = alias_entrez_map
-        self.entrez_set = set()
-        for entrez_map in (hugo_entrez_map, alias_entrez_map):
-            if entrez_map is not None:
-                for entrez_list in entrez_map.values():
-                    for entrez_id in entrez_list:
-                        self.entrez_set.add(entrez_id)
+        if (gene_index is None and
+                hugo_entrez_map is not None and
+                alias_entrez_map is not None):
+            gene_index = GeneIndex.from_maps(hugo_entrez_map,
+                                             alias_entrez_map)
+        self.gene_index = gene_index
+        # outcomes of gene identification, shared by all validators
+        self.gene_resolution_cache = GeneResolutionCache()
         #Set defaults for genome version and species
         self.species = 'human'
         self.ncbi_build = '37'
@@ -265,6 +422,488 @@ class PortalInstance(object):
     def load_genome_info_from_arg(self, args):
         self.species, self.ncbi_build, self.genome_build = args.species, args.ncbi_build, args.genome_build
 
+    def get_fingerprint(self):
+        """Return a hash of the portal information validation depends on."""
+        if self.gene_index is None:
+            gene_fingerprint = None
+        else:
+            gene_fingerprint = self.gene_index.get_fingerprint()
+        return hashlib.sha1(json.dumps(
+            [self.cancer_type_dict,
+             gene_fingerprint,
+             self.species,
+             self.ncbi_build,
+             self.genome_build],
+            sort_keys=True)).hexdigest()
+
+
+class GeneIndex(object):
+
+    """Compact, read-only index of the gene symbols and aliases of a portal.
+
+    All data is kept in a single buffer, which can be a string or a read-only
+    memory map of a file written by save(), so that processes can share it.
+    The buffer consists of a header followed by arrays of 32-bit integers:
+    the offsets of the UTF-8 encoded symbols in the string of all symbols,
+    the CSR-style offsets and values of the Entrez gene ids that each symbol
+    is the Hugo symbol or an alias of, the sorted set of all Entrez gene ids
+    and two open-addressing hash tables pointing into the symbols and the
+    Entrez gene ids, followed by the string of all symbols. Entrez gene ids
+    are normalized to integers.
+    """
+
+    MAGIC = 'CBGI'
+    FORMAT_VERSION = 1
+    # magic, version, the numbers of symbols, Hugo symbol values, alias
+    # values and distinct Entrez gene ids, the sizes of the two hash tables
+    # and the number of bytes of the symbol string
+    HEADER = struct.Struct('<4s8I')
+    INT32 = struct.Struct('<i')
+    INT32_PAIR = struct.Struct('<2i')
+    # marks an empty slot in the hash tables
+    EMPTY_SLOT = -1
+
+    def __init__(self, buffer, filename=None):
+        """Read the header of an index in `buffer`, as built by from_maps().
+
+        If the buffer is a memory map of a file, `filename` should be its
+        name, to be used when the index is pickled.
+        """
+        (magic, version, num_symbols, num_hugo_values, num_alias_values,
+         num_entrez_ids, symbol_table_size, entrez_table_size,
+         symbol_string_length) = self.HEADER.unpack_from(buffer, 0)
+        if magic != self.MAGIC or version != self.FORMAT_VERSION:
+            raise ValueError('Not a gene index of format version {}'.format(
+                                 self.FORMAT_VERSION))
+        self.buffer = buffer
+        self.filename = filename
+        self.num_symbols = num_symbols
+        self.num_entrez_ids = num_entrez_ids
+        self._symbol_table_mask = symbol_table_size - 1
+        self._entrez_table_mask = entrez_table_size - 1
+        self._entrez_table_shift = 32 - (entrez_table_size.bit_length() - 1)
+        array_starts = []
+        offset = self.HEADER.size
+        for length in (num_symbols + 1, num_symbols + 1, num_hugo_values,
+                       num_symbols + 1, num_alias_values, num_entrez_ids,
+                       symbol_table_size, entrez_table_size):
+            array_starts.append(offset)
+            offset += 4 * length
+        (self._symbol_offsets_start, self._hugo_offsets_start,
+         self._hugo_values_start, self._alias_offsets_start,
+         self._alias_values_start, self._entrez_ids_start,
+         self._symbol_table_start, self._entrez_table_start) = array_starts
+        self._symbol_string_start = offset
+
+    @staticmethod
+    def _hash_symbol(symbol):
+        """Hash an encoded symbol, consistently across processes."""
+        return zlib.crc32(symbol) & 0xffffffff
+
+    @staticmethod
+    def _hash_entrez_id(entrez_id, shift):
+        """Hash an Entrez gene id to the highest 32 - `shift` bits."""
+        return ((entrez_id * 2654435761) & 0xffffffff) >> shift
+
+    @staticmethod
+    def _get_table_size(num_keys):
+        """Return the power of two to use as a hash table size."""
+        table_size = 2
+        while table_size < 2 * num_keys:
+            table_size *= 2
+        return table_size
+
+    @classmethod
+    def from_maps(cls, hugo_entrez_map, alias_entrez_map):
+        """Index maps from gene symbols and aliases to lists of Entrez ids."""
+        symbol_maps = {}
+        for map_index, entrez_map in enumerate((hugo_entrez_map,
+                                                alias_entrez_map)):
+            for symbol, entrez_list in entrez_map.iteritems():
+                if isinstance(symbol, unicode):
+                    symbol = symbol.encode('utf-8')
+                symbol_maps.setdefault(symbol, ([], []))[map_index].extend(
+                    int(entrez_id) for entrez_id in entrez_list)
+        symbols = sorted(symbol_maps)
+        symbol_offsets = [0]
+        hugo_offsets = [0]
+        hugo_values = []
+        alias_offsets = [0]
+        alias_values = []
+        for symbol in symbols:
+            hugo_ids, alias_ids = symbol_maps[symbol]
+            symbol_offsets.append(symbol_offsets[-1] + len(symbol))
+            hugo_values.extend(hugo_ids)
+            hugo_offsets.append(len(hugo_values))
+            alias_values.extend(alias_ids)
+            alias_offsets.append(len(alias_values))
+        entrez_ids = sorted(set(hugo_values) | set(alias_values))
+        # fill the hash tables using linear probing
+        symbol_table = [cls.EMPTY_SLOT] * cls._get_table_size(len(symbols))
+        mask = len(symbol_table) - 1
+        for symbol_index, symbol in enumerate(symbols):
+            slot = cls._hash_symbol(symbol) & mask
+            while symbol_table[slot] != cls.EMPTY_SLOT:
+                slot = (slot + 1) & mask
+            symbol_table[slot] = symbol_index
+        entrez_table = [cls.EMPTY_SLOT] * cls._get_table_size(len(entrez_ids))
+        mask = len(entrez_table) - 1
+        shift = 32 - (len(entrez_table).bit_length() - 1)
+        for entrez_index, entrez_id in enumerate(entrez_ids):
+            slot = cls._hash_entrez_id(entrez_id, shift)
+            while entrez_table[slot] != cls.EMPTY_SLOT:
+                slot = (slot + 1) & mask
+            entrez_table[slot] = entrez_index
+        symbol_string = ''.join(symbols)
+        parts = [cls.HEADER.pack(cls.MAGIC, cls.FORMAT_VERSION,
+                                 len(symbols), len(hugo_values),
+                                 len(alias_values), len(entrez_ids),
+                                 len(symbol_table), len(entrez_table),
+                                 len(symbol_string))]
+        for int_list in (symbol_offsets, hugo_offsets, hugo_values,
+                         alias_offsets, alias_values, entrez_ids,
+                         symbol_table, entrez_table):
+            parts.append(struct.pack('<{}i'.format(len(int_list)), *int_list))
+        parts.append(symbol_string)
+        return cls(''.join(parts))
+
+    @classmethod
+    def load(cls, filename):
+        """Memory-map an index file written by save(), read-only."""
+        with open(filename, 'rb') as index_file:
+            buffer = mmap.mmap(index_file.fileno(), 0,
+                               access=mmap.ACCESS_READ)
+        return cls(buffer, filename)
+
+    def save(self, filename):
+        """Write the index to a file, to be opened again with load()."""
+        # write to a temporary file first, so as not to leave a partial one
+        temp_filename = '{}.{}.tmp'.format(filename, os.getpid())
+        with open(temp_filename, 'wb') as index_file:
+            index_file.write(self.buffer[:])
+        os.rename(temp_filename, filename)
+
+    def __getstate__(self):
+        """Pickle the name of the index file, or else the whole buffer."""
+        if self.filename is not None:
+            return {'filename': self.filename}
+        return {'buffer': self.buffer}
+
+    def __setstate__(self, state):
+        """Map the index file again, or read the pickled buffer."""
+        if 'filename' in state:
+            self.__init__(GeneIndex.load(state['filename']).buffer,
+                          state['filename'])
+        else:
+            self.__init__(state['buffer'])
+
+    def get_fingerprint(self):
+        """Return a hash of the contents of the index."""
+        return hashlib.sha1(self.buffer[:]).hexdigest()
+
+    def lookup_symbol(self, symbol):
+        """Return the Entrez ids for a symbol, or None if it is not known.
+
+        The result is a tuple of two tuples: the Entrez gene ids of the genes
+        with this Hugo symbol, and those of the genes with it as an alias.
+        """
+        if isinstance(symbol, unicode):
+            symbol = symbol.encode('utf-8')
+        buffer = self.buffer
+        unpack_int32 = self.INT32.unpack_from
+        unpack_int32_pair = self.INT32_PAIR.unpack_from
+        slot = self._hash_symbol(symbol) & self._symbol_table_mask
+        while True:
+            symbol_index, = unpack_int32(
+                buffer, self._symbol_table_start + 4 * slot)
+            if symbol_index == self.EMPTY_SLOT:
+                return None
+            start, end = unpack_int32_pair(
+                buffer, self._symbol_offsets_start + 4 * symbol_index)
+            if (end - start == len(symbol) and
+                    buffer[self._symbol_string_start + start:
+                           self._symbol_string_start + end] == symbol):
+                break
+            slot = (slot + 1) & self._symbol_table_mask
+        entrez_id_lists = []
+        for offsets_start, values_start in (
+                (self._hugo_offsets_start, self._hugo_values_start),
+                (self._alias_offsets_start, self._alias_values_start)):
+            start, end = unpack_int32_pair(
+                buffer, offsets_start + 4 * symbol_index)
+            entrez_id_lists.append(struct.unpack_from(
+                '<{}i'.format(end - start), buffer, values_start + 4 * start))
+        return tuple(entrez_id_lists)
+
+    def has_entrez_id(self, entrez_id):
+        """Tell whether an (integer) Entrez gene id is in the index."""
+        if self.num_entrez_ids == 0:
+            return False
+        buffer = self.buffer
+        unpack_int32 = self.INT32.unpack_from
+        slot = self._hash_entrez_id(entrez_id, self._entrez_table_shift)
+        while True:
+            entrez_index, = unpack_int32(
+                buffer, self._entrez_table_start + 4 * slot)
+            if entrez_index == self.EMPTY_SLOT:
+                return False
+            if unpack_int32(buffer, self._entrez_ids_start +
+                                    4 * entrez_index)[0] == entrez_id:
+                return True
+            slot = (slot + 1) & self._entrez_table_mask
+
+
+def share_gene_index(portal_instance, directory):
+    """Replace the gene index of a portal by a memory map of a file.
+
+    The file is named after the contents of the index, and written to
+    `directory` if it does not exist yet. Processes that unpickle the
+    portal instance will then map the same file.
+    """
+    gene_index = portal_instance.gene_index
+    if gene_index is None or gene_index.filename is not None:
+        return
+    index_filename = os.path.join(
+        directory,
+        'gene_index_{}.bin'.format(gene_index.get_fingerprint()))
+    if not os.path.isfile(index_filename):
+        gene_index.save(index_filename)
+    portal_instance.gene_index = GeneIndex.load(index_filename)
+
+
+class GeneResolutionCache(object):
+
+    """Memo of the outcomes of gene identification for the portal.
+
+    Maps (gene symbol, Entrez gene id) pairs as found in data files to the
+    gene identified and the issues to log, counting hits and misses. At most
+    `max_size` pairs are stored, to bound the memory used for files full of
+    distinct invalid identifiers.
+    """
+
+    def __init__(self, max_size=GENE_RESOLUTION_CACHE_SIZE):
+        """Start with an empty cache and zero counts."""
+        self.max_size = max_size
+        self.resolutions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, gene_key):
+        """Return the stored resolution of a pair, or None if not stored."""
+        resolution = self.resolutions.get(gene_key)
+        if resolution is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return resolution
+
+    def put(self, gene_key, resolution):
+        """Store the resolution of a pair if there is room."""
+        if len(self.resolutions) < self.max_size:
+            self.resolutions[gene_key] = resolution
+
+
+class ValidationCache(object):
+
+    """Persistent store of the log messages of validated data files.
+
+    Entries are kept in an SQLite database, keyed by a hash of everything the
+    validation of a file depends on: the path and content of the data file,
+    as the replayed messages name it, the fields of its meta file, the
+    validator code, the portal information and the study-wide definitions
+    read from the files validated before it. Data
+    files with a known key do not need to be read again, as their collapsed
+    log records can be replayed instead.
+    """
+
+    DB_FILENAME = 'validation_cache.sqlite'
+    # increase when the format of the stored entries changes
+    FORMAT_VERSION = 2
+
+    def __init__(self, cache_dir, portal_instance):
+        """Open or create the cache database in `cache_dir`."""
+        self.connection = sqlite3.connect(
+            os.path.join(cache_dir, self.DB_FILENAME))
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS validated_files ('
+            'cache_key TEXT PRIMARY KEY, '
+            'data_filename TEXT, '
+            'entry BLOB)')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS validated_files_by_name '
+            'ON validated_files (data_filename)')
+        self.connection.commit()
+        self.portal_fingerprint = portal_instance.get_fingerprint()
+        # any change to the validation code invalidates all entries
+        code_hash = hashlib.sha1()
+        for module_filename in (__file__, cbioportal_common.__file__):
+            code_hash.update(cbioportal_common.hash_file(
+                os.path.splitext(module_filename)[0] + '.py'))
+        self.code_version = code_hash.hexdigest()
+
+    def close(self):
+        """Close the cache database."""
+        self.connection.close()
+
+    def get_key(self, validator):
+        """Return the cache key for validating the data file of `validator`.
+
+        The study-wide definitions are read from the module globals, so this
+        should be called right before the file would be validated.
+        """
+        study_definitions = [
+            DEFINED_CANCER_TYPES,
+            _sorted_or_none(DEFINED_SAMPLE_IDS),
+            _sorted_or_none(DEFINED_SAMPLE_ATTRIBUTES),
+            _sorted_or_none(PATIENTS_WITH_SAMPLES)]
+        if os.path.isfile(validator.filename):
+            data_hash = cbioportal_common.hash_file(validator.filename)
+        else:
+            data_hash = None
+        key_hash = hashlib.sha1()
+        for key_part in (self.FORMAT_VERSION,
+                         self.code_version,
+                         validator.__class__.__name__,
+                         sorted(validator.meta_dict.items()),
+                         os.path.abspath(validator.filename),
+                         data_hash,
+                         self.portal_fingerprint,
+                         json.dumps(study_definitions),
+                         validator.relaxed_mode,
+                         validator.max_errors_per_file,
+                         validator.max_errors_per_message):
+            key_hash.update(repr(key_part))
+            key_hash.update('\0')
+        return key_hash.hexdigest()
+
+    def lookup(self, validator):
+        """Return the cache key of a data file and its entry, if cached.
+
+        The entry is a tuple of the record dicts and the state of the
+        validator, or None if the file needs to be validated.
+        """
+        cache_key = self.get_key(validator)
+        row = self.connection.execute(
+            'SELECT entry FROM validated_files WHERE cache_key = ?',
+            (cache_key,)).fetchone()
+        if row is None:
+            return cache_key, None
+        return cache_key, cPickle.loads(zlib.decompress(row[0]))
+
+    def replay(self, validator, entry):
+        """Log the records of a cached entry and restore the validator."""
+        records, cached_state = entry
+        validator.logger.debug('File unchanged since it was last validated, '
+                               'replaying messages from the validation cache')
+        for record_dict in records:
+            validator._replayRecord(record_dict)
+        validator._restoreCachedState(cached_state)
+
+    def record(self, validator, cache_key, validate_function):
+        """Call `validate_function` and store the records it logs.
+
+        The records are collapsed as they would be for output, with a
+        separate handler so that those of other files are not included. All
+        line numbers are kept, for the error file of the runs replaying them.
+        """
+        collecting_handler = RecordCollectingHandler()
+        collapsing_handler = cbioportal_common.CollapsingLogMessageHandler(
+            targets=[collecting_handler], uncapped_fields=['line_number'])
+        validator.logger.logger.addHandler(collapsing_handler)
+        try:
+            validate_function()
+        finally:
+            validator.logger.logger.removeHandler(collapsing_handler)
+        collapsing_handler.flush()
+        entry = (collecting_handler.records, validator._getCachedState())
+        # older entries for the file have been superseded by this one
+        self.connection.execute(
+            'DELETE FROM validated_files WHERE data_filename = ?',
+            (validator.filename,))
+        self.connection.execute(
+            'INSERT OR REPLACE INTO validated_files VALUES (?, ?, ?)',
+            (cache_key,
+             validator.filename,
+             sqlite3.Binary(zlib.compress(
+                 cPickle.dumps(entry, cPickle.HIGHEST_PROTOCOL)))))
+        self.connection.commit()
+
+
+def _sorted_or_none(values):
+    """Return a sorted list of a collection, keeping None as it is."""
+    if values is None:
+        return None
+    return sorted(values)
+
+
+def sniff_tsv_dialect(sample):
+    """Detect the quoting of a tab-delimited file from its first lines.
+
+    Come to the same conclusion as csv.Sniffer().sniff(sample, '\\t'), with
+    quoting set to QUOTE_NONE when no quotes border on a tab, but without
+    counting every character on every line, which takes a while for files
+    with thousands of columns. The lines are tab-delimited if they all have
+    the same, non-zero, number of tabs, or if a quoted field is delimited
+    by tabs, and the quote patterns are only searched for if a quote
+    character begins a field.
+
+    Return a csv.Dialect subclass, or raise csv.Error if the lines are not
+    tab-delimited.
+    """
+    quote_char = ''
+    tab_quoted = False
+    if (('"' in sample or "'" in sample) and
+            QUOTE_OPENING_PATTERN.search(sample)):
+        quote_char, tab_quoted = _find_quoted_fields(sample)
+    if not tab_quoted:
+        tab_counts = set(line.count('\t')
+                         for line in sample.split('\n') if line)
+        if len(tab_counts) != 1 or 0 in tab_counts:
+            raise csv.Error('Could not determine delimiter')
+    # a " is assumed if no quote character is found
+    if quote_char in ('', '"') and not ('\t"' in sample or
+                                        '"\t' in sample):
+        quoting = csv.QUOTE_NONE
+    else:
+        quoting = csv.QUOTE_MINIMAL
+
+    class dialect(csv.Dialect):
+        _name = 'sniffed'
+        delimiter = '\t'
+        quotechar = quote_char or '"'
+        doublequote = True
+        skipinitialspace = False
+        lineterminator = '\r\n'
+    dialect.quoting = quoting
+    return dialect
+
+
+def _find_quoted_fields(sample):
+    """Find quoted fields as csv.Sniffer does.
+
+    Return the most common quote character of the first pattern in
+    QUOTED_FIELD_PATTERNS that matches, or '' if none does, and whether any
+    of its matches is delimited by a tab.
+    """
+    for pattern in QUOTED_FIELD_PATTERNS:
+        matches = list(pattern.finditer(sample))
+        if matches:
+            break
+    else:
+        return '', False
+    quote_counts = {}
+    tab_quoted = False
+    for match in matches:
+        quote = match.group('quote')
+        quote_counts[quote] = quote_counts.get(quote, 0) + 1
+        if match.groupdict().get('delim') == '\t':
+            tab_quoted = True
+    # on a tie, the quote character that comes last in the dict wins
+    quote_char = reduce(
+        lambda a, b: a if quote_counts[a] > quote_counts[b] else b,
+        quote_counts.keys())
+    return quote_char, tab_quoted
+
 
 class Validator(object):
 
@@ -277,16 +916,24 @@ class Validator(object):
     set to True, empty cells in lines below the column header will
     be reported as errors.
 
-    The methods `processTopLines`, `checkHeader`, `checkLine` and `onComplete`
-    may be overridden (calling their superclass methods) to perform any
-    appropriate validation tasks. The superclass `checkHeader` method sets
-    self.cols to the list of column names found in the header of the file
-    and self.numCols to the number of columns.
+    The methods `processTopLines`, `checkHeader`, `checkBlock`, `checkLine`
+    and `onComplete` may be overridden (calling their superclass methods) to
+    perform any appropriate validation tasks. The superclass `checkHeader`
+    method sets self.cols to the list of column names found in the header of
+    the file and self.numCols to the number of columns. The data lines are
+    passed to `checkBlock` in blocks of at most BLOCK_SIZE lines.
+
+    If `shard_pool` is set to a pool of validation worker processes, data
+    files larger than SHARD_SIZE are split into shards checked in parallel.
+    Subclasses that keep track of values across lines must then override
+    `_getShardState` and `_mergeShardState`, or set SHARDABLE to False.
     """
 
     REQUIRED_HEADERS = []
     REQUIRE_COLUMN_ORDER = True
     ALLOW_BLANKS = False
+    BLOCK_SIZE = 1
+    SHARDABLE = True
 
     def __init__(self, study_dir, meta_dict, portal_instance, logger, relaxed_mode):
         """Initialize a validator for a particular data file.
@@ -302,6 +949,9 @@ class Validator(object):
         self.filename = os.path.join(study_dir, meta_dict['data_filename'])
         self.filenameShort = os.path.basename(self.filename)
         self.line_number = 0
+        # line number of the column header, and the number of lines after it
+        self.header_line_number = None
+        self.num_data_lines = None
         self.cols = []
         self.numCols = 0
         self.newlines = ('',)
@@ -317,18 +967,57 @@ class Validator(object):
         self.meta_dict = meta_dict
         self.relaxed_mode = relaxed_mode
         self.fill_in_attr_defs = False
+        self.shard_pool = None
+        # error budget beyond which to stop reading the file (None: no limit)
+        self.max_errors_per_file = None
+        self.max_errors_per_message = None
+        self.error_budget_handler = None
+        # set to True if reading was stopped because of the error budget
+        self.validationAborted = False
 
     def validate(self):
         """Validate the data file."""
         # add a handler to keep track of the number of lines with errors
         self.line_count_handler = LineCountHandler()
         self.logger.logger.addHandler(self.line_count_handler)
+        self._startErrorBudget()
+        resolution_cache = self.portal.gene_resolution_cache
+        hits_before = resolution_cache.hits
+        misses_before = resolution_cache.misses
         try:
             # actually validate the data file
             self._validate_file()
+            if resolution_cache.hits + resolution_cache.misses > \
+                    hits_before + misses_before:
+                self.logger.debug(
+                    'Gene identification cache: %d hits, %d misses',
+                    resolution_cache.hits - hits_before,
+                    resolution_cache.misses - misses_before)
         finally:
+            self._stopErrorBudget()
             self.logger.logger.removeHandler(self.line_count_handler)
 
+    def _startErrorBudget(self):
+        """Start counting errors against the budget, if there is one."""
+        if (self.max_errors_per_file is None and
+                self.max_errors_per_message is None):
+            return
+        self.error_budget_handler = ErrorBudgetHandler(
+            self.filename,
+            self.max_errors_per_file,
+            self.max_errors_per_message)
+        self.logger.logger.addHandler(self.error_budget_handler)
+
+    def _stopErrorBudget(self):
+        """Stop counting errors against the budget."""
+        if self.error_budget_handler is not None:
+            self.logger.logger.removeHandler(self.error_budget_handler)
+
+    def _errorBudgetExceeded(self):
+        """Tell whether the file has had more errors than its budget allows."""
+        return (self.error_budget_handler is not None and
+                self.error_budget_handler.exceeded)
+
     def _validate_file(self):
         """Read through the data file and validate as much as can be parsed."""
 
@@ -341,97 +1030,365 @@ class Validator(object):
             return
         with opened_file as data_file:
 
-            # parse any block of start-of-file comment lines and the tsv header
-            top_comments = []
-            line_number = 0
-            for line_number, line in enumerate(data_file,
-                                               start=line_number + 1):
-                self.line_number = line_number
-                if line.startswith('#'):
-                    top_comments.append(line)
-                else:
-                    header_line = line
-                    # end of the file's header
-                    break
-            # if the loop wasn't broken by a non-commented line
-            else:
-                self.logger.error('No column header or data found in file',
-                                  extra={'line_number': self.line_number})
+            first_data_lines = self._parseFileHeader(data_file)
+            if first_data_lines is None:
+                # the file cannot be parsed, the reason has been logged
                 return
 
-            # parse start-of-file comment lines, if any
-            if not self.processTopLines(top_comments):                
+            if self._shouldValidateInShards(data_file):
+                self._validateShards(data_file.newlines)
+            elif data_file.newlines in ('\n', '\r\n'):
+                # read the data lines from a memory map of the file, which
+                # byte offsets can be found for by splitting on '\n'
+                newlines_found = set([data_file.newlines])
+                self._checkDataRange(self._findDataOffset(),
+                                     os.path.getsize(self.filename),
+                                     self.line_number + 1,
+                                     newlines_found)
+                self.newlines = self._combineNewlines(newlines_found)
+            else:
+                # read through the data lines of the file, passing them on in
+                # blocks of BLOCK_SIZE lines
+                csvreader = csv.reader(itertools.chain(first_data_lines,
+                                                       data_file),
+                                       delimiter='\t',
+                                       quoting=csv.QUOTE_NONE,
+                                       strict=True)
+                self._checkDataLines(csvreader, self.line_number + 1)
+
+                # (tuple of) string(s) of the newlines read (for 'rU' mode files)
+                self.newlines = data_file.newlines
+
+        if self.validationAborted:
+            # the rest of the file was skipped, so it was not parsed entirely
+            self.logger.error(
+                'Validation aborted after %d errors at line %d',
+                self.error_budget_handler.num_errors,
+                self.line_number)
+            return
+
+        # after the entire file has been read
+        self.onComplete()
+
+    def _parseFileHeader(self, data_file):
+        """Parse the comment lines and column header at the start of the file.
+
+        Return the (at most five) data lines read to detect the tsv dialect,
+        or None if the rest of the file cannot be parsed. Afterwards,
+        self.line_number will be the line number of the column header.
+        """
+        # parse any block of start-of-file comment lines and the tsv header
+        top_comments = []
+        line_number = 0
+        for line_number, line in enumerate(data_file,
+                                           start=line_number + 1):
+            self.line_number = line_number
+            if line.startswith('#'):
+                top_comments.append(line)
+            else:
+                header_line = line
+                # end of the file's header
+                break
+        # if the loop wasn't broken by a non-commented line
+        else:
+            self.logger.error('No column header or data found in file',
+                              extra={'line_number': self.line_number})
+            return None
+
+        # parse start-of-file comment lines, if any
+        if not self.processTopLines(top_comments):                
+            self.logger.error(
+                'Invalid header comments, file cannot be parsed')
+            if not self.relaxed_mode:
+                return None
+            else:   
+                self.logger.info('Ignoring missing or invalid header comments. '
+                    'Continuing with validation...')                    
+                self.fill_in_attr_defs = True
+
+        # read five data lines to detect quotes in the tsv file
+        first_data_lines = []
+        for i, line in enumerate(data_file):
+            first_data_lines.append(line)
+            if i >= 4:
+                break
+        sample_content = header_line + ''.join(first_data_lines)
+        try:
+            dialect = sniff_tsv_dialect(sample_content)
+        except csv.Error:
+            self.logger.error('Not a valid tab separated file. Check if all lines have the same number of columns and if all separators are tabs.')
+            return None
+        if not self._checkTsvDialect(dialect):
+            self.logger.error(
+                'Invalid file format, file cannot be parsed')
+            return None
+        # without quotes, fields can be split on tabs without the csv module
+        self._split_on_tabs = dialect.quoting == csv.QUOTE_NONE
+
+        # parse the first non-commented line as the tsv header
+        header_cols = csv.reader(
+                                 [header_line],
+                                 delimiter='\t',
+                                 quoting=csv.QUOTE_NONE,
+                                 strict=True).next()                                             
+        if self.checkHeader(header_cols) > 0:
+            if not self.relaxed_mode:
                 self.logger.error(
-                    'Invalid header comments, file cannot be parsed')
-                if not self.relaxed_mode:
-                    return
-                else:   
-                    self.logger.info('Ignoring missing or invalid header comments. '
-                        'Continuing with validation...')                    
-                    self.fill_in_attr_defs = True
-
-            # read five data lines to detect quotes in the tsv file
-            first_data_lines = []
-            for i, line in enumerate(data_file):
-                first_data_lines.append(line)
-                if i >= 4:
+                    'Invalid column header, file cannot be parsed')                    
+                return None
+            else:
+                self.logger.warning('Ignoring invalid column header. '
+                    'Continuing with validation...')
+
+        self.header_line_number = self.line_number
+        return first_data_lines
+
+    def _checkDataLines(self, csvreader, first_line_number):
+        """Pass the parsed data lines on to checkBlock() in numbered blocks.
+
+        Stop early, setting self.validationAborted, once the error budget of
+        the file has been exceeded.
+        """
+        numbered_lines = enumerate(csvreader, start=first_line_number)
+        while True:
+            line_block = list(itertools.islice(numbered_lines,
+                                               self.BLOCK_SIZE))
+            if not line_block:
+                break
+            self.checkBlock(line_block)
+            if self._errorBudgetExceeded():
+                self.validationAborted = True
+                break
+
+    def _shouldValidateInShards(self, data_file):
+        """Tell whether to split the data lines over the shard pool.
+
+        Only files larger than SHARD_SIZE are split, and only if the part
+        read so far has consistent line breaks that byte offsets can be
+        aligned to.
+        """
+        return (self.shard_pool is not None and
+                self.SHARDABLE and
+                data_file.newlines in ('\n', '\r\n') and
+                os.path.getsize(self.filename) > SHARD_SIZE)
+
+    def _findDataOffset(self):
+        """Return the byte offset of the first line after the column header.
+
+        This assumes the header lines end with '\n' or '\r\n', and that
+        self.line_number is the line number of the column header.
+        """
+        with open(self.filename, 'rb') as data_file:
+            # skip the comment lines and the column header
+            for _ in xrange(self.line_number):
+                data_file.readline()
+            return data_file.tell()
+
+    def _checkDataRange(self, start, end, first_line_number, newlines_found):
+        """Check the data lines between two byte offsets in the file.
+
+        The lines are read by _readDataLines() and passed on to
+        _checkDataLines(). Subclasses may override this method to parse the
+        lines in bulk, as long as they pass any lines they cannot check that
+        way on to checkBlock().
+        """
+        self._checkDataLines(self._readDataLines(start, end, newlines_found),
+                             first_line_number)
+
+    def _readDataLines(self, start, end, newlines_found):
+        """Yield the fields of the lines between two byte offsets in the file.
+
+        The file is memory-mapped and split into lines in chunks, treating
+        line breaks like 'rU' mode does and adding the types found to the set
+        `newlines_found`. Fields are split on tabs, or using the csv module
+        if quotes were detected.
+        """
+        with open(self.filename, 'rb') as data_file:
+            lines = _iter_mapped_lines(data_file, start, end, newlines_found)
+            if self._split_on_tabs:
+                for line in lines:
+                    # like the csv module, return no fields for empty lines
+                    if line:
+                        yield line.split('\t')
+                    else:
+                        yield []
+            else:
+                for fields in csv.reader(lines,
+                                         delimiter='\t',
+                                         quoting=csv.QUOTE_NONE,
+                                         strict=True):
+                    yield fields
+
+    @staticmethod
+    def _combineNewlines(newlines_found):
+        """Mimic the newlines attribute of 'rU' mode files."""
+        newlines = tuple(newline for newline in ('\r', '\n', '\r\n')
+                         if newline in newlines_found)
+        if not newlines:
+            return None
+        if len(newlines) == 1:
+            return newlines[0]
+        return newlines
+
+    def _findShardRanges(self):
+        """Split the data lines of the file into ranges of about SHARD_SIZE.
+
+        Return a list of (start, end) byte offsets, each aligned to the start
+        of a line.
+        """
+        file_size = os.path.getsize(self.filename)
+        with open(self.filename, 'rb') as data_file:
+            shard_starts = [self._findDataOffset()]
+            while shard_starts[-1] + SHARD_SIZE < file_size:
+                data_file.seek(shard_starts[-1] + SHARD_SIZE)
+                # move on to the start of the next line
+                data_file.readline()
+                if data_file.tell() >= file_size:
                     break
-            sample_content = header_line + ''.join(first_data_lines)
-            try:
-                dialect = csv.Sniffer().sniff(sample_content, delimiters='\t')
-            except csv.Error:
-                self.logger.error('Not a valid tab separated file. Check if all lines have the same number of columns and if all separators are tabs.') 
+                shard_starts.append(data_file.tell())
+        return zip(shard_starts, shard_starts[1:] + [file_size])
+
+    def _validateShards(self, header_newlines):
+        """Check the data lines in shards, using the processes of shard_pool.
+
+        Each shard is checked with the header parsed again in a fresh
+        validator, after which its cross-line state is merged into this
+        validator and its log records are replayed in order of the shards.
+        """
+        shard_ranges = self._findShardRanges()
+        self.logger.debug('Validating data lines in %d shards',
+                          len(shard_ranges))
+        # count the lines in each shard to number them from the right offset
+        line_counts = self.shard_pool.map(
+            _count_lines_in_worker,
+            [(self.filename, start, end) for start, end in shard_ranges])
+        tasks = []
+        first_line_number = self.line_number + 1
+        for (start, end), line_count in zip(shard_ranges, line_counts):
+            tasks.append((os.path.dirname(self.filename),
+                          self.__class__.__name__,
+                          self.meta_dict,
+                          self.relaxed_mode,
+                          self.max_errors_per_file,
+                          self.max_errors_per_message,
+                          start, end, first_line_number))
+            first_line_number += line_count
+        newlines_found = set([header_newlines])
+        shard_results = self.shard_pool.imap(_validate_shard_in_worker, tasks)
+        for (start, end), task, (records, shard_state, shard_newlines,
+                                 shard_last_line) in zip(shard_ranges, tasks,
+                                                         shard_results):
+            recheck_lines = self._mergeShardState(shard_state)
+            self._replayShardRecords(records, recheck_lines)
+            if self._errorBudgetExceeded():
+                self.validationAborted = True
                 return
-            # sniffer assumes " if no quote character exists
-            if dialect.quotechar == '"' and not (
-                    dialect.delimiter + '"' in sample_content or
-                    '"' + dialect.delimiter in sample_content):
-                dialect.quoting = csv.QUOTE_NONE
-            if not self._checkTsvDialect(dialect):
-                self.logger.error(
-                    'Invalid file format, file cannot be parsed')
+            newlines_found |= shard_newlines
+            if shard_last_line is not None:
+                # the shard ran out of error budget by itself, but not once
+                # corrected for earlier shards, so check the rest of it here
+                shard_first_line = task[-1]
+                self._checkDataRange(
+                    _find_line_offset(self.filename, start, end,
+                                      shard_last_line - shard_first_line + 1),
+                    end,
+                    shard_last_line + 1,
+                    newlines_found)
+                if self.validationAborted:
+                    return
+        self.line_number = first_line_number - 1
+        self.newlines = self._combineNewlines(newlines_found)
+
+    def _checkShard(self, start, end, first_line_number):
+        """Check the data lines between two byte offsets in the file.
+
+        The header must already have been parsed by _parseFileHeader().
+        Return the set of line breaks found in the shard.
+        """
+        newlines_found = set()
+        # stop early if the shard alone exceeds the error budget of the file
+        self._startErrorBudget()
+        try:
+            self._checkDataRange(start, end, first_line_number,
+                                 newlines_found)
+        finally:
+            self._stopErrorBudget()
+        return newlines_found
+
+    def _getShardState(self):
+        """Return the cross-line state collected while checking a shard.
+
+        Subclasses that remember values across lines should add them to the
+        dictionary returned, and merge them again in _mergeShardState().
+        """
+        return {}
+
+    def _mergeShardState(self, shard_state):
+        """Merge the state of the next shard into that of this validator.
+
+        Return a dictionary mapping the numbers of lines whose messages depend
+        on earlier shards to functions that will be called with the records
+        logged on that line, to log them together with any corrections.
+        """
+        return {}
+
+    def _replayShardRecords(self, records, recheck_lines):
+        """Pass the records of a shard to the logger, rechecking some lines.
+
+        Like checkBlock(), replaying stops after the line on which the error
+        budget of the file is exceeded, leaving self.line_number set to it.
+
+        :param records: record dicts as collected by RecordCollectingHandler
+        :param recheck_lines: dictionary from _mergeShardState()
+        """
+        pending_lines = sorted(recheck_lines)
+        line_records = []
+        for record_dict in records:
+            line_number = record_dict.get('line_number')
+            if (self._errorBudgetExceeded() and
+                    line_number != self.line_number):
+                return
+            while (pending_lines and line_number is not None and
+                    line_number > pending_lines[0]):
+                self.line_number = pending_lines.pop(0)
+                recheck_lines[self.line_number](line_records)
+                line_records = []
+                if self._errorBudgetExceeded():
+                    return
+            if pending_lines and line_number == pending_lines[0]:
+                line_records.append(record_dict)
+            else:
+                self._replayRecord(record_dict)
+                if line_number is not None:
+                    self.line_number = line_number
+        if self._errorBudgetExceeded():
+            return
+        for pending_line in pending_lines:
+            self.line_number = pending_line
+            recheck_lines[pending_line](line_records)
+            line_records = []
+            if self._errorBudgetExceeded():
                 return
 
-            # parse the first non-commented line as the tsv header
-            header_cols = csv.reader(
-                                     [header_line],
-                                     delimiter='\t',
-                                     quoting=csv.QUOTE_NONE,
-                                     strict=True).next()                                             
-            if self.checkHeader(header_cols) > 0:
-                if not self.relaxed_mode:
-                    self.logger.error(
-                        'Invalid column header, file cannot be parsed')                    
-                    return            
-                else:
-                    self.logger.warning('Ignoring invalid column header. '
-                        'Continuing with validation...')
-            
-            # read through the data lines of the file
-            csvreader = csv.reader(itertools.chain(first_data_lines,
-                                                   data_file),
-                                   delimiter='\t',
-                                   quoting=csv.QUOTE_NONE,
-                                   strict=True)
-            for line_number, fields in enumerate(csvreader,
-                                                 start=line_number + 1):
-                self.line_number = line_number
-                if all(x.strip() == '' for x in fields):
-                    self.logger.error(
-                        'Blank line',
-                        extra={'line_number': self.line_number})
-                elif fields[0].startswith('#'):
-                    self.logger.error(
-                        "Data line starting with '#' skipped",
-                        extra={'line_number': self.line_number})
-                else:
-                    self.checkLine(fields)
+    def _replayRecord(self, record_dict):
+        """Log a record collected in a worker process."""
+        self.logger.logger.handle(logging.makeLogRecord(record_dict))
 
-            # (tuple of) string(s) of the newlines read (for 'rU' mode files)
-            self.newlines = data_file.newlines
+    def _getCachedState(self):
+        """Return the results of validation that other files depend on.
 
-        # after the entire file has been read
-        self.onComplete()
+        These are stored in the validation cache along with the log records,
+        to be set again by _restoreCachedState() if the file is unchanged.
+        Subclasses defining values for the rest of the study should add them
+        to the dictionary returned.
+        """
+        return {'fileCouldBeParsed': self.fileCouldBeParsed,
+                'num_data_lines': self.num_data_lines}
+
+    def _restoreCachedState(self, cached_state):
+        """Set the results of validation stored in the validation cache."""
+        self.fileCouldBeParsed = cached_state['fileCouldBeParsed']
+        self.num_data_lines = cached_state['num_data_lines']
 
     def onComplete(self):
         """Perform final validations after all lines have been checked.
@@ -442,6 +1399,7 @@ class Validator(object):
         self._checkLineBreaks()
         # finalize
         self.fileCouldBeParsed = True
+        self.num_data_lines = self.line_number - self.header_line_number
         self.logger.info('Validation of file complete')
         self.logger.info('Read %d lines. '
                          'Lines with warning: %d. Lines with error: %d',
@@ -482,6 +1440,30 @@ class Validator(object):
 
         return num_errors
 
+    def checkBlock(self, line_block):
+        """Check a block of data lines, given as (line number, fields) tuples.
+
+        Blank lines and commented-out lines are reported here, all other lines
+        are passed to checkLine() one by one. Subclasses can override this
+        method to check the block as a whole before calling this superclass
+        method. The rest of the block is skipped once the error budget of
+        the file has been exceeded.
+        """
+        for line_number, fields in line_block:
+            if self._errorBudgetExceeded():
+                break
+            self.line_number = line_number
+            if all(x.strip() == '' for x in fields):
+                self.logger.error(
+                    'Blank line',
+                    extra={'line_number': self.line_number})
+            elif fields[0].startswith('#'):
+                self.logger.error(
+                    "Data line starting with '#' skipped",
+                    extra={'line_number': self.line_number})
+            else:
+                self.checkLine(fields)
+
     def checkLine(self, data):
         """Check data values from a line after the file header.
 
@@ -612,26 +1594,47 @@ class Validator(object):
 
         It will fail to resolve in these cases:
             1. (error) Entrez gene id and gene symbol are both missing (None)
-        If self.portal.hugo_entrez_map and self.portal.alias_entrez_map are
-        defined:
+        If self.portal.gene_index is defined:
             2. (warning) Only one of the identifiers is supplied, and its value
                cannot be found in the portal
             3. (error) The gene symbol maps to multiple Entrez gene ids
             4. (error) The gene alias maps to multiple Entrez gene ids
 
         Furthermore, the function logs a warning in the following cases, if
-        self.portal.hugo_entrez_map and self.portal.alias_entrez_map are
-        defined:
+        self.portal.gene_index is defined:
             1. (warning) Entrez gene id exists, but the gene symbol specified is not
                known to the portal
             2. (warning) Gene symbol and Entrez gene id do not match
             3. (warning) The Hugo gene symbol maps to a single Entrez gene id,
                but is also associated to other genes as an alias.
 
-        Return the Entrez gene id (or gene symbol if the PortalInstance maps are
-        undefined and the mapping step is skipped), or None if no gene could be
-        unambiguously identified.
+        The outcome for each pair is memoized in the gene resolution cache of
+        the portal instance, with the issues to be logged for each line.
+
+        Return the Entrez gene id as an integer (or the identifier given if
+        the PortalInstance maps are undefined and the mapping step is
+        skipped), or None if no gene could be unambiguously identified.
         """
+        resolution_cache = self.portal.gene_resolution_cache
+        resolution = resolution_cache.get((gene_symbol, entrez_id))
+        if resolution is None:
+            resolution = self._resolveGeneIdentification(gene_symbol,
+                                                         entrez_id)
+            resolution_cache.put((gene_symbol, entrez_id), resolution)
+        identified_entrez_id, issues = resolution
+        for issue in issues:
+            self._logGeneIdentificationIssue(*issue)
+        return identified_entrez_id
+
+    def _resolveGeneIdentification(self, gene_symbol, entrez_id):
+        """Resolve a symbol-Entrez pair as described in checkGeneIdentification.
+
+        Return a tuple of the identified gene, or None, and a tuple of the
+        issues found, as (issue code, cause, matched ids) tuples for
+        _logGeneIdentificationIssue().
+        """
+        issues = []
+
         # set to upper, as both maps contain symbols in upper
         if gene_symbol is not None:
             gene_symbol = gene_symbol.upper()
@@ -642,125 +1645,153 @@ class Validator(object):
             except ValueError:
                 entrez_as_int = None
             if entrez_as_int is None:
-                self.logger.warning(
-                    'Entrez gene id is not an integer. '
-                    'This record will not be loaded.',
-                    extra={'line_number': self.line_number,
-                           'cause': entrez_id})
-                return None
+                return None, (('entrez_not_int', entrez_id, None),)
             elif entrez_as_int <= 0:
-                self.logger.error(
-                    'Entrez gene id is non-positive.',
-                    extra={'line_number': self.line_number,
-                           'cause': entrez_id})
-                return None
+                return None, (('entrez_non_positive', entrez_id, None),)
 
         # check whether at least one is present
         if entrez_id is None and gene_symbol is None:
-            self.logger.error(
-                'No Entrez gene id or gene symbol provided for gene.',
-                extra={'line_number': self.line_number})
-            return None
+            return None, (('no_identifier', None, None),)
 
         # if portal information is absent, skip the rest of the checks
-        if (self.portal.hugo_entrez_map is None or
-                self.portal.alias_entrez_map is None):
-            return entrez_id or gene_symbol
+        gene_index = self.portal.gene_index
+        if gene_index is None:
+            return entrez_id or gene_symbol, ()
 
         # try to use the portal maps to resolve to a single Entrez gene id
         identified_entrez_id = None
         if entrez_id is not None:
-            if entrez_id in self.portal.entrez_set:
+            if gene_index.has_entrez_id(entrez_as_int):
                 # set the value to be returned
-                identified_entrez_id = entrez_id
+                identified_entrez_id = entrez_as_int
                 # some warnings if the gene symbol is specified too
                 if gene_symbol is not None:
-                    if (gene_symbol not in self.portal.hugo_entrez_map and
-                            gene_symbol not in self.portal.alias_entrez_map):
-                        self.logger.warning(
-                            'Entrez gene id exists, but gene symbol specified '
-                            'is not known to the cBioPortal instance. The '
-                            'gene symbol will be ignored. Might be '
-                            'wrong mapping, new or deprecated gene symbol.',
-                            extra={'line_number': self.line_number,
-                                   'cause': gene_symbol})
-                    elif entrez_id not in itertools.chain(
-                            self.portal.hugo_entrez_map.get(gene_symbol, []),
-                            self.portal.alias_entrez_map.get(gene_symbol, [])):
-                        self.logger.warning(
-                            'Entrez gene id and gene symbol do not match. '
-                            'The gene symbol will be ignored. Might be '
-                            'wrong mapping or recycled gene symbol.',
-                            extra={'line_number': self.line_number,
-                                   'cause': '(%s, %s)' % (gene_symbol,
-                                                          entrez_id)})
+                    symbol_entrez_ids = gene_index.lookup_symbol(gene_symbol)
+                    if symbol_entrez_ids is None:
+                        issues.append(
+                            ('symbol_unknown_for_entrez', gene_symbol, None))
+                    elif entrez_as_int not in itertools.chain(
+                            *symbol_entrez_ids):
+                        issues.append(
+                            ('symbol_entrez_mismatch',
+                             '(%s, %s)' % (gene_symbol, entrez_id),
+                             None))
             else:
-                self.logger.warning(
-                    'Entrez gene id not known to the cBioPortal instance. '
-                    'This record will not be loaded. Might be new or deprecated '
-                    'Entrez gene id.',
-                    extra={'line_number': self.line_number,
-                           'cause': entrez_id})
+                issues.append(('entrez_unknown', entrez_id, None))
         # no Entrez gene id, only a gene symbol
         elif gene_symbol is not None:
-            # count canonical gene symbols and aliases that map this symbol to
-            # a gene
-            num_entrezs_for_hugo = len(
-                self.portal.hugo_entrez_map.get(gene_symbol, []))
-            num_entrezs_for_alias = len(
-                self.portal.alias_entrez_map.get(gene_symbol, []))
+            # find the canonical gene symbols and aliases that map this
+            # symbol to a gene
+            hugo_entrez_ids, alias_entrez_ids = \
+                gene_index.lookup_symbol(gene_symbol) or ((), ())
+            num_entrezs_for_hugo = len(hugo_entrez_ids)
+            num_entrezs_for_alias = len(alias_entrez_ids)
             if num_entrezs_for_hugo == 1:
                 # set the value to be returned
-                identified_entrez_id = \
-                    self.portal.hugo_entrez_map[gene_symbol][0]
+                identified_entrez_id = hugo_entrez_ids[0]
                 # check if there are other *different* Entrez gene ids associated
                 # with this gene symbol
                 other_entrez_ids_in_aliases = [
-                    x for x in
-                    self.portal.alias_entrez_map.get(gene_symbol, []) if
+                    x for x in alias_entrez_ids if
                     x != identified_entrez_id]
                 if len(other_entrez_ids_in_aliases) >= 1:
                     # give a warning, as the symbol may have been used to refer
                     # to different entrez_ids over time
-                    self.logger.warning(
-                        'Gene symbol maps to a single Entrez gene id, '
-                        'but is also associated to other genes as an '
-                        'alias. The system will assume the official gene '
-                        'symbol to be the intended one.',
-                        extra={'line_number': self.line_number,
-                               'cause': gene_symbol})
+                    issues.append(('symbol_also_alias', gene_symbol, None))
             elif num_entrezs_for_hugo > 1:
                 # nb: this should actually never occur, see also https://github.com/cBioPortal/cbioportal/issues/799
-                self.logger.error(
-                    'Gene symbol maps to multiple Entrez gene ids (%s), '
-                    'please specify which one you mean.',
-                    '/'.join(self.portal.hugo_entrez_map[gene_symbol]),
-                    extra={'line_number': self.line_number,
-                          'cause': gene_symbol})
+                issues.append(
+                    ('symbol_multiple_entrez',
+                     gene_symbol,
+                     '/'.join(str(x) for x in hugo_entrez_ids)))
             # no canonical symbol, but a single unambiguous alias
             elif num_entrezs_for_alias == 1:
                 # set the value to be returned
-                identified_entrez_id = \
-                    self.portal.alias_entrez_map[gene_symbol][0]
+                identified_entrez_id = alias_entrez_ids[0]
             # no canonical symbol, and multiple different aliases
             elif num_entrezs_for_alias > 1:
-                # Loader deals with this, so give warning
-                # TODO: move matched IDs out of the message for collapsing
-                self.logger.warning(
-                    'Gene alias maps to multiple Entrez gene ids (%s), '
-                    'please specify which one you mean or choose a non-ambiguous symbol.',
-                    '/'.join(self.portal.alias_entrez_map[gene_symbol]),
-                    extra={'line_number': self.line_number,
-                           'cause': gene_symbol})
+                issues.append(
+                    ('alias_multiple_entrez',
+                     gene_symbol,
+                     '/'.join(str(x) for x in alias_entrez_ids)))
             # no canonical symbol and no alias
             else:
-                self.logger.warning(
-                    'Gene symbol not known to the cBioPortal instance. This '
-                    'record will not be loaded.',
-                    extra={'line_number': self.line_number,
-                           'cause': gene_symbol})
+                issues.append(('symbol_unknown', gene_symbol, None))
 
-        return identified_entrez_id
+        return identified_entrez_id, tuple(issues)
+
+    def _logGeneIdentificationIssue(self, issue_code, cause, matched_ids):
+        """Log an issue found by _resolveGeneIdentification() for this line."""
+        if issue_code == 'entrez_not_int':
+            self.logger.warning(
+                'Entrez gene id is not an integer. '
+                'This record will not be loaded.',
+                extra={'line_number': self.line_number,
+                       'cause': cause})
+        elif issue_code == 'entrez_non_positive':
+            self.logger.error(
+                'Entrez gene id is non-positive.',
+                extra={'line_number': self.line_number,
+                       'cause': cause})
+        elif issue_code == 'no_identifier':
+            self.logger.error(
+                'No Entrez gene id or gene symbol provided for gene.',
+                extra={'line_number': self.line_number})
+        elif issue_code == 'symbol_unknown_for_entrez':
+            self.logger.warning(
+                'Entrez gene id exists, but gene symbol specified '
+                'is not known to the cBioPortal instance. The '
+                'gene symbol will be ignored. Might be '
+                'wrong mapping, new or deprecated gene symbol.',
+                extra={'line_number': self.line_number,
+                       'cause': cause})
+        elif issue_code == 'symbol_entrez_mismatch':
+            self.logger.warning(
+                'Entrez gene id and gene symbol do not match. '
+                'The gene symbol will be ignored. Might be '
+                'wrong mapping or recycled gene symbol.',
+                extra={'line_number': self.line_number,
+                       'cause': cause})
+        elif issue_code == 'entrez_unknown':
+            self.logger.warning(
+                'Entrez gene id not known to the cBioPortal instance. '
+                'This record will not be loaded. Might be new or deprecated '
+                'Entrez gene id.',
+                extra={'line_number': self.line_number,
+                       'cause': cause})
+        elif issue_code == 'symbol_also_alias':
+            self.logger.warning(
+                'Gene symbol maps to a single Entrez gene id, '
+                'but is also associated to other genes as an '
+                'alias. The system will assume the official gene '
+                'symbol to be the intended one.',
+                extra={'line_number': self.line_number,
+                       'cause': cause})
+        elif issue_code == 'symbol_multiple_entrez':
+            self.logger.error(
+                'Gene symbol maps to multiple Entrez gene ids (%s), '
+                'please specify which one you mean.',
+                matched_ids,
+                extra={'line_number': self.line_number,
+                      'cause': cause})
+        elif issue_code == 'alias_multiple_entrez':
+            # Loader deals with this, so give warning
+            # TODO: move matched IDs out of the message for collapsing
+            self.logger.warning(
+                'Gene alias maps to multiple Entrez gene ids (%s), '
+                'please specify which one you mean or choose a non-ambiguous symbol.',
+                matched_ids,
+                extra={'line_number': self.line_number,
+                       'cause': cause})
+        elif issue_code == 'symbol_unknown':
+            self.logger.warning(
+                'Gene symbol not known to the cBioPortal instance. This '
+                'record will not be loaded.',
+                extra={'line_number': self.line_number,
+                       'cause': cause})
+        else:
+            raise ValueError('Unknown gene identification issue: {}'.format(
+                issue_code))
 
     def _checkRepeatedColumns(self):
         num_errors = 0
@@ -790,10 +1821,18 @@ class FeaturewiseFileValidator(Validator):
     id of the feature. The method can find the names of the columns recognized
     in the file in self.nonsample_cols. checkValue(self, value, col_index)
     should also be overridden to check a value in a sample column.
+
+    Before checking the values one by one, the sample values of each line
+    are checked as a whole by isValidValueRow(), which subclasses may
+    override or configure with a VALID_ROW_PATTERN. Only the lines not found
+    valid this way are passed on to checkValue(), value by value.
     """
 
     OPTIONAL_HEADERS = []
     REQUIRE_COLUMN_ORDER = False
+    # compiled regular expression matching the tab-separated sample values
+    # of lines known to be valid, or None
+    VALID_ROW_PATTERN = None
 
     def __init__(self, *args, **kwargs):
         super(FeaturewiseFileValidator, self).__init__(*args, **kwargs)
@@ -801,6 +1840,7 @@ class FeaturewiseFileValidator(Validator):
         self.num_nonsample_cols = 0
         self.sampleIds = []
         self._feature_id_lines = {}
+        self._duplicate_feature_lines = {}
 
     def checkHeader(self, cols):
         """Validate the header and read sample IDs from it.
@@ -830,22 +1870,83 @@ class FeaturewiseFileValidator(Validator):
             return
         # skip line with an error if the feature was encountered before
         if feature_id in self._feature_id_lines:
-            self.logger.warning(
-                'Duplicate line for a previously listed feature/gene, '
-                'this line will be ignored.',
-                extra={
-                    'line_number': self.line_number,
-                    'cause': '%s (already defined on line %d)' % (
-                            feature_id,
-                            self._feature_id_lines[feature_id])})
+            self._logDuplicateFeature(feature_id)
             return
         # remember the feature id and check the value for each sample
         self._feature_id_lines[feature_id] = self.line_number
+        self.checkSampleValues(data)
+
+    def _logDuplicateFeature(self, feature_id):
+        """Log that the current line repeats a feature defined before."""
+        self._duplicate_feature_lines[self.line_number] = feature_id
+        self.logger.warning(
+            'Duplicate line for a previously listed feature/gene, '
+            'this line will be ignored.',
+            extra={
+                'line_number': self.line_number,
+                'cause': '%s (already defined on line %d)' % (
+                        feature_id,
+                        self._feature_id_lines[feature_id])})
+
+    def _getShardState(self):
+        """Return the features defined and repeated in the shard."""
+        shard_state = super(FeaturewiseFileValidator, self)._getShardState()
+        shard_state['feature_id_lines'] = self._feature_id_lines
+        shard_state['duplicate_feature_lines'] = self._duplicate_feature_lines
+        return shard_state
+
+    def _mergeShardState(self, shard_state):
+        """Merge the features of a shard, rechecking those seen before."""
+        recheck_lines = super(FeaturewiseFileValidator,
+                              self)._mergeShardState(shard_state)
+        # duplicates within the shard should refer to the first definition
+        for line_number, feature_id in \
+                shard_state['duplicate_feature_lines'].iteritems():
+            if feature_id in self._feature_id_lines:
+                recheck_lines[line_number] = functools.partial(
+                    self._recheckDuplicateFeature, feature_id)
+        for feature_id, line_number in \
+                shard_state['feature_id_lines'].iteritems():
+            if feature_id in self._feature_id_lines:
+                recheck_lines[line_number] = functools.partial(
+                    self._recheckDuplicateFeature, feature_id)
+            else:
+                self._feature_id_lines[feature_id] = line_number
+        return recheck_lines
+
+    def _recheckDuplicateFeature(self, feature_id, line_records):
+        """Log the records of a line repeating a feature from earlier shards.
+
+        Messages about the values are dropped, as the line is ignored.
+        """
+        for record_dict in line_records:
+            if (record_dict['funcName'] == '_logDuplicateFeature' or
+                    record_dict.get('column_number', 0) >
+                    self.num_nonsample_cols):
+                continue
+            self._replayRecord(record_dict)
+        self._logDuplicateFeature(feature_id)
+
+    def checkSampleValues(self, data):
+        """Check the value in each sample column of a data line."""
+        if self.isValidValueRow(data[self.num_nonsample_cols:]):
+            return
         for column_index, value in enumerate(data):
             if column_index >= len(self.nonsample_cols):
                 # checkValue() should be implemented by subclasses
                 self.checkValue(value, column_index)
 
+    def isValidValueRow(self, values):
+        """Tell whether all sample values of a line are known to be valid.
+
+        This quick check of the list of values as a whole need not catch
+        every valid row, as the values of rows not found valid are passed
+        to checkValue() one by one. By default, the values joined by tabs
+        are matched against VALID_ROW_PATTERN, if defined.
+        """
+        return (self.VALID_ROW_PATTERN is not None and
+                self.VALID_ROW_PATTERN.match('\t'.join(values)) is not None)
+
     def parseFeatureColumns(self, nonsample_col_vals):
         """Override to check vals in the non-sample cols and return the id."""
         raise NotImplementedError('The {} class did not provide a method to '
@@ -886,12 +1987,26 @@ class FeaturewiseFileValidator(Validator):
 
 class GenewiseFileValidator(FeaturewiseFileValidator):
 
-    """FeatureWiseValidator that has gene symbol and/or Entrez gene id as feature columns."""
+    """FeatureWiseValidator that has gene symbol and/or Entrez gene id as feature columns.
+
+    If NumPy is available, the sample values in each block of BLOCK_SIZE
+    lines not found valid by isValidValueRow() are first checked all at once
+    by checkValueBlock(), which subclasses may override. Only the values not
+    found valid by this vectorized check are then passed to checkValue() to
+    log any messages.
+    """
 
     REQUIRED_HEADERS = []
     OPTIONAL_HEADERS = ['Hugo_Symbol', 'Entrez_Gene_Id']
     ALLOW_BLANKS = True
     NULL_VALUES = ["NA"]
+    BLOCK_SIZE = 256
+
+    def __init__(self, *args, **kwargs):
+        super(GenewiseFileValidator, self).__init__(*args, **kwargs)
+        # column indices of values to be checked one by one, by line number,
+        # for the lines in the current block that were checked as a whole
+        self._block_invalid_cols = {}
 
     def checkHeader(self, cols):
         """Validate the header and read sample IDs from it.
@@ -938,10 +2053,79 @@ class GenewiseFileValidator(FeaturewiseFileValidator):
                 entrez_id = None
         return self.checkGeneIdentification(hugo_symbol, entrez_id)
 
+    def checkBlock(self, line_block):
+        """Check the sample values of a block as a whole, then each line."""
+        self._block_invalid_cols = self._findInvalidBlockValues(line_block)
+        try:
+            super(GenewiseFileValidator, self).checkBlock(line_block)
+        finally:
+            self._block_invalid_cols = {}
+
+    def checkSampleValues(self, data):
+        """Check only the values not found valid by the block-wise check."""
+        if self.line_number not in self._block_invalid_cols:
+            super(GenewiseFileValidator, self).checkSampleValues(data)
+            return
+        for column_index in self._block_invalid_cols[self.line_number]:
+            self.checkValue(data[column_index], column_index)
+
+    def checkValueBlock(self, values):
+        """Return a boolean array marking which values are known to be valid.
+
+        Override to check a 2D NumPy string array of the sample values in a
+        block of lines. Values not marked as valid will be passed to
+        checkValue(), so this check does not need to catch every valid value.
+        Return None to check all values one by one.
+        """
+        return None
+
+    def _findInvalidBlockValues(self, line_block):
+        """Check a block as a whole and map line numbers to suspect columns.
+
+        Lines not included in the returned dict (such as lines with the
+        wrong number of columns) are to be checked value by value.
+        """
+        if np is None:
+            return {}
+        complete_lines = [(line_number, fields[self.num_nonsample_cols:]) for
+                          line_number, fields in line_block if
+                          len(fields) == self.numCols]
+        if not complete_lines or self.numCols <= self.num_nonsample_cols:
+            return {}
+        # lines found valid as a whole need no further checks
+        invalid_cols = {}
+        suspect_lines = []
+        for line_number, sample_vals in complete_lines:
+            if self.isValidValueRow(sample_vals):
+                invalid_cols[line_number] = []
+            else:
+                suspect_lines.append((line_number, sample_vals))
+        if not suspect_lines:
+            return invalid_cols
+        values = np.array([sample_vals for _, sample_vals in suspect_lines])
+        valid = self.checkValueBlock(values)
+        if valid is None:
+            return invalid_cols
+        for line_number, _ in suspect_lines:
+            invalid_cols[line_number] = []
+        for row_index, col_index in zip(*np.nonzero(~valid)):
+            invalid_cols[suspect_lines[row_index][0]].append(
+                self.num_nonsample_cols + int(col_index))
+        return invalid_cols
+
 class CNAValidator(GenewiseFileValidator):
 
     """Sub-class CNA validator."""
     ALLOWED_VALUES = ['-2', '-1', '0', '1', '2'] + GenewiseFileValidator.NULL_VALUES
+    ALLOWED_VALUE_SET = frozenset(ALLOWED_VALUES)
+
+    def checkValueBlock(self, values):
+        """Mark the values that are allowed without stripping whitespace."""
+        return np.in1d(values, self.ALLOWED_VALUES).reshape(values.shape)
+
+    def isValidValueRow(self, values):
+        """Tell whether all values are allowed without stripping whitespace."""
+        return self.ALLOWED_VALUE_SET.issuperset(values)
 
     def checkValue(self, value, col_index):
         """Check a value in a sample column."""
@@ -1040,17 +2224,45 @@ class MutationsExtendedValidator(Validator):
                               'Amino_Acid_Change needs to be present.',
                               extra={'line_number': self.line_number})
             num_errors += 1
-            
+
+        self._compileCheckPlan()
         return num_errors
 
+    def _compileCheckPlan(self):
+        """Look up the columns and checking functions used for each line.
+
+        Sets self._check_plan to a list of (column index, bound checking
+        method) tuples for the columns in CHECK_FUNCTION_MAP found in the
+        file, and the indexes of columns parsed in checkLine() and
+        skipValidation(), which are None for columns not in the file.
+        """
+        def find_column(col_name):
+            if col_name in self.cols:
+                return self.cols.index(col_name)
+            return None
+        self._check_plan = []
+        for col_name in self.CHECK_FUNCTION_MAP:
+            # if optional column was found, validate it
+            if col_name in self.cols:
+                self._check_plan.append(
+                    (self.cols.index(col_name),
+                     getattr(self, self.CHECK_FUNCTION_MAP[col_name])))
+        self._sample_id_col_index = find_column('Tumor_Sample_Barcode')
+        self._hugo_col_index = find_column('Hugo_Symbol')
+        self._entrez_col_index = find_column('Entrez_Gene_Id')
+        self._classification_col_index = find_column('Variant_Classification')
+        self._aa_change_col_indexes = [
+            self.cols.index(aa_col)
+            for aa_col in ('HGVSp_Short', 'Amino_Acid_Change')
+            if aa_col in self.cols]
+
     def checkLine(self, data):
 
         """Each value in each line is checked individually.
 
-        From the column name (stored in self.cols), the
-        corresponding function to check the value is selected from
-        CHECK_FUNCTION_MAP. Will emit a generic warning
-        message if this function returns False. If the function sets
+        The function to check the value in each column was selected from
+        CHECK_FUNCTION_MAP when parsing the header. Will emit a generic
+        warning message if this function returns False. If the function sets
         self.extra_exists to True, self.extra will be used in this
         message.
         """
@@ -1059,38 +2271,29 @@ class MutationsExtendedValidator(Validator):
         if self.skipValidation(data):
             return
 
-        for col_name in self.CHECK_FUNCTION_MAP:
-            # if optional column was found, validate it:
-            if col_name in self.cols:
-                col_index = self.cols.index(col_name)
-                value = data[col_index]
-                # get the checking method for this column if available, or None
-                checking_function = getattr(
-                    self,
-                    self.CHECK_FUNCTION_MAP[col_name])
-                # FIXME: remove the 'data' argument, it's spaghetti
-                if not checking_function(value):
-                    self.printDataInvalidStatement(value, col_index)
-                elif self.extra_exists or self.extra:
-                    raise RuntimeError(('Checking function %s set an error '
-                                        'message but reported no error') %
-                                       checking_function.__name__)
+        for col_index, checking_function in self._check_plan:
+            value = data[col_index]
+            if not checking_function(value):
+                self.printDataInvalidStatement(value, col_index)
+            elif self.extra_exists or self.extra:
+                raise RuntimeError(('Checking function %s set an error '
+                                    'message but reported no error') %
+                                   checking_function.__name__)
 
         # validate Tumor_Sample_Barcode value to make sure it exists in study sample list:
-        sample_id_column_index = self.cols.index('Tumor_Sample_Barcode')
-        value = data[sample_id_column_index]
-        self.checkSampleId(value, column_number=sample_id_column_index + 1)
+        value = data[self._sample_id_col_index]
+        self.checkSampleId(value, column_number=self._sample_id_col_index + 1)
 
         # parse hugo and entrez to validate them together
         hugo_symbol = None
         entrez_id = None
-        if 'Hugo_Symbol' in self.cols:
-            hugo_symbol = data[self.cols.index('Hugo_Symbol')].strip()
+        if self._hugo_col_index is not None:
+            hugo_symbol = data[self._hugo_col_index].strip()
             # treat the empty string or 'Unknown' as a missing value
             if hugo_symbol in ('', 'Unknown'):
                 hugo_symbol = None
-        if 'Entrez_Gene_Id' in self.cols:
-            entrez_id = data[self.cols.index('Entrez_Gene_Id')].strip()
+        if self._entrez_col_index is not None:
+            entrez_id = data[self._entrez_col_index].strip()
             # treat the empty string or 0 as a missing value
             if entrez_id in ('', '0'):
                 entrez_id = None
@@ -1098,14 +2301,12 @@ class MutationsExtendedValidator(Validator):
         self.checkGeneIdentification(hugo_symbol, entrez_id)
 
         # check if a non-blank amino acid change exists for non-splice sites
-        if ('Variant_Classification' not in self.cols or
-                data[self.cols.index('Variant_Classification')] not in (
+        if (self._classification_col_index is None or
+                data[self._classification_col_index] not in (
                         'Splice_Site', )):
             aachange_value_found = False
-            for aa_col in ('HGVSp_Short', 'Amino_Acid_Change'):
-                if (aa_col in self.cols and
-                        data[self.cols.index(aa_col)] not in
-                                self.NULL_AA_CHANGE_VALUES):
+            for aa_col_index in self._aa_change_col_indexes:
+                if data[aa_col_index] not in self.NULL_AA_CHANGE_VALUES:
                     aachange_value_found = True
             if not aachange_value_found:
                 self.logger.warning(
@@ -1224,12 +2425,12 @@ class MutationsExtendedValidator(Validator):
     def skipValidation(self, data):
         """Test whether the mutation is silent and should be skipped."""
         is_silent = False
-        variant_classification = data[self.cols.index('Variant_Classification')]
+        variant_classification = data[self._classification_col_index]
 
-        hugo_symbol = data[self.cols.index('Hugo_Symbol')]
+        hugo_symbol = data[self._hugo_col_index]
         entrez_id = '0'
-        if 'Entrez_Gene_Id' in self.cols:
-            entrez_id = data[self.cols.index('Entrez_Gene_Id')]
+        if self._entrez_col_index is not None:
+            entrez_id = data[self._entrez_col_index]
         if hugo_symbol == 'Unknown' and entrez_id == '0' and variant_classification != 'IGR':
             # the MAF specification documents the use of Unknown and 0 here
             # for intergenic mutations, and since the Variant_Classification
@@ -1313,6 +2514,9 @@ class ClinicalValidator(Validator):
 
     REQUIRE_COLUMN_ORDER = False
     PROP_IS_PATIENT_ATTRIBUTE = None
+    # Used by subclasses to map column names to methods checking their values,
+    # called after the values of all columns have been checked for their type
+    COLUMN_CHECK_FUNCTION_MAP = {}
     NULL_VALUES = ["[not applicable]", "[not available]", "[pending]", "[discrepancy]","[completed]","[null]", "", "na"]
     ALLOW_BLANKS = True
     METADATA_LINES = ('display_name',
@@ -1639,48 +2843,94 @@ class ClinicalValidator(Validator):
                                            'cause': value})
 
             self.defined_attributes.add(col_name)
+
+        self._column_plan = self._compileColumnPlan()
+        self._column_check_plan = [
+            (col_index, getattr(self, self.COLUMN_CHECK_FUNCTION_MAP[col_name]))
+            for col_index, col_name in enumerate(self.cols)
+            if col_name in self.COLUMN_CHECK_FUNCTION_MAP]
         return num_errors
 
+    def _compileColumnPlan(self):
+        """Select the methods to check the value in each column of a line.
+
+        Return a list of (column index, column name, list of methods) tuples,
+        only including the columns that have something to check.
+        """
+        column_plan = []
+        for col_index, col_name in enumerate(self.cols):
+            column_checks = []
+            data_type = None
+            if col_index < len(self.attr_defs):
+                data_type = self.attr_defs[col_index].get('datatype')
+            if data_type == 'NUMBER':
+                column_checks.append(self._checkNumberValue)
+            elif data_type == 'BOOLEAN':
+                column_checks.append(self._checkBooleanValue)
+            # make sure that PATIENT_ID is present
+            if col_name == 'PATIENT_ID':
+                column_checks.append(self._checkPatientIdPresent)
+            if column_checks:
+                column_plan.append((col_index, col_name, column_checks))
+        return column_plan
+
     def checkLine(self, data):
-        """Check the values in a line of data."""
+        """Check the values in a line of data.
+
+        Each value is first checked against the data type of its attribute,
+        after which the methods from COLUMN_CHECK_FUNCTION_MAP are called
+        with the value and column index, in the order of the columns.
+        """
         super(ClinicalValidator, self).checkLine(data)
-        for col_index, col_name in enumerate(self.cols):
+        num_values = len(data)
+        for col_index, col_name, column_checks in self._column_plan:
             # treat cells beyond the end of the line as blanks,
             # super().checkLine() has already logged an error
             value = ''
-            if col_index < len(data):
+            if col_index < num_values:
+                value = data[col_index].strip()
+            for check_function in column_checks:
+                check_function(value, col_index, col_name)
+        for col_index, checking_function in self._column_check_plan:
+            value = ''
+            if col_index < num_values:
                 value = data[col_index].strip()
-            data_type = self.attr_defs[col_index]['datatype']
+            checking_function(value, col_index)
 
-            # if not blank, check if values match the datatype
-            if value.strip().lower() in self.NULL_VALUES:
-                pass
-            elif data_type == 'NUMBER':
-                if not self.checkFloat(value):
-                    self.logger.error(
-                        'Value of numeric attribute is not a real number',
-                        extra={'line_number': self.line_number,
-                               'column_number': col_index + 1,
-                               'column_name': col_name,
-                               'cause': value})
-            elif data_type == 'BOOLEAN':
-                VALID_BOOLEANS = ('TRUE', 'FALSE')
-                if not value in VALID_BOOLEANS:
-                    self.logger.error(
-                        'Value of boolean attribute must be one of [%s]',
-                        ', '.join(VALID_BOOLEANS),
-                        extra={'line_number': self.line_number,
-                               'column_number': col_index + 1,
-                               'column_name': col_name,
-                               'cause': value})
-            # make sure that PATIENT_ID is present
-            if col_name == 'PATIENT_ID':
-                if value.strip().lower() in self.NULL_VALUES:
-                    self.logger.error(
-                        'Missing PATIENT_ID',
-                        extra={'line_number': self.line_number,
-                               'column_number': col_index + 1,
-                               'cause': value})
+    def _checkNumberValue(self, value, col_index, col_name):
+        """Check the value of a numeric attribute, if not blank."""
+        if value.lower() in self.NULL_VALUES:
+            return
+        if not self.checkFloat(value):
+            self.logger.error(
+                'Value of numeric attribute is not a real number',
+                extra={'line_number': self.line_number,
+                       'column_number': col_index + 1,
+                       'column_name': col_name,
+                       'cause': value})
+
+    def _checkBooleanValue(self, value, col_index, col_name):
+        """Check the value of a boolean attribute, if not blank."""
+        if value.lower() in self.NULL_VALUES:
+            return
+        VALID_BOOLEANS = ('TRUE', 'FALSE')
+        if not value in VALID_BOOLEANS:
+            self.logger.error(
+                'Value of boolean attribute must be one of [%s]',
+                ', '.join(VALID_BOOLEANS),
+                extra={'line_number': self.line_number,
+                       'column_number': col_index + 1,
+                       'column_name': col_name,
+                       'cause': value})
+
+    def _checkPatientIdPresent(self, value, col_index, col_name):
+        """Make sure that the PATIENT_ID column is not blank."""
+        if value.lower() in self.NULL_VALUES:
+            self.logger.error(
+                'Missing PATIENT_ID',
+                extra={'line_number': self.line_number,
+                       'column_number': col_index + 1,
+                       'cause': value})
 
 
 class SampleClinicalValidator(ClinicalValidator):
@@ -1689,6 +2939,11 @@ class SampleClinicalValidator(ClinicalValidator):
 
     REQUIRED_HEADERS = ['SAMPLE_ID', 'PATIENT_ID']
     PROP_IS_PATIENT_ATTRIBUTE = '0'
+    # TODO: check the values in the other documented columns
+    COLUMN_CHECK_FUNCTION_MAP = {
+        'SAMPLE_ID': 'checkSampleIdColumn',
+        'PATIENT_ID': 'checkPatientIdColumn'
+    }
 
     def __init__(self, *args, **kwargs):
         """Initialize the validator to track sample ids defined."""
@@ -1696,55 +2951,108 @@ class SampleClinicalValidator(ClinicalValidator):
         self.sample_id_lines = {}
         self.sampleIds = self.sample_id_lines.viewkeys()
         self.patient_ids = set()
+        self._duplicate_sample_lines = {}
 
-    def checkLine(self, data):
-        """Check the values in a line of data."""
-        super(SampleClinicalValidator, self).checkLine(data)
-        for col_index, col_name in enumerate(self.cols):
-            # treat cells beyond the end of the line as blanks,
-            # super().checkLine() has already logged an error
-            value = ''
-            if col_index < len(data):
-                value = data[col_index].strip()
-            if col_name == 'SAMPLE_ID':
-                if value.strip().lower() in self.NULL_VALUES:
-                    self.logger.error(
-                        'Missing SAMPLE_ID',
-                        extra={'line_number': self.line_number,
-                               'column_number': col_index + 1,
-                               'cause': value})
-                    continue
-                if ' ' in value:
-                    self.logger.error(
-                        'White space in SAMPLE_ID is not supported',
-                        extra={'line_number': self.line_number,
-                               'column_number': col_index + 1,
-                               'cause': value})
-                if value in self.sample_id_lines:
-                    if value.startswith('TCGA-'):
-                        self.logger.warning(
-                            'TCGA sample defined twice in clinical file, this '
-                            'line will be ignored assuming truncated barcodes',
-                            extra={
-                                'line_number': self.line_number,
-                                'column_number': col_index + 1,
-                                'cause': '%s (already defined on line %d)' % (
-                                        value,
-                                        self.sample_id_lines[value])})
-                    else:
-                        self.logger.error(
-                            'Sample defined twice in clinical file',
-                            extra={
-                                'line_number': self.line_number,
-                                'column_number': col_index + 1,
-                                'cause': '%s (already defined on line %d)' % (
-                                    value,
-                                    self.sample_id_lines[value])})
-                else:
-                    self.sample_id_lines[value] = self.line_number
-            elif col_name == 'PATIENT_ID':
-                self.patient_ids.add(value)
-            # TODO: check the values in the other documented columns
+    def checkSampleIdColumn(self, value, col_index):
+        """Check and record the sample ID defined on a line."""
+        if value.lower() in self.NULL_VALUES:
+            self.logger.error(
+                'Missing SAMPLE_ID',
+                extra={'line_number': self.line_number,
+                       'column_number': col_index + 1,
+                       'cause': value})
+            return
+        if ' ' in value:
+            self.logger.error(
+                'White space in SAMPLE_ID is not supported',
+                extra={'line_number': self.line_number,
+                       'column_number': col_index + 1,
+                       'cause': value})
+        if value in self.sample_id_lines:
+            self._logDuplicateSample(value, col_index + 1)
+        else:
+            self.sample_id_lines[value] = self.line_number
+
+    def checkPatientIdColumn(self, value, col_index):
+        """Record the patient ID referenced on a line."""
+        self.patient_ids.add(value)
+
+    def _logDuplicateSample(self, sample_id, column_number):
+        """Log that the current line defines a sample defined before."""
+        self._duplicate_sample_lines[self.line_number] = (sample_id,
+                                                          column_number)
+        if sample_id.startswith('TCGA-'):
+            self.logger.warning(
+                'TCGA sample defined twice in clinical file, this '
+                'line will be ignored assuming truncated barcodes',
+                extra={
+                    'line_number': self.line_number,
+                    'column_number': column_number,
+                    'cause': '%s (already defined on line %d)' % (
+                            sample_id,
+                            self.sample_id_lines[sample_id])})
+        else:
+            self.logger.error(
+                'Sample defined twice in clinical file',
+                extra={
+                    'line_number': self.line_number,
+                    'column_number': column_number,
+                    'cause': '%s (already defined on line %d)' % (
+                        sample_id,
+                        self.sample_id_lines[sample_id])})
+
+    def _getShardState(self):
+        """Return the sample and patient IDs encountered in the shard."""
+        shard_state = super(SampleClinicalValidator, self)._getShardState()
+        shard_state['sample_id_lines'] = self.sample_id_lines
+        shard_state['duplicate_sample_lines'] = self._duplicate_sample_lines
+        shard_state['patient_ids'] = self.patient_ids
+        return shard_state
+
+    def _mergeShardState(self, shard_state):
+        """Merge the IDs of a shard, rechecking samples seen before."""
+        recheck_lines = super(SampleClinicalValidator,
+                              self)._mergeShardState(shard_state)
+        self.patient_ids |= shard_state['patient_ids']
+        # duplicates within the shard should refer to the first definition
+        for line_number, (sample_id, column_number) in \
+                shard_state['duplicate_sample_lines'].iteritems():
+            if sample_id in self.sample_id_lines:
+                recheck_lines[line_number] = functools.partial(
+                    self._recheckDuplicateSample, sample_id, column_number)
+        for sample_id, line_number in \
+                shard_state['sample_id_lines'].iteritems():
+            if sample_id in self.sample_id_lines:
+                recheck_lines[line_number] = functools.partial(
+                    self._recheckDuplicateSample, sample_id,
+                    self.cols.index('SAMPLE_ID') + 1)
+            else:
+                # update in place, self.sampleIds is a view of the keys
+                self.sample_id_lines[sample_id] = line_number
+        return recheck_lines
+
+    def _getCachedState(self):
+        """Return the attributes and IDs defined for the rest of the study."""
+        cached_state = super(SampleClinicalValidator, self)._getCachedState()
+        cached_state['defined_attributes'] = self.defined_attributes
+        cached_state['sample_id_lines'] = self.sample_id_lines
+        cached_state['patient_ids'] = self.patient_ids
+        return cached_state
+
+    def _restoreCachedState(self, cached_state):
+        """Set the attributes and IDs defined for the rest of the study."""
+        super(SampleClinicalValidator, self)._restoreCachedState(cached_state)
+        self.defined_attributes = cached_state['defined_attributes']
+        # update in place, self.sampleIds is a view of the keys
+        self.sample_id_lines.update(cached_state['sample_id_lines'])
+        self.patient_ids = cached_state['patient_ids']
+
+    def _recheckDuplicateSample(self, sample_id, column_number, line_records):
+        """Log the records of a line defining a sample from earlier shards."""
+        for record_dict in line_records:
+            if record_dict['funcName'] != '_logDuplicateSample':
+                self._replayRecord(record_dict)
+        self._logDuplicateSample(sample_id, column_number)
 
 
 class PatientClinicalValidator(ClinicalValidator):
@@ -1753,15 +3061,29 @@ class PatientClinicalValidator(ClinicalValidator):
 
     REQUIRED_HEADERS = ['PATIENT_ID']
     PROP_IS_PATIENT_ATTRIBUTE = '1'
+    COLUMN_CHECK_FUNCTION_MAP = {
+        'PATIENT_ID': 'checkPatientIdColumn',
+        'OS_STATUS': 'checkOsStatusColumn',
+        'DFS_STATUS': 'checkDfsStatusColumn'
+    }
 
     def __init__(self, *args, **kwargs):
         """Initialize the validator to track patient IDs referenced."""
         super(PatientClinicalValidator, self).__init__(*args, **kwargs)
         self.patient_id_lines = {}
+        self._duplicate_patient_lines = {}
 
     def checkHeader(self, cols):
         """Validate headers in patient-specific clinical data files."""
         num_errors = super(PatientClinicalValidator, self).checkHeader(cols)
+        # columns used to check the survival data on each line
+        self._os_status_col_indexes = [
+            col_index for col_index, col_name in enumerate(self.cols)
+            if col_name == 'OS_STATUS']
+        self._os_months_col_index = None
+        if 'OS_MONTHS' in self.cols:
+            self._os_months_col_index = (
+                len(self.cols) - 1 - self.cols[::-1].index('OS_MONTHS'))
         # do not allow the SAMPLE_ID column in this file
         if 'SAMPLE_ID' in self.cols:
             self.logger.error(
@@ -1792,64 +3114,19 @@ class PatientClinicalValidator(ClinicalValidator):
     def checkLine(self, data):
         """Check the values in a line of data."""
         super(PatientClinicalValidator, self).checkLine(data)
-        osstatus_is_deceased = False
-        osmonths_value = None
-        for col_index, col_name in enumerate(self.cols):
-            # treat cells beyond the end of the line as blanks,
-            # super().checkLine() has already logged an error
-            value = ''
+
+        # treat cells beyond the end of the line as blanks,
+        # super().checkLine() has already logged an error
+        def get_value(col_index):
             if col_index < len(data):
-                value = data[col_index].strip()
-            if col_name == 'PATIENT_ID':
-                if ' ' in value:
-                    self.logger.error(
-                        'White space in PATIENT_ID is not supported',
-                        extra={'line_number': self.line_number,
-                               'column_number': col_index + 1,
-                               'cause': value})
-                if value in self.patient_id_lines:
-                    self.logger.error(
-                        'Patient defined multiple times in file',
-                        extra={
-                            'line_number': self.line_number,
-                            'column_number': self.cols.index('PATIENT_ID') + 1,
-                            'cause': '%s (already defined on line %d)' % (
-                                    value,
-                                    self.patient_id_lines[value])})
-                else:
-                    self.patient_id_lines[value] = self.line_number
-                    if value not in PATIENTS_WITH_SAMPLES:
-                        self.logger.warning(
-                            'Clinical data defined for a patient with '
-                            'no samples',
-                            extra={'line_number': self.line_number,
-                                   'column_number': col_index + 1,
-                                   'cause': value})
-            elif col_name == 'OS_STATUS':
-                if value == 'DECEASED':
-                    osstatus_is_deceased = True
-                elif (value.lower() not in self.NULL_VALUES and
-                        value not in ('LIVING', 'DECEASED')):
-                    self.logger.error(
-                            'Value in OS_STATUS column is not LIVING or '
-                            'DECEASED',
-                            extra={'line_number': self.line_number,
-                                   'column_number': col_index + 1,
-                                   'cause': value})
-            elif col_name == 'DFS_STATUS':
-                if (value.lower() not in self.NULL_VALUES and
-                        value not in ('DiseaseFree',
-                                      'Recurred/Progressed',
-                                      'Recurred',
-                                      'Progressed')):
-                    self.logger.error(
-                            'Value in DFS_STATUS column is not DiseaseFree, '
-                            'Recurred/Progressed, Recurred or Progressed',
-                            extra={'line_number': self.line_number,
-                                   'column_number': col_index + 1,
-                                   'cause': value})
-            elif col_name == 'OS_MONTHS':
-                osmonths_value = value
+                return data[col_index].strip()
+            return ''
+        osstatus_is_deceased = any(
+            get_value(col_index) == 'DECEASED'
+            for col_index in self._os_status_col_indexes)
+        osmonths_value = None
+        if self._os_months_col_index is not None:
+            osmonths_value = get_value(self._os_months_col_index)
 
         if osstatus_is_deceased and (
                     osmonths_value is None or
@@ -1863,6 +3140,105 @@ class PatientClinicalValidator(ClinicalValidator):
                 extra={'line_number': self.line_number,
                        'cause': osmonths_value})
 
+    def checkPatientIdColumn(self, value, col_index):
+        """Check and record the patient ID defined on a line."""
+        if ' ' in value:
+            self.logger.error(
+                'White space in PATIENT_ID is not supported',
+                extra={'line_number': self.line_number,
+                       'column_number': col_index + 1,
+                       'cause': value})
+        if value in self.patient_id_lines:
+            self._logDuplicatePatient(value)
+        else:
+            self.patient_id_lines[value] = self.line_number
+            if value not in PATIENTS_WITH_SAMPLES:
+                self._logPatientWithoutSamples(value, col_index + 1)
+
+    def checkOsStatusColumn(self, value, col_index):
+        """Check the overall survival status on a line."""
+        if (value.lower() not in self.NULL_VALUES and
+                value not in ('LIVING', 'DECEASED')):
+            self.logger.error(
+                    'Value in OS_STATUS column is not LIVING or '
+                    'DECEASED',
+                    extra={'line_number': self.line_number,
+                           'column_number': col_index + 1,
+                           'cause': value})
+
+    def checkDfsStatusColumn(self, value, col_index):
+        """Check the disease free status on a line."""
+        if (value.lower() not in self.NULL_VALUES and
+                value not in ('DiseaseFree',
+                              'Recurred/Progressed',
+                              'Recurred',
+                              'Progressed')):
+            self.logger.error(
+                    'Value in DFS_STATUS column is not DiseaseFree, '
+                    'Recurred/Progressed, Recurred or Progressed',
+                    extra={'line_number': self.line_number,
+                           'column_number': col_index + 1,
+                           'cause': value})
+
+    def _logDuplicatePatient(self, patient_id):
+        """Log that the current line defines a patient defined before."""
+        self._duplicate_patient_lines[self.line_number] = patient_id
+        self.logger.error(
+            'Patient defined multiple times in file',
+            extra={
+                'line_number': self.line_number,
+                'column_number': self.cols.index('PATIENT_ID') + 1,
+                'cause': '%s (already defined on line %d)' % (
+                        patient_id,
+                        self.patient_id_lines[patient_id])})
+
+    def _logPatientWithoutSamples(self, patient_id, column_number):
+        """Log that the current line defines a patient with no samples."""
+        self.logger.warning(
+            'Clinical data defined for a patient with '
+            'no samples',
+            extra={'line_number': self.line_number,
+                   'column_number': column_number,
+                   'cause': patient_id})
+
+    def _getShardState(self):
+        """Return the patient IDs defined and repeated in the shard."""
+        shard_state = super(PatientClinicalValidator, self)._getShardState()
+        shard_state['patient_id_lines'] = self.patient_id_lines
+        shard_state['duplicate_patient_lines'] = self._duplicate_patient_lines
+        return shard_state
+
+    def _mergeShardState(self, shard_state):
+        """Merge the patient IDs of a shard, rechecking those seen before."""
+        recheck_lines = super(PatientClinicalValidator,
+                              self)._mergeShardState(shard_state)
+        # duplicates within the shard should refer to the first definition
+        for line_number, patient_id in \
+                shard_state['duplicate_patient_lines'].iteritems():
+            if patient_id in self.patient_id_lines:
+                recheck_lines[line_number] = functools.partial(
+                    self._recheckDuplicatePatient, patient_id)
+        for patient_id, line_number in \
+                shard_state['patient_id_lines'].iteritems():
+            if patient_id in self.patient_id_lines:
+                recheck_lines[line_number] = functools.partial(
+                    self._recheckDuplicatePatient, patient_id)
+            else:
+                self.patient_id_lines[patient_id] = line_number
+        return recheck_lines
+
+    def _recheckDuplicatePatient(self, patient_id, line_records):
+        """Log the records of a line defining a patient from earlier shards.
+
+        A repeated patient is not checked for having samples, and the error
+        is logged after the other messages about the line.
+        """
+        for record_dict in line_records:
+            if record_dict['funcName'] not in ('_logDuplicatePatient',
+                                               '_logPatientWithoutSamples'):
+                self._replayRecord(record_dict)
+        self._logDuplicatePatient(patient_id)
+
     def onComplete(self):
         """Perform final validations based on the data parsed."""
         for patient_id in PATIENTS_WITH_SAMPLES:
@@ -1885,6 +3261,28 @@ class SegValidator(Validator):
         'num.mark',
         'seg.mean']
     REQUIRE_COLUMN_ORDER = True
+    # overlaps are checked across lines in file order
+    SHARDABLE = False
+
+    # chromosomes by which the 23 and 24 aliases may be referred to
+    CHROMOSOME_ALIASES = {'23': 'X', '24': 'Y'}
+    # segments as stored in temporary files for sorting: sample index,
+    # chromosome index, start, line number and end
+    SEGMENT_RECORD = struct.Struct('<iiqqq')
+    # longest sample ids and chromosome names checked in bulk, as the values
+    # in a chunk are copied to an array as wide as the longest of them
+    MAX_BULK_ID_LENGTH = 256
+    MAX_BULK_CHROM_LENGTH = 8
+
+    # Used for mapping column names to the methods parsing their values.
+    CHECK_FUNCTION_MAP = {
+        'ID': 'checkIdColumn',
+        'chrom': 'checkChromColumn',
+        'loc.start': 'checkPositionColumn',
+        'loc.end': 'checkPositionColumn',
+        'num.mark': 'checkNumMarkColumn',
+        'seg.mean': 'checkSegMeanColumn'
+    }
 
     def __init__(self, *args, **kwargs):
         """Initialize validator to track coverage of the genome."""
@@ -1892,74 +3290,41 @@ class SegValidator(Validator):
         self.chromosome_lengths = self.load_chromosome_lengths(
             self.meta_dict['reference_genome_id'],
             self.logger.logger)
+        self.genome_length = sum(self.chromosome_lengths.values())
         # add 23 and 24 "chromosomes" as aliases to X and Y, respectively:
-        self.chromosome_lengths['23'] = self.chromosome_lengths['X']
-        self.chromosome_lengths['24'] = self.chromosome_lengths['Y']
+        for alias, chrom in self.CHROMOSOME_ALIASES.iteritems():
+            self.chromosome_lengths[alias] = self.chromosome_lengths[chrom]
+        # state of the overlap check, as long as the segments are sorted
+        self._segments_sorted = True
+        self._first_unsorted_line = None
+        self._segment_group = None
+        self._segment_group_last_start = None
+        self._segment_group_max_end = None
+        self._segment_group_max_end_line = None
+        self._seen_segment_groups = set()
+        # number of bases covered by the segments of each sample
+        self._sample_covered_bases = {}
+        # byte offsets of the data lines, if read from a memory map
+        self._data_range = None
+
+    def checkHeader(self, cols):
+        """Validate the header and select the method to parse each column."""
+        num_errors = super(SegValidator, self).checkHeader(cols)
+        self._header_line_number = self.line_number
+        self._column_plan = [
+            (col_index, getattr(self,
+                                self.CHECK_FUNCTION_MAP.get(col_name,
+                                                            'checkUnknownColumn')))
+            for col_index, col_name in enumerate(self.cols)]
+        return num_errors
 
     def checkLine(self, data):
         super(SegValidator, self).checkLine(data)
 
-        parsed_coords = {}
-        for col_index, col_name in enumerate(self.cols):
-            value = data[col_index].strip()
-            if col_name == 'ID':
-                self.checkSampleId(value, column_number=col_index + 1)
-            elif col_name == 'chrom':
-                if value in self.chromosome_lengths:
-                    parsed_coords[col_name] = value
-                else:
-                    self.logger.error(
-                        ('Unknown chromosome, must be one of (%s)' %
-                         '|'.join(self.chromosome_lengths.keys())),
-                        extra={'line_number': self.line_number,
-                               'column_number': col_index + 1,
-                               'cause': value})
-            elif col_name in ('loc.start', 'loc.end'):
-                try:
-                    parsed_coords[col_name] = int(value)
-                except ValueError:
-                    self.logger.error(
-                        'Genomic position is not an integer',
-                        extra={'line_number': self.line_number,
-                               'column_number': col_index + 1,
-                               'cause': value})
-                    # skip further validation specific to this column
-                    continue
-                # 0 is the first base, and loc.end is not part of the segment
-                # 'chrom' has already been read, as column order is fixed
-                if parsed_coords[col_name] < 0 or (
-                        'chrom' in parsed_coords and
-                        parsed_coords[col_name] > self.chromosome_lengths[
-                                                      parsed_coords['chrom']]):
-                    self.logger.warning(
-                        'Genomic position beyond end of chromosome '
-                        '(chr%s:0-%s)',
-                        parsed_coords['chrom'],
-                        self.chromosome_lengths[parsed_coords['chrom']],
-                        extra={'line_number': self.line_number,
-                               'column_number': col_index + 1,
-                               'cause': value})
-                    # not a valid coordinate usable in further validations
-                    del parsed_coords[col_name]
-            elif col_name == 'num.mark':
-                if not self.checkInt(value):
-                    # also check if the value is an int in scientific notation (1e+05) 
-                    if not ("e+" in value and self.checkFloat(value)):
-                        self.logger.error(
-                            'Number of probes is not an integer',
-                            extra={'line_number': self.line_number,
-                                   'column_number': col_index + 1,
-                                   'cause': value})
-            elif col_name == 'seg.mean':
-                if not self.checkFloat(value):
-                    self.logger.error(
-                        'Mean segment copy number is not a number',
-                        extra={'line_number': self.line_number,
-                               'column_number': col_index + 1,
-                               'cause': value})
-            else:
-                raise RuntimeError('Could not validate column type: ' +
-                                   col_name)
+        parsed_coords = {}
+        for col_index, checking_function in self._column_plan:
+            value = data[col_index].strip()
+            checking_function(value, col_index, parsed_coords)
 
         if 'loc.start' in parsed_coords and 'loc.end' in parsed_coords:
             # the convention for genomic coordinates (at least at UCSC) is that
@@ -1977,67 +3342,764 @@ class SegValidator(Validator):
                     extra={'line_number': self.line_number,
                            'cause': '{}-{}'.format(parsed_coords['loc.start'],
                                                    parsed_coords['loc.end'])})
+            elif 'ID' in parsed_coords and 'chrom' in parsed_coords:
+                # check for overlap and add up the genome coverage
+                self._checkSegment(parsed_coords['ID'],
+                                   parsed_coords['chrom'],
+                                   parsed_coords['loc.start'],
+                                   parsed_coords['loc.end'])
+
+    def _checkDataRange(self, start, end, first_line_number, newlines_found):
+        """Check the data lines in bulk, if NumPy is available.
+
+        Each chunk of the file is parsed as an array of bytes, checking the
+        values of all its lines at once. Only the lines failing these checks
+        are split and passed to checkBlock(), to log their issues as usual;
+        the others are checked for overlap by _checkSegmentRun().
+        """
+        # remember where the data lines are, to read them again if unsorted
+        self._data_range = (start, end)
+        if not self._canParseInBulk():
+            super(SegValidator, self)._checkDataRange(
+                start, end, first_line_number, newlines_found)
+            return
+        line_number = first_line_number
+        with open(self.filename, 'rb') as data_file:
+            for chunk in _iter_mapped_chunks(data_file, start, end):
+                line_number = self._checkSegmentChunk(chunk, line_number,
+                                                      newlines_found)
+                if self.validationAborted:
+                    break
+
+    def _canParseInBulk(self):
+        """Tell whether the data lines can be parsed as arrays of bytes."""
+        return (np is not None and self._split_on_tabs and
+                self.cols == self.REQUIRED_HEADERS)
 
-        # TODO check for overlap and low genome coverage
-        # this could be implemented by sorting the segments for a patient
-        # by (chromosome and) start position and checking if the start position
-        # of each segment comes after the end position of the previous one,
-        # meanwhile adding up the number of (non-overlapping) bases covered on
-        # that chromosome in that patient.
+    def _checkSegmentChunk(self, chunk, first_line_number, newlines_found):
+        """Check the lines in a chunk of the file, as checkBlock() would.
+
+        Return the line number of the first line after the chunk.
+        """
+        parsed_chunk = self._parseSegmentChunk(chunk)
+        if parsed_chunk is None:
+            lines = _split_mapped_chunk(chunk, newlines_found)
+            self._checkDataLines(
+                (line.split('\t') if line else [] for line in lines),
+                first_line_number)
+            return first_line_number + len(lines)
+        if '\n' in chunk:
+            newlines_found.add('\r\n' if '\r' in chunk else '\n')
+        (line_starts, line_ends, valid_lines, samples, sample_codes, chroms,
+         chrom_codes, seg_starts, seg_ends) = parsed_chunk
+        num_lines = len(line_starts)
+        line_numbers = np.arange(first_line_number,
+                                 first_line_number + num_lines)
+        # check each run of valid lines in bulk, and the others one by one
+        run_start = 0
+        for line_index in itertools.chain(np.flatnonzero(~valid_lines),
+                                          [num_lines]):
+            if line_index > run_start:
+                run = slice(run_start, line_index)
+                self._checkSegmentRun(line_numbers[run],
+                                      samples, sample_codes[run],
+                                      chroms, chrom_codes[run],
+                                      seg_starts[run], seg_ends[run])
+                self.line_number = int(line_numbers[line_index - 1])
+            if line_index == num_lines:
+                break
+            line = chunk[line_starts[line_index]:line_ends[line_index]]
+            self.checkBlock([(int(line_numbers[line_index]),
+                              line.split('\t') if line else [])])
+            if self._errorBudgetExceeded():
+                self.validationAborted = True
+                break
+            run_start = line_index + 1
+        return first_line_number + num_lines
+
+    def _parseSegmentChunk(self, chunk):
+        """Parse the lines in a chunk of the file, checking their values.
+
+        Return None if the chunk is to be split into lines and checked line
+        by line. Otherwise, return the start and end offsets of the lines
+        in the chunk, a boolean array marking the lines that checkLine()
+        would not log anything for, and the codes of the sample ids, the
+        codes of the chromosomes and the start and end of the segments on
+        these lines, along with the lists of sample ids and chromosome names
+        that the codes refer to.
+        """
+        if '\0' in chunk or ('\r' in chunk and not (
+                chunk.count('\r') == chunk.count('\n') ==
+                chunk.count('\r\n'))):
+            # NUL bytes cannot be told apart from the padding of fixed-width
+            # strings, and lines ending in different ways are split as in
+            # 'rU' mode
+            return None
+        buf = np.frombuffer(chunk, dtype=np.uint8)
+        if not chunk.endswith('\n'):
+            buf = np.append(buf, np.uint8(ord('\n')))
+        line_ends = np.flatnonzero(buf == ord('\n'))
+        line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+        # leave the '\r' of '\r\n' line breaks out of the lines
+        line_ends -= buf[np.maximum(line_ends - 1, 0)] == ord('\r')
+        num_lines = len(line_ends)
+        rows, col_starts, col_ends = self._findSegmentColumns(
+            buf, line_starts, line_ends)
+        (valid, samples, sample_codes, chroms, chrom_codes,
+         seg_starts, seg_ends) = self._checkSegmentColumns(buf, col_starts,
+                                                           col_ends)
+        # spread the values found over all lines, by index in the chunk
+        valid_lines = np.zeros(num_lines, dtype=bool)
+        valid_lines[rows[valid]] = True
+        line_values = []
+        for row_values in (sample_codes, chrom_codes, seg_starts, seg_ends):
+            values = np.zeros(num_lines, dtype=np.int64)
+            values[rows] = row_values
+            line_values.append(values)
+        line_sample_codes, line_chrom_codes, line_seg_starts, line_seg_ends = (
+            line_values)
+        return (line_starts, line_ends, valid_lines,
+                samples, line_sample_codes, chroms, line_chrom_codes,
+                line_seg_starts, line_seg_ends)
+
+    def _findSegmentColumns(self, buf, line_starts, line_ends):
+        """Find the columns of the lines in a chunk of the file.
+
+        Return the indices of the lines with the number of columns expected,
+        and for these lines 2D arrays of the start and end offsets of their
+        columns in the byte array.
+        """
+        num_cols = len(self.cols)
+        tabs = np.flatnonzero(buf == ord('\t'))
+        if len(tabs) == len(line_ends) * (num_cols - 1):
+            # if each line has as many tabs as expected, they are in order
+            row_tabs = tabs.reshape(len(line_ends), num_cols - 1)
+            if (np.all(row_tabs[:, 0] >= line_starts) and
+                    np.all(row_tabs[:, -1] < line_ends)):
+                rows = np.arange(len(line_ends))
+                return (rows,
+                        np.column_stack((line_starts, row_tabs + 1)),
+                        np.column_stack((row_tabs, line_ends)))
+        num_tabs = np.bincount(np.searchsorted(line_ends, tabs),
+                               minlength=len(line_ends))
+        rows = np.flatnonzero(num_tabs == num_cols - 1)
+        first_tabs = np.searchsorted(tabs, line_starts[rows])
+        row_tabs = tabs[first_tabs[:, np.newaxis] + np.arange(num_cols - 1)]
+        col_starts = np.column_stack((line_starts[rows], row_tabs + 1))
+        col_ends = np.column_stack((row_tabs, line_ends[rows]))
+        return rows, col_starts, col_ends
+
+    def _checkSegmentColumns(self, buf, col_starts, col_ends):
+        """Check the values in the columns of lines, all lines at once.
+
+        Return a boolean array marking the lines for which checkLine() would
+        not log anything, and the sample id code, chromosome code, start and
+        end of the segment on each line, along with the lists of the sample
+        ids and chromosome names (aliases resolved) that the codes refer to.
+        Values are only found valid in their usual notation, such as
+        positions without a + sign or surrounding whitespace; checkLine()
+        will decide on values written otherwise.
+        """
+        id_col, chrom_col, start_col, end_col, num_mark_col, seg_mean_col = (
+            self.cols.index(col_name) for col_name in self.REQUIRED_HEADERS)
+        # running counts of the digits, signs, points, exponent characters
+        # and other bytes up to each offset, packed into one integer
+        kind_counts = _running_count(_byte_kind_weights()[buf])
+
+        # sample ids defined in the clinical file, not starting with '#'
+        samples, sample_codes, valid = self._encodeByteColumn(
+            buf, col_starts[:, id_col], col_ends[:, id_col],
+            self.MAX_BULK_ID_LENGTH)
+        defined = np.array([sample_id in DEFINED_SAMPLE_IDS and
+                            not sample_id.startswith('#')
+                            for sample_id in samples], dtype=bool)
+        valid &= defined[sample_codes]
+        # known chromosomes, referred to by their names without aliases
+        chrom_names, chrom_codes, valid_chroms = self._encodeByteColumn(
+            buf, col_starts[:, chrom_col], col_ends[:, chrom_col],
+            self.MAX_BULK_CHROM_LENGTH)
+        valid &= valid_chroms
+        chroms = []
+        chrom_indices = {}
+        chrom_lengths = np.zeros(len(chrom_names), dtype=np.int64)
+        name_codes = np.zeros(len(chrom_names), dtype=np.int64)
+        for name_index, chrom_name in enumerate(chrom_names):
+            chrom = self.CHROMOSOME_ALIASES.get(chrom_name, chrom_name)
+            if chrom not in chrom_indices:
+                chrom_indices[chrom] = len(chroms)
+                chroms.append(chrom)
+            name_codes[name_index] = chrom_indices[chrom]
+            chrom_lengths[name_index] = self.chromosome_lengths.get(
+                chrom_name, -1)
+        valid &= chrom_lengths[chrom_codes] >= 0
+        # positions of up to 18 digits, within the chromosome, start < end
+        seg_bounds = []
+        for col_index in (start_col, end_col):
+            starts = col_starts[:, col_index]
+            ends = col_ends[:, col_index]
+            digits = _count_byte_kinds(kind_counts, starts, ends)[0]
+            valid &= ((digits == ends - starts) &
+                      (digits >= 1) & (digits <= 18))
+            seg_bounds.append(self._parseDecimalColumn(buf, starts, ends))
+        seg_starts, seg_ends = seg_bounds
+        valid &= ((seg_starts < seg_ends) &
+                  (seg_ends <= chrom_lengths[chrom_codes]))
+        # integer numbers of probes, optionally signed
+        starts = col_starts[:, num_mark_col]
+        ends = col_ends[:, num_mark_col]
+        digits, signs, points, exponents, others = _count_byte_kinds(
+            kind_counts, starts, ends)
+        valid &= ((ends - starts <= _MAX_BYTE_KIND_COUNT) &
+                  (digits >= 1) &
+                  (signs == _is_sign_byte(buf[starts])) &
+                  (points + exponents + others == 0))
+        # segment means in decimal or scientific notation
+        starts = col_starts[:, seg_mean_col]
+        ends = col_ends[:, seg_mean_col]
+        digits, signs, points, exponents, others = _count_byte_kinds(
+            kind_counts, starts, ends)
+        valid &= ((ends - starts <= _MAX_BYTE_KIND_COUNT) &
+                  (exponents <= 1) & (others == 0))
+        # split the values with an exponent at its first (and only) character
+        exponent_offsets = np.flatnonzero((buf == ord('e')) |
+                                          (buf == ord('E')))
+        mantissa_ends = ends
+        if len(exponent_offsets) > 0:
+            mantissa_ends = np.where(
+                exponents == 1,
+                exponent_offsets[np.minimum(
+                    np.searchsorted(exponent_offsets, starts),
+                    len(exponent_offsets) - 1)],
+                ends)
+        valid &= _is_number_part(buf, kind_counts, starts, mantissa_ends,
+                                 max_points=1)
+        valid &= (exponents == 0) | _is_number_part(
+            buf, kind_counts, np.minimum(mantissa_ends + 1, ends), ends,
+            max_points=0)
+        return (valid, samples, sample_codes, chroms, name_codes[chrom_codes],
+                seg_starts, seg_ends)
 
     @staticmethod
-    def load_chromosome_lengths(genome_build, logger):
+    def _encodeByteColumn(buf, starts, ends, max_length):
+        """Find the distinct strings in a column of lines in a byte array.
+
+        Return the list of distinct strings, the index into it of the string
+        on each line and a boolean array marking the lines on which the
+        string is not empty, not longer than max_length and not surrounded
+        by whitespace.
+        """
+        lengths = ends - starts
+        valid = (lengths >= 1) & (lengths <= max_length)
+        width = max(1, min(max_length, int(lengths.max()) if len(lengths)
+                           else 0))
+        offsets = starts[:, np.newaxis] + np.arange(width)
+        chars = np.where(offsets < ends[:, np.newaxis],
+                         buf[np.minimum(offsets, len(buf) - 1)],
+                         0).astype(np.uint8)
+        values = np.ascontiguousarray(chars).view('S%d' % width).ravel()
+        # only find the distinct strings among the first of each run of
+        # equal strings, as lines are mostly grouped by sample and chromosome
+        is_run_start = np.ones(len(values), dtype=bool)
+        is_run_start[1:] = values[1:] != values[:-1]
+        strings, run_codes = np.unique(values[is_run_start],
+                                       return_inverse=True)
+        codes = run_codes[np.cumsum(is_run_start) - 1]
+        is_whitespace = np.zeros(256, dtype=bool)
+        is_whitespace[[ord(char) for char in string.whitespace]] = True
+        valid &= ~is_whitespace[buf[starts]]
+        valid &= ~is_whitespace[buf[np.maximum(ends - 1, starts)]]
+        return strings.tolist(), codes, valid
 
-        """Get the length of each chromosome from USCS and return a dict.
+    @staticmethod
+    def _parseDecimalColumn(buf, starts, ends):
+        """Parse a column of unsigned numbers of up to 18 digits.
 
-        The dict will not include unplaced contigs, alternative haplotypes or
-        the mitochondrial chromosome.
+        Values with other characters than digits are parsed as garbage.
+        """
+        width = max(1, min(18, int((ends - starts).max()) if len(starts)
+                           else 0))
+        offsets = ends[:, np.newaxis] - width + np.arange(width)
+        digits = np.where(offsets >= starts[:, np.newaxis],
+                          buf[np.maximum(offsets, 0)].astype(np.int64) -
+                          ord('0'),
+                          0)
+        return digits.dot(10 ** np.arange(width - 1, -1, -1, dtype=np.int64))
+
+    def _checkSegment(self, sample_id, chrom, start, end):
+        """Check a segment for overlap with earlier ones and count coverage.
+
+        This assumes the segments of each sample and chromosome to be listed
+        together, sorted by start position. If they are not, the check is
+        left to _checkUnsortedSegments(), once the whole file has been read.
+        """
+        if not self._segments_sorted:
+            return
+        chrom = self.CHROMOSOME_ALIASES.get(chrom, chrom)
+        segment_group = (sample_id, chrom)
+        if segment_group != self._segment_group:
+            if segment_group in self._seen_segment_groups:
+                self._stopSortedSegmentCheck()
+                return
+            self._seen_segment_groups.add(segment_group)
+            self._segment_group = segment_group
+            self._segment_group_max_end = start
+            self._segment_group_max_end_line = None
+        elif start < self._segment_group_last_start:
+            self._stopSortedSegmentCheck()
+            return
+        self._segment_group_last_start = start
+        if start < self._segment_group_max_end:
+            self._logSegmentOverlap(self.line_number, sample_id, chrom,
+                                    start, end,
+                                    self._segment_group_max_end_line)
+        self._sample_covered_bases[sample_id] = (
+            self._sample_covered_bases.get(sample_id, 0) +
+            max(0, end - max(start, self._segment_group_max_end)))
+        if end > self._segment_group_max_end:
+            self._segment_group_max_end = end
+            self._segment_group_max_end_line = self.line_number
+
+    def _stopSortedSegmentCheck(self):
+        """Leave the overlap check to be done after sorting the segments."""
+        self._segments_sorted = False
+        self._first_unsorted_line = self.line_number
+        self._seen_segment_groups = None
+        self._sample_covered_bases = None
+
+    def _checkSegmentRun(self, line_numbers, samples, sample_codes, chroms,
+                         chrom_codes, starts, ends):
+        """Check consecutive segments as _checkSegment() would one by one.
+
+        The segments are given as arrays, with the sample ids and chromosomes
+        as indices into the lists `samples` and `chroms`. The maximum end
+        of the segments before each segment of the same sample and chromosome
+        is found by a running maximum over all of them, offsetting the ends
+        of each next sample and chromosome to be above all earlier ones.
         """
+        if not self._segments_sorted:
+            return
+        num_segments = len(starts)
+        group_starts = np.flatnonzero(
+            (sample_codes[1:] != sample_codes[:-1]) |
+            (chrom_codes[1:] != chrom_codes[:-1])) + 1
+        group_starts = np.concatenate(([0], group_starts))
+        continued = ((samples[sample_codes[0]], chroms[chrom_codes[0]]) ==
+                     self._segment_group)
+        # find where the segments turn out not to be sorted, if they do
+        unsorted_index = num_segments
+        decreasing = np.flatnonzero(starts[1:] < starts[:-1]) + 1
+        decreasing = decreasing[~np.in1d(decreasing, group_starts)]
+        if len(decreasing) > 0:
+            unsorted_index = decreasing[0]
+        if continued and starts[0] < self._segment_group_last_start:
+            unsorted_index = 0
+        for group_start in group_starts:
+            if group_start >= unsorted_index:
+                break
+            if group_start == 0 and continued:
+                continue
+            segment_group = (samples[sample_codes[group_start]],
+                             chroms[chrom_codes[group_start]])
+            if segment_group in self._seen_segment_groups:
+                unsorted_index = group_start
+                break
+            self._seen_segment_groups.add(segment_group)
+        group_starts = group_starts[group_starts < unsorted_index]
+        if unsorted_index > 0:
+            self._checkSortedSegmentRun(
+                line_numbers[:unsorted_index], samples,
+                sample_codes[:unsorted_index], chroms,
+                chrom_codes[:unsorted_index], starts[:unsorted_index],
+                ends[:unsorted_index], group_starts, continued)
+        if unsorted_index < num_segments:
+            self.line_number = int(line_numbers[unsorted_index])
+            self._stopSortedSegmentCheck()
+
+    def _checkSortedSegmentRun(self, line_numbers, samples, sample_codes,
+                               chroms, chrom_codes, starts, ends,
+                               group_starts, continued):
+        """Check consecutive segments known to be sorted, see above."""
+        num_segments = len(starts)
+        is_group_start = np.zeros(num_segments, dtype=bool)
+        is_group_start[group_starts] = True
+        group_indices = np.cumsum(is_group_start) - 1
+        # the maximum end at the start of each sample and chromosome
+        group_max_ends = starts[group_starts]
+        if continued:
+            group_max_ends[0] = self._segment_group_max_end
+        group_offsets = group_indices * (
+            max(int(ends.max()), int(group_max_ends.max())) + 1)
+        offset_ends = ends + group_offsets
+        offset_ends[group_starts] = (
+            np.maximum(ends[group_starts], group_max_ends) +
+            group_offsets[group_starts])
+        max_ends = np.maximum.accumulate(offset_ends) - group_offsets
+        # the maximum end of the segments before each segment, and its index
+        previous_max_ends = np.empty(num_segments, dtype=np.int64)
+        previous_max_ends[1:] = max_ends[:-1]
+        previous_max_ends[group_starts] = group_max_ends
+        raises_max_end = ends > previous_max_ends
+        max_end_indices = np.maximum.accumulate(
+            np.where(raises_max_end, np.arange(num_segments), -1))
+        previous_max_end_indices = np.empty(num_segments, dtype=np.int64)
+        previous_max_end_indices[1:] = max_end_indices[:-1]
+        previous_max_end_indices[group_starts] = -1
+        for index in np.flatnonzero(starts < previous_max_ends):
+            if previous_max_end_indices[index] >= 0:
+                other_line_number = int(
+                    line_numbers[previous_max_end_indices[index]])
+            else:
+                other_line_number = self._segment_group_max_end_line
+            self._logSegmentOverlap(int(line_numbers[index]),
+                                    samples[sample_codes[index]],
+                                    chroms[chrom_codes[index]],
+                                    int(starts[index]), int(ends[index]),
+                                    other_line_number)
+        covered_bases = np.maximum(
+            0, ends - np.maximum(starts, previous_max_ends))
+        sample_covered_bases = np.bincount(sample_codes,
+                                           weights=covered_bases,
+                                           minlength=len(samples))
+        for sample_code in np.unique(sample_codes):
+            sample_id = samples[sample_code]
+            self._sample_covered_bases[sample_id] = (
+                self._sample_covered_bases.get(sample_id, 0) +
+                int(sample_covered_bases[sample_code]))
+        last = num_segments - 1
+        self._segment_group = (samples[sample_codes[last]],
+                               chroms[chrom_codes[last]])
+        self._segment_group_last_start = int(starts[last])
+        self._segment_group_max_end = int(max_ends[last])
+        if max_end_indices[last] >= 0:
+            self._segment_group_max_end_line = int(
+                line_numbers[max_end_indices[last]])
+
+    def _logSegmentOverlap(self, line_number, sample_id, chrom, start, end,
+                           other_line_number):
+        """Log that a segment overlaps a segment on another line."""
+        self.logger.warning(
+            'Segment overlaps another segment of the same sample',
+            extra={'line_number': line_number,
+                   'cause': '%s chr%s:%d-%d (overlapping line %d)' % (
+                       sample_id, chrom, start, end, other_line_number)})
+
+    def _parseSegment(self, data):
+        """Parse a data line as checkLine() does, without logging anything.
+
+        Return a tuple of the sample id, chromosome, start and end of the
+        segment, or None if checkLine() would not check it for overlap.
+        """
+        if len(data) < self.numCols:
+            return None
+        sample_id = data[self.cols.index('ID')].strip()
+        chrom = data[self.cols.index('chrom')].strip()
+        if sample_id == '' or chrom not in self.chromosome_lengths:
+            return None
+        try:
+            start = int(data[self.cols.index('loc.start')].strip())
+            end = int(data[self.cols.index('loc.end')].strip())
+        except ValueError:
+            return None
+        if not 0 <= start < end <= self.chromosome_lengths[chrom]:
+            return None
+        return sample_id, self.CHROMOSOME_ALIASES.get(chrom, chrom), start, end
 
-        chrom_size_dict = {}
-        chrom_size_url = (
-            'http://hgdownload.cse.ucsc.edu'
-            '/goldenPath/{build}/bigZips/{build}.chrom.sizes').format(
-                build=genome_build)
-        logger.debug("Retrieving chromosome lengths from '%s'",
-                     chrom_size_url)
-        r = requests.get(chrom_size_url)
+    def _iterSortedSegments(self):
+        """Read the segments in the file and yield them in sorted order.
+
+        Segments are yielded as (sample index, chromosome index, start, line
+        number, end) tuples, along with the lists of sample ids and
+        chromosomes that the indices refer to. Runs of SEG_SORT_RUN_SIZE
+        segments are sorted in memory and written to temporary files, which
+        are then merged.
+        """
+        sample_ids = []
+        chromosomes = sorted(set(
+            self.CHROMOSOME_ALIASES.get(chrom, chrom) for
+            chrom in self.chromosome_lengths))
+        run_files = []
         try:
-            r.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            raise IOError('Error retrieving chromosome lengths from UCSC: ' +
-                          e.message)
-        for line in r.text.splitlines():
-            try:
-                # skip comment lines
-                if line.startswith('#'):
-                    continue
-                cols = line.split('\t', 1)
-                if not (len(cols) == 2 and
-                        cols[0].startswith('chr')):
-                    raise IOError()
-                # skip unplaced sequences
-                if cols[0].endswith('_random') or cols[0].startswith('chrUn_'):
-                    continue
-                # skip entries for alternative haplotypes
-                if re.search(r'_hap[0-9]+$', cols[0]):
+            run = []
+            for segment in self._iterSegments(sample_ids, chromosomes):
+                run.append(segment)
+                if len(run) >= SEG_SORT_RUN_SIZE:
+                    run_files.append(self._writeSegmentRun(run))
+                    run = []
+            run.sort()
+            runs = [self._readSegmentRun(run_file) for run_file in run_files]
+            runs.append(iter(run))
+            for segment in heapq.merge(*runs):
+                yield segment, sample_ids, chromosomes
+        finally:
+            for run_file in run_files:
+                run_file.close()
+
+    def _iterSegments(self, sample_ids, chromosomes):
+        """Read the segments that checkLine() checks for overlap, in order.
+
+        The data lines are read again as they were for checkLine(), and
+        parsed in bulk if possible. Segments are yielded as (sample index,
+        chromosome index, start, line number, end) tuples, appending the
+        sample ids to `sample_ids` as they are found.
+        """
+        sample_indices = {}
+        chrom_indices = dict((chrom, i) for i, chrom in enumerate(chromosomes))
+
+        def parse_line_segments(numbered_lines):
+            for line_number, data in numbered_lines:
+                if data and data[0].startswith('#'):
                     continue
-                # skip the mitochondrial chromosome
-                if cols[0] == 'chrM':
+                segment = self._parseSegment(data)
+                if segment is not None:
+                    yield line_number, segment
+
+        def index_segment(line_number, segment):
+            sample_id, chrom, start, end = segment
+            if sample_id not in sample_indices:
+                sample_indices[sample_id] = len(sample_ids)
+                sample_ids.append(sample_id)
+            return (sample_indices[sample_id], chrom_indices[chrom],
+                    start, line_number, end)
+
+        first_line_number = self._header_line_number + 1
+        if self._data_range is None:
+            with open(self.filename, 'rU') as data_file:
+                for _ in xrange(self._header_line_number):
+                    data_file.readline()
+                csvreader = csv.reader(data_file,
+                                       delimiter='\t',
+                                       quoting=csv.QUOTE_NONE,
+                                       strict=True)
+                for line_number, segment in parse_line_segments(
+                        enumerate(csvreader, start=first_line_number)):
+                    yield index_segment(line_number, segment)
+            return
+        start, end = self._data_range
+        if not self._canParseInBulk():
+            for line_number, segment in parse_line_segments(
+                    enumerate(self._readDataLines(start, end, set()),
+                              start=first_line_number)):
+                yield index_segment(line_number, segment)
+            return
+        next_line_number = first_line_number
+        with open(self.filename, 'rb') as data_file:
+            for chunk in _iter_mapped_chunks(data_file, start, end):
+                parsed_chunk = self._parseSegmentChunk(chunk)
+                if parsed_chunk is None:
+                    lines = _split_mapped_chunk(chunk, set())
+                    for line_number, segment in parse_line_segments(
+                            enumerate((line.split('\t') if line else []
+                                       for line in lines),
+                                      start=next_line_number)):
+                        yield index_segment(line_number, segment)
+                    next_line_number += len(lines)
                     continue
+                (line_starts, line_ends, valid_lines, samples, sample_codes,
+                 chroms, chrom_codes, seg_starts, seg_ends) = parsed_chunk
+                line_numbers = np.arange(next_line_number,
+                                         next_line_number + len(line_starts))
+                next_line_number += len(line_starts)
+                # segments on the lines not valid, parsed one by one
+                line_segments = []
+                for line_index in np.flatnonzero(~valid_lines):
+                    line = chunk[line_starts[line_index]:line_ends[line_index]]
+                    line_segments.extend(parse_line_segments(
+                        [(int(line_numbers[line_index]),
+                          line.split('\t') if line else [])]))
+                # index the sample ids in the order they first appear in
+                valid_lines = np.flatnonzero(valid_lines)
+                valid_codes, first_indices = np.unique(
+                    sample_codes[valid_lines], return_index=True)
+                first_appearances = sorted(
+                    zip(line_numbers[valid_lines[first_indices]].tolist(),
+                        [samples[code] for code in valid_codes]) +
+                    [(line_number, segment[0]) for
+                     line_number, segment in line_segments])
+                for _, sample_id in first_appearances:
+                    if sample_id not in sample_indices:
+                        sample_indices[sample_id] = len(sample_ids)
+                        sample_ids.append(sample_id)
+                for line_number, segment in line_segments:
+                    yield index_segment(line_number, segment)
+                # the codes of valid lines, mapped to the indices used here
+                sample_index_map = np.zeros(len(samples), dtype=np.int64)
+                sample_index_map[valid_codes] = [
+                    sample_indices[samples[code]] for code in valid_codes]
+                chrom_index_map = np.array(
+                    [chrom_indices.get(chrom, -1) for chrom in chroms],
+                    dtype=np.int64)
+                for segment in zip(
+                        sample_index_map[sample_codes[valid_lines]].tolist(),
+                        chrom_index_map[chrom_codes[valid_lines]].tolist(),
+                        seg_starts[valid_lines].tolist(),
+                        line_numbers[valid_lines].tolist(),
+                        seg_ends[valid_lines].tolist()):
+                    yield segment
+
+    def _writeSegmentRun(self, run):
+        """Sort a list of segment tuples into an unnamed temporary file."""
+        run.sort()
+        run_file = tempfile.TemporaryFile()
+        pack = self.SEGMENT_RECORD.pack
+        for segment in run:
+            run_file.write(pack(*segment))
+        run_file.seek(0)
+        return run_file
+
+    def _readSegmentRun(self, run_file):
+        """Yield the segment tuples stored by _writeSegmentRun()."""
+        record_size = self.SEGMENT_RECORD.size
+        unpack_from = self.SEGMENT_RECORD.unpack_from
+        while True:
+            chunk = run_file.read(record_size * 4096)
+            if not chunk:
+                break
+            for offset in xrange(0, len(chunk), record_size):
+                yield unpack_from(chunk, offset)
+
+    def _checkUnsortedSegments(self):
+        """Check the overlap and coverage of segments after sorting them.
+
+        Overlaps between segments that were all read before the file turned
+        out not to be sorted have already been logged by _checkSegment(), and
+        are not logged again.
+        """
+        self._sample_covered_bases = {}
+        first_unsorted_line = self._first_unsorted_line
+        segment_group = None
+        for segment, sample_ids, chromosomes in self._iterSortedSegments():
+            sample_index, chrom_index, start, line_number, end = segment
+            if (sample_index, chrom_index) != segment_group:
+                segment_group = (sample_index, chrom_index)
+                max_end = start
+                max_end_line = None
+                # the maximum end of earlier segments seen by _checkSegment()
+                sorted_max_end = start
+            if start < max_end and not (
+                    line_number < first_unsorted_line and
+                    start < sorted_max_end):
+                self._logSegmentOverlap(line_number,
+                                        sample_ids[sample_index],
+                                        chromosomes[chrom_index],
+                                        start, end, max_end_line)
+            sample_id = sample_ids[sample_index]
+            self._sample_covered_bases[sample_id] = (
+                self._sample_covered_bases.get(sample_id, 0) +
+                max(0, end - max(start, max_end)))
+            if end > max_end:
+                max_end = end
+                max_end_line = line_number
+            if line_number < first_unsorted_line and end > sorted_max_end:
+                sorted_max_end = end
+
+    def _checkGenomeCoverage(self):
+        """Report the fraction of the genome covered by each sample."""
+        sample_coverages = [
+            (sample_id,
+             float(self._sample_covered_bases[sample_id]) / self.genome_length)
+            for sample_id in sorted(self._sample_covered_bases)]
+        # warn about all samples before the debug messages, which would
+        # otherwise keep the warnings from being collapsed into one
+        for sample_id, coverage in sample_coverages:
+            if coverage < MIN_SEG_GENOME_COVERAGE:
+                self.logger.warning(
+                    'Segments of sample cover less than %d%% of the genome',
+                    MIN_SEG_GENOME_COVERAGE * 100,
+                    extra={'cause': '%s (%.1f%%)' % (sample_id,
+                                                     coverage * 100)})
+        for sample_id, coverage in sample_coverages:
+            self.logger.debug(
+                'Fraction of the genome covered by the segments of a sample',
+                extra={'cause': '%s: %.3f' % (sample_id, coverage)})
+
+    def onComplete(self):
+        """Check overlap if the segments were not sorted, and coverage."""
+        if not self._segments_sorted:
+            self._checkUnsortedSegments()
+        self._checkGenomeCoverage()
+        super(SegValidator, self).onComplete()
+
+    # These methods check the value in a column of the line, adding
+    # coordinates usable in further validations to parsed_coords.
+
+    def checkIdColumn(self, value, col_index, parsed_coords):
+        self.checkSampleId(value, column_number=col_index + 1)
+        if value != '':
+            parsed_coords['ID'] = value
+
+    def checkChromColumn(self, value, col_index, parsed_coords):
+        if value in self.chromosome_lengths:
+            parsed_coords['chrom'] = value
+        else:
+            self.logger.error(
+                ('Unknown chromosome, must be one of (%s)' %
+                 '|'.join(self.chromosome_lengths.keys())),
+                extra={'line_number': self.line_number,
+                       'column_number': col_index + 1,
+                       'cause': value})
+
+    def checkPositionColumn(self, value, col_index, parsed_coords):
+        col_name = self.cols[col_index]
+        try:
+            parsed_coords[col_name] = int(value)
+        except ValueError:
+            self.logger.error(
+                'Genomic position is not an integer',
+                extra={'line_number': self.line_number,
+                       'column_number': col_index + 1,
+                       'cause': value})
+            # skip further validation specific to this column
+            return
+        # 0 is the first base, and loc.end is not part of the segment
+        # 'chrom' has already been read, as column order is fixed
+        if parsed_coords[col_name] < 0 or (
+                'chrom' in parsed_coords and
+                parsed_coords[col_name] > self.chromosome_lengths[
+                                              parsed_coords['chrom']]):
+            self.logger.warning(
+                'Genomic position beyond end of chromosome '
+                '(chr%s:0-%s)',
+                parsed_coords['chrom'],
+                self.chromosome_lengths[parsed_coords['chrom']],
+                extra={'line_number': self.line_number,
+                       'column_number': col_index + 1,
+                       'cause': value})
+            # not a valid coordinate usable in further validations
+            del parsed_coords[col_name]
+
+    def checkNumMarkColumn(self, value, col_index, parsed_coords):
+        if not self.checkInt(value):
+            # also check if the value is an int in scientific notation (1e+05) 
+            if not ("e+" in value and self.checkFloat(value)):
+                self.logger.error(
+                    'Number of probes is not an integer',
+                    extra={'line_number': self.line_number,
+                           'column_number': col_index + 1,
+                           'cause': value})
+
+    def checkSegMeanColumn(self, value, col_index, parsed_coords):
+        if not self.checkFloat(value):
+            self.logger.error(
+                'Mean segment copy number is not a number',
+                extra={'line_number': self.line_number,
+                       'column_number': col_index + 1,
+                       'cause': value})
+
+    def checkUnknownColumn(self, value, col_index, parsed_coords):
+        raise RuntimeError('Could not validate column type: ' +
+                           self.cols[col_index])
+
+    @staticmethod
+    def load_chromosome_lengths(genome_build, logger):
+
+        """Get the length of each chromosome and return a dict.
+
+        The dict will not include unplaced contigs, alternative haplotypes or
+        the mitochondrial chromosome. The lengths are loaded once per process,
+        from the files bundled with the importer or the database if possible.
+        """
 
-                # remove the 'chr' prefix
-                chrom_name = cols[0][3:]
-                try:
-                    chrom_size = int(cols[1])
-                except ValueError:
-                    raise IOError()
-                chrom_size_dict[chrom_name] = chrom_size
-            except IOError:
-                raise IOError(
-                    "Unexpected response from {url}: {line}".format(
-                        url=chrom_size_url, line=repr(line)))
-        return chrom_size_dict
+        return chromsizes.get_chromosome_lengths(genome_build, logger)
 
 
 class ContinuousValuesValidator(GenewiseFileValidator):
@@ -2045,7 +4107,52 @@ class ContinuousValuesValidator(GenewiseFileValidator):
 
     Allowing missing values indicated by GenewiseFileValidator.NULL_VALUES.
     """
-    
+
+    VALID_ROW_PATTERN = NUMERIC_ROW_PATTERN
+
+    def checkValueBlock(self, values):
+        """Mark the values that NumPy can cast to float, or are null values."""
+        values = np.where(np.in1d(values, self.NULL_VALUES).reshape(
+                              values.shape),
+                          'nan',
+                          values)
+        valid = np.ones(values.shape, dtype=bool)
+        try:
+            values.astype(float)
+        except ValueError:
+            # narrow down which values could not be cast, line by line
+            for row_index in range(values.shape[0]):
+                valid[row_index] = self._find_float_values(values[row_index])
+        return valid
+
+    @classmethod
+    def _find_float_values(cls, values):
+        """Return a boolean array marking the values that cast to float.
+
+        Bisect the 1D array `values` to find the few invalid values in it,
+        without testing every value separately in Python.
+        """
+        try:
+            values.astype(float)
+            return np.ones(values.shape, dtype=bool)
+        except ValueError:
+            pass
+        if len(values) <= 8:
+            return np.array([cls._casts_to_float(value) for value in values],
+                            dtype=bool)
+        middle = len(values) // 2
+        return np.concatenate((cls._find_float_values(values[:middle]),
+                               cls._find_float_values(values[middle:])))
+
+    @staticmethod
+    def _casts_to_float(value):
+        """Check if NumPy can cast a single value to float."""
+        try:
+            np.array([value]).astype(float)
+            return True
+        except ValueError:
+            return False
+
     def checkValue(self, value, col_index):
         """Check a value in a sample column."""
         stripped_value = value.strip()
@@ -2087,6 +4194,7 @@ class RPPAValidator(FeaturewiseFileValidator):
     REQUIRED_HEADERS = ['Composite.Element.REF']
     ALLOW_BLANKS = True
     NULL_VALUES = ["NA"]
+    VALID_ROW_PATTERN = NUMERIC_ROW_PATTERN
 
     def parseFeatureColumns(self, nonsample_col_vals):
         """Check the IDs in the first column."""
@@ -2152,6 +4260,8 @@ class CancerTypeValidator(Validator):
     REQUIRE_COLUMN_ORDER = True
     # check this in the subclass to avoid emitting an error twice
     ALLOW_BLANKS = True
+    # parent types must be defined on an earlier line
+    SHARDABLE = False
 
     COLS = (
         'type_of_cancer',
@@ -2172,6 +4282,17 @@ class CancerTypeValidator(Validator):
         """Check the first uncommented line just like any other data line."""
         return self.checkLine(cols)
 
+    def _getCachedState(self):
+        """Return the cancer types defined for the rest of the study."""
+        cached_state = super(CancerTypeValidator, self)._getCachedState()
+        cached_state['defined_cancer_types'] = self.defined_cancer_types
+        return cached_state
+
+    def _restoreCachedState(self, cached_state):
+        """Set the cancer types defined for the rest of the study."""
+        super(CancerTypeValidator, self)._restoreCachedState(cached_state)
+        self.defined_cancer_types = cached_state['defined_cancer_types']
+
     def checkLine(self, data):
         """Check a data line in a cancer type file."""
         # track whether any errors are emitted while validating this line
@@ -2582,7 +4703,8 @@ class GisticGenesValidator(Validator):
 
 # FIXME: returning simple valid (meta_fn, data_fn) pairs would be cleaner,
 # Validator objects can be instantiated with a portal instance elsewhere
-def process_metadata_files(directory, portal_instance, logger, relaxed_mode):
+def process_metadata_files(directory, portal_instance, logger, relaxed_mode,
+                           study_plan=None):
 
     """Parse the meta files in a directory and create data file validators.
 
@@ -2594,7 +4716,9 @@ def process_metadata_files(directory, portal_instance, logger, relaxed_mode):
         3. the cancer type of the study, and
         4. the study id
 
-    Possible file types are listed in cbioportal_common.MetaFileTypes.
+    Possible file types are listed in cbioportal_common.MetaFileTypes. If
+    `study_plan` is a cbioportal_common.StudyPlan, the valid meta files are
+    added to it.
     """
 
     # get filenames for all meta files in the directory
@@ -2610,6 +4734,7 @@ def process_metadata_files(directory, portal_instance, logger, relaxed_mode):
                     'No meta files found in ' + directory +'. Please make sure the directory '\
                     'is the path to the folder containing the files.')
 
+    schema = cbioportal_common.get_study_schema()
     study_id = None
     study_cancer_type = None
     validators_by_type = {}
@@ -2622,6 +4747,8 @@ def process_metadata_files(directory, portal_instance, logger, relaxed_mode):
             filename, logger, study_id, portal_instance.genome_build)
         if meta_file_type is None:
             continue
+        if study_plan is not None:
+            study_plan.add_meta_file(filename, meta_file_type, meta)
         # validate stable_id to be unique (check can be removed once we deprecate this field):
         if 'stable_id' in meta:
             stable_id = meta['stable_id']
@@ -2653,8 +4780,8 @@ def process_metadata_files(directory, portal_instance, logger, relaxed_mode):
         # create a list for the file type in the dict
         if meta_file_type not in validators_by_type:
             validators_by_type[meta_file_type] = []
-        # check if data_filename is set AND if data_filename is a supported field according to META_FIELD_MAP:
-        if 'data_filename' in meta and 'data_filename' in cbioportal_common.META_FIELD_MAP[meta_file_type]:
+        # check if data_filename is set AND if data_filename is a supported field according to the study schema:
+        if 'data_filename' in meta and 'data_filename' in schema.get_fields(meta_file_type):
             validator_class = globals()[VALIDATOR_IDS[meta_file_type]]
             validator = validator_class(directory, meta,
                                         portal_instance, logger, relaxed_mode)
@@ -2772,43 +4899,200 @@ def validate_defined_caselists(cancer_study_id, case_list_ids, file_types, logge
                 cancer_study_id + '_all')
     # TODO: check for required suffixes based on the defined profiles
 
-def request_from_portal_api(server_url, api_name, logger):
-    """Send a request to the portal API and return the decoded JSON object."""
+def create_portal_session(retries=PORTAL_API_RETRIES,
+                          backoff=PORTAL_API_BACKOFF):
+    """Create a requests session for the portal's web API.
+
+    The session keeps connections alive for reuse, asks for responses to be
+    compressed and retries failed connections and server errors `retries`
+    times, waiting `backoff` seconds times a power of two in between.
+    """
+    session = requests.Session()
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    retry = Retry(total=retries,
+                  backoff_factor=backoff,
+                  status_forcelist=PORTAL_API_RETRY_STATUSES,
+                  raise_on_status=False)
+    adapter = requests.adapters.HTTPAdapter(max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def request_from_portal_api(server_url, api_name, logger, session=None,
+                            timeout=PORTAL_API_TIMEOUT):
+    """Send a request to the portal API and iterate over the JSON array sent.
+
+    The records are decoded as they are downloaded.
+    """
+    response = _get_portal_api_response(server_url, api_name, logger,
+                                        session=session, timeout=timeout)
+    return iter_json_response(response)
+
+
+def iter_json_response(response):
+    """Iterate over the records of a streamed JSON array response."""
+    try:
+        for record in iter_json_array(
+                response.iter_content(JSON_CHUNK_SIZE)):
+            yield record
+    finally:
+        response.close()
+
+
+def _get_portal_api_response(server_url, api_name, logger, headers=None,
+                             session=None, timeout=PORTAL_API_TIMEOUT):
+    """Send a request to the portal API and return the response object.
+
+    The body of the response is not downloaded until it is read. The request
+    is sent through `session` if given, and times out after `timeout`
+    seconds without a response.
+    """
     service_url = server_url + '/api-legacy/' + api_name
     logger.debug("Requesting %s from portal at '%s'",
                 api_name, server_url)
+    if session is None:
+        session = requests
     # this may raise a requests.exceptions.RequestException subclass,
     # usually because the URL provided on the command line was invalid or
     # did not include the http:// part
-    response = requests.get(service_url)
+    response = session.get(service_url, headers=headers, stream=True,
+                           timeout=timeout)
     try:
         response.raise_for_status()
     except requests.exceptions.HTTPError as e:
+        response.close()
         raise IOError(
             'Connection error for URL: {url}. Administrator: please check if '
             '[{url}] is accessible. Message: {msg}'.format(url=service_url,
                                                            msg=e.message))
-    return response.json()
+    return response
+
+
+class PortalInfoCache(object):
+
+    """Local copy of the information retrieved from a portal's web API.
+
+    The data of each API is stored as transformed by load_portal_info(), in
+    a pickle file per server in `cache_dir`. It is used as it is for `ttl`
+    seconds after it was last checked, after which the server is asked if it
+    has changed, using the ETag and Last-Modified headers it sent. If the
+    server cannot be reached, the cached data is used regardless.
+    """
+
+    # increase when the format of the stored data changes
+    FORMAT_VERSION = 1
+
+    def __init__(self, cache_dir, server_url, ttl=PORTAL_INFO_TTL):
+        """Load the information cached for `server_url`, if any."""
+        self.server_url = server_url
+        self.ttl = ttl
+        self.filename = os.path.join(
+            cache_dir,
+            'portal_info_{}.pickle'.format(
+                hashlib.sha1(server_url).hexdigest()))
+        self.entries = {}
+        self.changed = False
+        try:
+            with open(self.filename, 'rb') as cache_file:
+                format_version, entries = cPickle.load(cache_file)
+        except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+            # no (usable) cache file yet
+            return
+        if format_version == self.FORMAT_VERSION:
+            self.entries = entries
+
+    def get(self, api_name, transform_function, logger, session=None,
+            timeout=PORTAL_API_TIMEOUT):
+        """Return the transformed data of an API, downloading it if needed.
+
+        Requests are sent through `session` if given, with a timeout of
+        `timeout` seconds.
+        """
+        entry = self.entries.get(api_name)
+        if entry is not None and time.time() - entry['checked'] < self.ttl:
+            logger.debug("Using cached %s of portal at '%s'",
+                         api_name, self.server_url)
+            return entry['data']
+        headers = {}
+        if entry is not None:
+            if entry['etag'] is not None:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified'] is not None:
+                headers['If-Modified-Since'] = entry['last_modified']
+        try:
+            response = _get_portal_api_response(self.server_url, api_name,
+                                                logger, headers,
+                                                session=session,
+                                                timeout=timeout)
+            if response.status_code == 304:
+                response.close()
+                logger.debug('Cached %s still up to date', api_name)
+                entry['checked'] = time.time()
+                self.changed = True
+                return entry['data']
+            # the data is transformed while it is being downloaded
+            data = iter_json_response(response)
+            if transform_function is not None:
+                data = transform_function(data)
+            else:
+                data = list(data)
+        except (requests.exceptions.RequestException, IOError,
+                ValueError) as e:
+            if entry is None:
+                raise
+            logger.warning("Could not check for changes to %s at portal "
+                           "'%s', using the copy cached at %s",
+                           api_name, self.server_url,
+                           time.ctime(entry['checked']),
+                           extra={'cause': str(e)})
+            return entry['data']
+        self.changed = True
+        self.entries[api_name] = {
+            'data': data,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'checked': time.time()}
+        return data
+
+    def save(self):
+        """Write the cache file if anything has changed."""
+        if not self.changed:
+            return
+        # write to a temporary file first, so as not to leave a partial one
+        temp_filename = '{}.{}.tmp'.format(self.filename, os.getpid())
+        with open(temp_filename, 'wb') as cache_file:
+            cPickle.dump((self.FORMAT_VERSION, self.entries), cache_file,
+                         cPickle.HIGHEST_PROTOCOL)
+        os.rename(temp_filename, self.filename)
+        self.changed = False
 
 
 def read_portal_json_file(dir_path, api_name, logger):
-    """Parse a JSON file named `api_name`.json in `dir_path`.
+    """Iterate over the JSON array in a file named `api_name`.json in `dir_path`.
 
-    Replacing any forward slashes in the API name by underscores.
+    Replacing any forward slashes in the API name by underscores. Return None
+    if there is no such file, and otherwise an iterator decoding one record
+    at a time.
     """
-    parsed_json = None
     json_fn = os.path.join(dir_path, '{}.json'.format(
                                          api_name.replace('/', '_')))
-    if os.path.isfile(json_fn):
-        logger.debug('Reading portal information from %s',
-                    json_fn)
-        with open(json_fn, 'rU') as json_file:
-            parsed_json = json.load(json_file)
-    return parsed_json
+    if not os.path.isfile(json_fn):
+        return None
+    logger.debug('Reading portal information from %s',
+                json_fn)
+    return _iter_json_file(json_fn)
+
+
+def _iter_json_file(json_fn):
+    """Iterate over the records of the JSON array in a file."""
+    with open(json_fn, 'rU') as json_file:
+        for record in iter_json_array(json_file):
+            yield record
 
 
 def index_api_data(parsed_json, id_field):
-    """Transform a list of dicts into a dict indexed by one of their fields.
+    """Transform an iterable of dicts into a dict indexed by one of their fields.
 
     >>> index_api_data([{'id': 'eggs', 'val1': 42, 'foo': True},
     ...                     {'id': 'spam', 'val1': 1, 'foo': True}], 'id')
@@ -2838,7 +5122,7 @@ def index_api_data(parsed_json, id_field):
 def transform_symbol_entrez_map(json_data,
                                 id_field='hugo_gene_symbol',
                                 values_field='entrez_gene_id'):
-    """Transform a list of homogeneous dicts into a dict of lists.
+    """Transform an iterable of homogeneous dicts into a dict of lists.
 
     Using the values of the `id_field` entries as the keys, mapping to lists
     of corresponding `values_field` entries.
@@ -2864,15 +5148,17 @@ def transform_symbol_entrez_map(json_data,
     return result_dict
 
 
-def load_portal_info(path, logger, offline=False):
+def load_portal_info(path, logger, offline=False, cache=None,
+                     timeout=PORTAL_API_TIMEOUT, retries=PORTAL_API_RETRIES):
     """Create a PortalInstance object based on a server API or offline dir.
 
     If `offline` is True, interpret `path` as the path to a directory of JSON
     files. Otherwise expect `path` to be the URL of a cBioPortal server and
-    use its web API.
+    use its web API, through the PortalInfoCache `cache` if one is given.
+    The APIs of a server are requested concurrently over one session, with
+    the given timeout in seconds and number of retries.
     """
-    portal_dict = {}
-    for api_name, transform_function in (
+    api_transforms = (
             ('cancertypes',
                 lambda json_data: index_api_data(json_data, 'id')),
             ('genes',
@@ -2880,14 +5166,51 @@ def load_portal_info(path, logger, offline=False):
                                         json_data, 'hugo_gene_symbol')),
             ('genesaliases',
                 lambda json_data: transform_symbol_entrez_map(
-                                        json_data, 'gene_alias'))):
-        if offline:
-            parsed_json = read_portal_json_file(path, api_name, logger)
+                                        json_data, 'gene_alias')))
+    session = None
+    if not offline:
+        session = create_portal_session(retries)
+
+    def load_api_data(api_transform):
+        """Read, or request and time, the data of one API and transform it."""
+        api_name, transform_function = api_transform
+        start_time = time.time()
+        if cache is not None and not offline:
+            # the cache stores the transformed data
+            parsed_json = cache.get(api_name, transform_function, logger,
+                                    session=session, timeout=timeout)
         else:
-            parsed_json = request_from_portal_api(path, api_name, logger)
-        if parsed_json is not None and transform_function is not None:
-            parsed_json = transform_function(parsed_json)
-        portal_dict[api_name] = parsed_json
+            if offline:
+                parsed_json = read_portal_json_file(path, api_name, logger)
+            else:
+                parsed_json = request_from_portal_api(path, api_name, logger,
+                                                      session=session,
+                                                      timeout=timeout)
+            if parsed_json is not None:
+                if transform_function is not None:
+                    parsed_json = transform_function(parsed_json)
+                else:
+                    parsed_json = list(parsed_json)
+        if not offline:
+            logger.debug("Loaded %s of portal at '%s' in %.2f seconds",
+                         api_name, path, time.time() - start_time)
+        return parsed_json
+
+    if offline:
+        api_data = map(load_api_data, api_transforms)
+    else:
+        # let the server work on all requests while the responses come in
+        thread_pool = multiprocessing.pool.ThreadPool(len(api_transforms))
+        try:
+            api_data = thread_pool.map(load_api_data, api_transforms)
+        finally:
+            thread_pool.terminate()
+            thread_pool.join()
+            session.close()
+    portal_dict = dict(zip((api_name for api_name, _ in api_transforms),
+                           api_data))
+    if cache is not None and not offline:
+        cache.save()
     if all(d is None for d in portal_dict.values()):
         raise IOError('No portal information found at {}'.format(
                           path))
@@ -2932,19 +5255,480 @@ def interface(args=None):
                         action='store_true', 
                         help='Option to enable relaxed mode for validator when '
                         'validating clinical data without header definitions')
+    parser.add_argument('-j', '--jobs', type=int, required=False, default=1,
+                        help='number of worker processes in which to validate '
+                             'the data files after the clinical sample file '
+                             '(default: 1)')
+    parser.add_argument('-m', '--max_errors_per_file', type=int,
+                        required=False,
+                        help='stop validating a data file after this many '
+                             'errors (default: no limit)')
+    parser.add_argument('-M', '--max_errors_per_message', type=int,
+                        required=False,
+                        help='stop validating a data file after this many '
+                             'errors of the same type (default: no limit)')
+    parser.add_argument('-f', '--fail_fast', required=False,
+                        action='store_true',
+                        help='stop validating the study at the first data '
+                             'file that cannot be parsed entirely')
+    parser.add_argument('-C', '--cache_dir', type=str, required=False,
+                        help='directory in which to keep a cache of '
+                             'validation messages, to skip reading data files '
+                             'that have not changed since the previous run, '
+                             'and of the information retrieved from the '
+                             'portal')
+    parser.add_argument('--portal_info_ttl', type=int, required=False,
+                        help='number of seconds for which to use cached '
+                             'portal information before checking the server '
+                             'for changes (default: {})'.format(
+                                 PORTAL_INFO_TTL))
+    parser.add_argument('--portal_timeout', type=float, required=False,
+                        help='number of seconds to wait for a response from '
+                             'the portal (default: {})'.format(
+                                 PORTAL_API_TIMEOUT))
+    parser.add_argument('--portal_retries', type=int, required=False,
+                        help='number of times to retry a failed request to '
+                             'the portal (default: {})'.format(
+                                 PORTAL_API_RETRIES))
+    parser.add_argument('--study_plan_file', type=str, required=False,
+                        help='file to which to write a plan of the study if '
+                             'it is valid, to import it from later on '
+                             'without validating it again')
 
     parser = parser.parse_args(args)
     return parser
 
 
-def validate_study(study_dir, portal_instance, logger, relaxed_mode):
+# state of a worker process, set by _init_validation_worker()
+_WORKER_CONTEXT = {}
+
+
+def _init_validation_worker(logger_name, portal_instance,
+                            defined_cancer_types, defined_sample_ids,
+                            defined_sample_attributes, patients_with_samples):
+    """Set up a worker process to validate data files of a study.
+
+    The study-specific globals and the portal instance are passed once for
+    each worker, and log records are collected instead of being output.
+    """
+    global DEFINED_CANCER_TYPES
+    global DEFINED_SAMPLE_IDS
+    global DEFINED_SAMPLE_ATTRIBUTES
+    global PATIENTS_WITH_SAMPLES
+
+    DEFINED_CANCER_TYPES = defined_cancer_types
+    DEFINED_SAMPLE_IDS = defined_sample_ids
+    DEFINED_SAMPLE_ATTRIBUTES = defined_sample_attributes
+    PATIENTS_WITH_SAMPLES = patients_with_samples
+
+    # replace any handlers inherited from the main process
+    logger = logging.getLogger(logger_name)
+    logger.handlers = []
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    collecting_handler = RecordCollectingHandler()
+    logger.addHandler(collecting_handler)
+
+    _WORKER_CONTEXT['portal_instance'] = portal_instance
+    _WORKER_CONTEXT['logger'] = logger
+    _WORKER_CONTEXT['collecting_handler'] = collecting_handler
+
+
+def _create_worker_validator(study_dir, validator_class_name, meta_dict,
+                             relaxed_mode, max_errors_per_file,
+                             max_errors_per_message):
+    """Instantiate a validator in a worker process."""
+    validator_class = globals()[validator_class_name]
+    validator = validator_class(study_dir, meta_dict,
+                                _WORKER_CONTEXT['portal_instance'],
+                                _WORKER_CONTEXT['logger'],
+                                relaxed_mode)
+    validator.max_errors_per_file = max_errors_per_file
+    validator.max_errors_per_message = max_errors_per_message
+    return validator
+
+
+def _validate_file_in_worker(task):
+    """Validate a data file in a worker process and return its log records.
+
+    `task` is a tuple of the study directory, the name of the validator
+    class, the meta file dictionary, the relaxed_mode flag and the error
+    budget of the file. Return the log records and the results of
+    validation that the main process needs, as by _getCachedState().
+    """
+    validator = _create_worker_validator(*task)
+    try:
+        validator.validate()
+    finally:
+        records = _WORKER_CONTEXT['collecting_handler'].pop_records()
+    return records, validator._getCachedState()
+
+
+def _iter_mapped_lines(data_file, start, end, newlines_found):
+    """Yield the lines between two offsets in a file, mapping it in chunks.
+
+    Each chunk of about READ_CHUNK_SIZE bytes is memory-mapped separately and
+    split on its line breaks in one go, so the memory used stays bounded. Like
+    in 'rU' mode, any of '\n', '\r\n' or '\r' ends a line. The line breaks
+    are stripped from the lines yielded and added to the set `newlines_found`.
+    """
+    for chunk in _iter_mapped_chunks(data_file, start, end):
+        for line in _split_mapped_chunk(chunk, newlines_found):
+            yield line
+
+
+def _iter_mapped_chunks(data_file, start, end):
+    """Yield the bytes between two offsets in a file, mapping it in chunks.
+
+    Each chunk of about READ_CHUNK_SIZE bytes ends after the last '\n' in
+    it, except for the last chunk, so no '\n' or '\r\n' line is split over
+    two chunks.
+    """
+    chunk_size = READ_CHUNK_SIZE
+    position = start
+    while position < end:
+        # mappings must start at a multiple of the allocation granularity
+        map_start = position - position % mmap.ALLOCATIONGRANULARITY
+        chunk_end = min(position + chunk_size, end)
+        mapped_chunk = mmap.mmap(data_file.fileno(), chunk_end - map_start,
+                                 access=mmap.ACCESS_READ, offset=map_start)
+        try:
+            if chunk_end < end:
+                # end the chunk after its last complete line
+                last_newline = mapped_chunk.rfind('\n', position - map_start)
+                if last_newline == -1:
+                    # not a single line ends in this chunk, try a larger one
+                    chunk_size *= 2
+                    continue
+                chunk_end = map_start + last_newline + 1
+            chunk = mapped_chunk[position - map_start:chunk_end - map_start]
+        finally:
+            mapped_chunk.close()
+        position = chunk_end
+        yield chunk
+
+
+def _split_mapped_chunk(chunk, newlines_found):
+    """Split a chunk from _iter_mapped_chunks() into lines as 'rU' mode does.
+
+    The line breaks are stripped from the lines returned and added to the set
+    `newlines_found`.
+    """
+    # split the chunk in one go if all its lines end the same way
+    line_break = None
+    if '\r' not in chunk:
+        line_break = '\n'
+    elif chunk.count('\r') == chunk.count('\n') == chunk.count('\r\n'):
+        line_break = '\r\n'
+    if line_break is not None:
+        lines = chunk.split(line_break)
+        if len(lines) > 1:
+            newlines_found.add(line_break)
+        # drop the empty string after the last line break
+        if lines[-1] == '':
+            lines.pop()
+        return lines
+    lines = []
+    for line in chunk.splitlines(True):
+        content = line.rstrip('\r\n')
+        if len(content) < len(line):
+            newlines_found.add(line[len(content):])
+        lines.append(content)
+    return lines
+
+
+# number of bits in which each kind of byte is counted by _byte_kind_weights()
+_BYTE_KIND_BITS = 12
+# largest count of a kind of byte that does not overflow into the next kind
+_MAX_BYTE_KIND_COUNT = (1 << _BYTE_KIND_BITS) - 1
+
+
+def _byte_kind_weights():
+    """Return an array of the weight of each byte value in a packed count.
+
+    Digits, signs, decimal points, exponent characters and other bytes are
+    counted in consecutive groups of _BYTE_KIND_BITS bits, so that a single
+    running count covers all of them.
+    """
+    weights = np.empty(256, dtype=np.int64)
+    weights[:] = 1 << (4 * _BYTE_KIND_BITS)
+    weights[ord('0'):ord('9') + 1] = 1
+    weights[[ord('-'), ord('+')]] = 1 << _BYTE_KIND_BITS
+    weights[ord('.')] = 1 << (2 * _BYTE_KIND_BITS)
+    weights[[ord('e'), ord('E')]] = 1 << (3 * _BYTE_KIND_BITS)
+    return weights
+
+
+def _running_count(values):
+    """Sum an integer (or boolean) array cumulatively, starting from 0.
+
+    The difference between the sums at two offsets is the sum of the values
+    from the first offset up to the second.
+    """
+    counts = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(values, out=counts[1:])
+    return counts
+
+
+def _count_byte_kinds(kind_counts, starts, ends):
+    """Count the bytes of each kind between pairs of offsets.
+
+    `kind_counts` is the running count of the weights from
+    _byte_kind_weights(). Return arrays of the numbers of digits, signs,
+    decimal points, exponent characters and other bytes, which are only
+    right for ranges with at most _MAX_BYTE_KIND_COUNT bytes of each kind.
+    """
+    packed_counts = kind_counts[ends] - kind_counts[starts]
+    return [(packed_counts >> (kind * _BYTE_KIND_BITS)) & _MAX_BYTE_KIND_COUNT
+            for kind in range(4)] + [packed_counts >> (4 * _BYTE_KIND_BITS)]
+
+
+def _is_sign_byte(values):
+    """Tell which bytes in an array are a + or - sign."""
+    return (values == ord('-')) | (values == ord('+'))
+
+
+def _is_number_part(buf, kind_counts, starts, ends, max_points):
+    """Tell which byte ranges are an optionally signed number without exponent.
+
+    A range is such a number if it has at least one digit, at most
+    `max_points` decimal points and no sign but a leading one, assuming it
+    has no other bytes than these and no more than _MAX_BYTE_KIND_COUNT
+    bytes in all.
+    """
+    digits, signs, points, _, _ = _count_byte_kinds(kind_counts, starts, ends)
+    return ((digits >= 1) & (points <= max_points) &
+            ((signs == 0) | ((signs == 1) & _is_sign_byte(buf[starts]))))
+
+
+def _count_lines_in_worker(byte_range):
+    """Count the lines between two byte offsets in a file, as in 'rU' mode.
+
+    `byte_range` is a tuple of the file name and the start and end offsets.
+    """
+    filename, start, end = byte_range
+    with open(filename, 'rb') as data_file:
+        data_file.seek(start)
+        shard = data_file.read(end - start)
+    num_lines = shard.count('\n') + shard.count('\r') - shard.count('\r\n')
+    # count a last line not terminated by a line break
+    if shard and shard[-1] not in '\r\n':
+        num_lines += 1
+    return num_lines
+
+
+def _find_line_offset(filename, start, end, num_lines):
+    """Return the byte offset after skipping lines from an offset in a file.
+
+    Lines are counted as in _count_lines_in_worker(), but no further than
+    the offset `end`.
+    """
+    with open(filename, 'rb') as data_file:
+        data_file.seek(start)
+        shard = data_file.read(end - start)
+    if num_lines <= 0:
+        return start
+    for line_count, line_break in enumerate(
+            re.finditer(r'\r\n|\r|\n', shard), start=1):
+        if line_count == num_lines:
+            return start + line_break.end()
+    return end
+
+
+def _validate_shard_in_worker(task):
+    """Check a shard of a data file in a worker process.
+
+    `task` is a tuple of the arguments for the validator, followed by the
+    start and end offsets of the shard and the number of its first line.
+    Return the log records, the validator's cross-line state, the set of
+    line breaks found and, if the shard exceeded the error budget of the
+    file, the number of the last line checked.
+    """
+    validator = _create_worker_validator(*task[:6])
+    start, end, first_line_number = task[6:]
+    collecting_handler = _WORKER_CONTEXT['collecting_handler']
+    try:
+        # set up the validator like the main process did, whose messages
+        # about the header have already been logged there
+        with open(validator.filename, 'rU') as data_file:
+            validator._parseFileHeader(data_file)
+        collecting_handler.pop_records()
+        newlines_found = validator._checkShard(start, end, first_line_number)
+    finally:
+        records = collecting_handler.pop_records()
+    if validator.validationAborted:
+        last_line_number = validator.line_number
+    else:
+        last_line_number = None
+    return (records, validator._getShardState(), newlines_found,
+            last_line_number)
+
+
+def create_validation_pool(portal_instance, logger, jobs):
+    """Start `jobs` worker processes with the current study globals."""
+    return multiprocessing.Pool(
+        processes=jobs,
+        initializer=_init_validation_worker,
+        initargs=(logger.name, portal_instance,
+                  DEFINED_CANCER_TYPES, DEFINED_SAMPLE_IDS,
+                  DEFINED_SAMPLE_ATTRIBUTES, PATIENTS_WITH_SAMPLES))
+
+
+def validate_in_shards(validator, pool):
+    """Validate a data file, splitting it over `pool` if it is large."""
+    validator.shard_pool = pool
+    try:
+        validator.validate()
+    finally:
+        validator.shard_pool = None
+
+
+def _is_shardable_file(validator):
+    """Tell whether a data file is large enough to be validated in shards."""
+    return (validator.SHARDABLE and
+            os.path.isfile(validator.filename) and
+            os.path.getsize(validator.filename) > SHARD_SIZE)
+
+
+def validate_in_own_pool(validator, portal_instance, logger, jobs):
+    """Validate a data file in shards, using a pool of its own."""
+    pool = create_validation_pool(portal_instance, logger, jobs)
+    try:
+        validate_in_shards(validator, pool)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def validate_with_cache(validator, cache, validate_function):
+    """Validate a data file by calling `validate_function`, unless cached.
+
+    If `cache` is a ValidationCache that has an entry for the file, its
+    messages are replayed instead, and otherwise they are stored in it.
+    """
+    if cache is None:
+        validate_function()
+        return
+    cache_key, entry = cache.lookup(validator)
+    if entry is not None:
+        cache.replay(validator, entry)
+    else:
+        cache.record(validator, cache_key, validate_function)
+
+
+def _replay_worker_result(validator, result, logger):
+    """Log the records of a file validated by _validate_file_in_worker()."""
+    records, worker_state = result.get()
+    validator._restoreCachedState(worker_state)
+    for record_dict in records:
+        logger.handle(logging.makeLogRecord(record_dict))
+
+
+def _is_fatal_file(validator, fail_fast, logger):
+    """Tell whether to stop validating the study after this data file.
+
+    This is the case in fail-fast mode if the file could not be parsed
+    entirely, for instance because it exceeded its error budget.
+    """
+    if fail_fast and not validator.fileCouldBeParsed:
+        logger.info('Skipping validation of the remaining files, as this '
+                    'file could not be validated and fail-fast mode is on',
+                    extra={'filename_': validator.filename})
+        return True
+    return False
+
+
+def validate_files_in_parallel(validators, study_dir, portal_instance,
+                               logger, relaxed_mode, jobs, fail_fast=False,
+                               cache=None):
+    """Run data file validators in a pool of `jobs` worker processes.
+
+    Files larger than SHARD_SIZE are split into shards validated by the
+    workers, the others are validated as a whole by a single worker. The log
+    records of each file are passed on to `logger` once the file has been
+    validated, in the order of the `validators` list. Files found in the
+    ValidationCache `cache` are not validated again.
+
+    Return False if validation was stopped at a file that could not be
+    parsed because `fail_fast` was set, True otherwise.
+    """
+    logger.debug('Validating %d data files in %d worker processes',
+                 len(validators), jobs)
+    pool = create_validation_pool(portal_instance, logger, jobs)
+    try:
+        cache_lookups = []
+        for validator in validators:
+            if cache is None:
+                cache_lookups.append((None, None))
+            else:
+                cache_lookups.append(cache.lookup(validator))
+        # submit the whole files first, to keep the workers busy
+        pending_results = []
+        for validator, (_, entry) in zip(validators, cache_lookups):
+            if entry is not None or _is_shardable_file(validator):
+                pending_results.append(None)
+            else:
+                task = (study_dir,
+                        validator.__class__.__name__,
+                        validator.meta_dict,
+                        relaxed_mode,
+                        validator.max_errors_per_file,
+                        validator.max_errors_per_message)
+                pending_results.append(
+                    pool.apply_async(_validate_file_in_worker, (task,)))
+        for validator, (cache_key, entry), result in zip(
+                validators, cache_lookups, pending_results):
+            if result is None:
+                validate_function = functools.partial(
+                    validate_in_shards, validator, pool)
+            else:
+                validate_function = functools.partial(
+                    _replay_worker_result, validator, result, logger)
+            if cache is None:
+                validate_function()
+            elif entry is not None:
+                cache.replay(validator, entry)
+            else:
+                cache.record(validator, cache_key, validate_function)
+            if _is_fatal_file(validator, fail_fast, logger):
+                # drop the work still queued for the remaining files
+                pool.terminate()
+                return False
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return True
+
+
+def validate_study(study_dir, portal_instance, logger, relaxed_mode, jobs=1,
+                   max_errors_per_file=None, max_errors_per_message=None,
+                   fail_fast=False, cache=None):
 
     """Validate the study in `study_dir`, logging messages to `logger`, and relaxing
         clinical data validation if `relaxed_mode` is true.
 
     This will verify that the study is compatible with the portal configuration
     represented by the PortalInstance object `portal_instance`, if its
-    attributes are not None.
+    attributes are not None. If `jobs` is more than 1, the data files that
+    do not define cancer types or samples are validated in that many worker
+    processes, and files larger than SHARD_SIZE are split up among them.
+
+    Reading a data file is stopped once it has more errors than
+    `max_errors_per_file`, or more errors of a single type than
+    `max_errors_per_message`. If `fail_fast` is true, validation of the study
+    is stopped at the first data file that cannot be parsed entirely.
+
+    If `cache` is a ValidationCache, the messages of data files validated
+    before with the same inputs are replayed from it instead.
+
+    Return a cbioportal_common.StudyPlan of the study to import it by, or
+    None if validation was stopped before the end.
     """
 
     global DEFINED_CANCER_TYPES
@@ -2955,16 +5739,22 @@ def validate_study(study_dir, portal_instance, logger, relaxed_mode):
     if portal_instance.cancer_type_dict is None:
         logger.warning('Skipping validations relating to cancer types '
                        'defined in the portal')
-    if (portal_instance.hugo_entrez_map is None or
-            portal_instance.alias_entrez_map is None):
+    if portal_instance.gene_index is None:
         logger.warning('Skipping validations relating to gene identifiers and '
                        'aliases defined in the portal')
 
     # walk over the meta files in the dir and get properties of the study
+    study_plan = cbioportal_common.StudyPlan(study_dir)
     (validators_by_meta_type,
      defined_case_list_fns,
      study_cancer_type,
-     study_id) = process_metadata_files(study_dir, portal_instance, logger, relaxed_mode)
+     study_id) = process_metadata_files(study_dir, portal_instance, logger,
+                                        relaxed_mode, study_plan=study_plan)
+    for validators in validators_by_meta_type.values():
+        for validator in validators:
+            if validator is not None:
+                validator.max_errors_per_file = max_errors_per_file
+                validator.max_errors_per_message = max_errors_per_message
 
     # first parse and validate cancer type files
     studydefined_cancer_types = []
@@ -2979,7 +5769,10 @@ def validate_study(study_dir, portal_instance, logger, relaxed_mode):
                     validators_by_meta_type[
                             cbioportal_common.MetaFileTypes.CANCER_TYPE])})
         else:
-            cancer_type_validators[0].validate()
+            validate_with_cache(cancer_type_validators[0], cache,
+                                cancer_type_validators[0].validate)
+            if _is_fatal_file(cancer_type_validators[0], fail_fast, logger):
+                return
             studydefined_cancer_types = (
                 cancer_type_validators[0].defined_cancer_types)
     DEFINED_CANCER_TYPES = studydefined_cancer_types
@@ -3013,7 +5806,17 @@ def validate_study(study_dir, portal_instance, logger, relaxed_mode):
     defined_sample_ids = None
     for sample_validator in validators_by_meta_type[
             cbioportal_common.MetaFileTypes.SAMPLE_ATTRIBUTES]:
-        sample_validator.validate()
+        if jobs > 1 and _is_shardable_file(sample_validator):
+            # the workers for the other files need the sample IDs, so split
+            # up a large sample file using a separate pool
+            validate_function = functools.partial(
+                validate_in_own_pool, sample_validator, portal_instance,
+                logger, jobs)
+        else:
+            validate_function = sample_validator.validate
+        validate_with_cache(sample_validator, cache, validate_function)
+        if _is_fatal_file(sample_validator, fail_fast, logger):
+            return
         if sample_validator.fileCouldBeParsed:
             if defined_sample_ids is None:
                 defined_sample_ids = set()
@@ -3040,6 +5843,7 @@ def validate_study(study_dir, portal_instance, logger, relaxed_mode):
                     cbioportal_common.MetaFileTypes.PATIENT_ATTRIBUTES])})
 
     # next validate all other data files
+    remaining_validators = []
     for meta_file_type in validators_by_meta_type:
         # skip cancer type and clinical files, they have already been validated
         if meta_file_type in (cbioportal_common.MetaFileTypes.CANCER_TYPE,
@@ -3049,7 +5853,21 @@ def validate_study(study_dir, portal_instance, logger, relaxed_mode):
             # if there was no validator for this meta file
             if validator is None:
                 continue
-            validator.validate()
+            remaining_validators.append(validator)
+    # these files do not depend on each other, so they can be run in parallel
+    if jobs > 1 and (len(remaining_validators) > 1 or
+                     any(_is_shardable_file(validator)
+                         for validator in remaining_validators)):
+        if not validate_files_in_parallel(remaining_validators, study_dir,
+                                          portal_instance, logger,
+                                          relaxed_mode, jobs=jobs,
+                                          fail_fast=fail_fast, cache=cache):
+            return
+    else:
+        for validator in remaining_validators:
+            validate_with_cache(validator, cache, validator.validate)
+            if _is_fatal_file(validator, fail_fast, logger):
+                return
 
     # finally validate the case list directory if present
     case_list_dirname = os.path.join(study_dir, 'case_lists')
@@ -3068,11 +5886,35 @@ def validate_study(study_dir, portal_instance, logger, relaxed_mode):
 
     logger.info('Validation complete')
 
+    # record what has been validated, for the import to go by
+    for validators in validators_by_meta_type.values():
+        for validator in validators:
+            if validator is not None:
+                study_plan.set_num_records(validator.filename,
+                                           validator.num_data_lines)
+    if DEFINED_SAMPLE_IDS is not None:
+        study_plan.sample_ids = frozenset(DEFINED_SAMPLE_IDS)
+    study_plan.record_file_contents()
+    return study_plan
+
 
 def main_validate(args):
 
     """Main function: process parsed arguments and validate the study."""
 
+    exit_status, _ = main_validate_with_plan(args)
+    return exit_status
+
+
+def main_validate_with_plan(args):
+
+    """Validate the study as main_validate() does and make a plan to import it.
+
+    Return the exit status and the cbioportal_common.StudyPlan of the study,
+    which is None if validation failed or was stopped. If the
+    study_plan_file argument is set, the plan is also saved to that file.
+    """
+
     # get a logger to emit messages
     logger = logging.getLogger(__name__)
     logger.setLevel(logging.DEBUG)
@@ -3087,6 +5929,12 @@ def main_validate(args):
     relaxed_mode = False
     if hasattr(args, 'relaxed_clinical_definitions') and args.relaxed_clinical_definitions:
         relaxed_mode = True
+    jobs = getattr(args, 'jobs', None) or 1
+    max_errors_per_file = getattr(args, 'max_errors_per_file', None)
+    max_errors_per_message = getattr(args, 'max_errors_per_message', None)
+    fail_fast = getattr(args, 'fail_fast', False)
+    cache_dir = getattr(args, 'cache_dir', None)
+    study_plan_filename = getattr(args, 'study_plan_file', None)
 
     # determine the log level for terminal and html output
     output_loglevel = logging.INFO
@@ -3096,20 +5944,23 @@ def main_validate(args):
     # check existence of directory
     if not os.path.exists(study_dir):
         print >> sys.stderr, 'directory cannot be found: ' + study_dir
-        return 2
+        return 2, None
+    # create the cache directory before the portal information, the gene
+    # index and the validation messages are stored in it
+    if cache_dir and not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError as e:
+            print >> sys.stderr, 'cache directory cannot be created: ' + str(e)
+            return 2, None
 
     # set default message handler
     text_handler = logging.StreamHandler(sys.stdout)
     text_handler.setFormatter(
         cbioportal_common.LogfileStyleFormatter(study_dir))
-    collapsing_text_handler = cbioportal_common.CollapsingLogMessageHandler(
-        capacity=1e6,
-        flushLevel=logging.CRITICAL,
-        target=text_handler)
-    collapsing_text_handler.setLevel(output_loglevel)
-    logger.addHandler(collapsing_text_handler)
-
-    collapsing_html_handler = None
+    text_handler.setLevel(output_loglevel)
+    output_handlers = [text_handler]
+
     html_handler = None
     # add html table handler if applicable
     if html_output_filename:
@@ -3120,27 +5971,27 @@ def main_validate(args):
             study_dir,
             html_output_filename,
             capacity=1e5)
-        # TODO extend CollapsingLogMessageHandler to flush to multiple targets,
-        # and get rid of the duplicated buffering of messages here
-        collapsing_html_handler = cbioportal_common.CollapsingLogMessageHandler(
-            capacity=1e6,
-            flushLevel=logging.CRITICAL,
-            target=html_handler)
-        collapsing_html_handler.setLevel(output_loglevel)
-        logger.addHandler(collapsing_html_handler)
+        html_handler.setLevel(output_loglevel)
+        output_handlers.append(html_handler)
 
     if args.error_file:
         errfile_handler = logging.FileHandler(args.error_file, 'w')
         errfile_handler.setFormatter(ErrorFileFormatter(study_dir))
-        # TODO extend CollapsingLogMessageHandler to flush to multiple targets,
-        # and get rid of the duplicated buffering of messages here
-        coll_errfile_handler = cbioportal_common.CollapsingLogMessageHandler(
-            capacity=1e6,
-            flushLevel=logging.CRITICAL,
-            target=errfile_handler)
-        coll_errfile_handler.setLevel(logging.WARNING)
-        coll_errfile_handler.addFilter(LineMessageFilter())
-        logger.addHandler(coll_errfile_handler)
+        errfile_handler.setLevel(logging.WARNING)
+        errfile_handler.addFilter(LineMessageFilter())
+        output_handlers.append(errfile_handler)
+
+    # collapse repeated messages once for all of the outputs, created after
+    # them so that it is flushed before they are closed on shutdown; the
+    # error file lists every line number, the other outputs only a few
+    uncapped_fields = []
+    if args.error_file:
+        uncapped_fields.append('line_number')
+    collapsing_handler = cbioportal_common.CollapsingLogMessageHandler(
+        targets=output_handlers, uncapped_fields=uncapped_fields)
+    collapsing_handler.setLevel(
+        min(handler.level for handler in output_handlers))
+    logger.addHandler(collapsing_handler)
 
     # load portal-specific information
     if args.no_portal_checks:
@@ -3151,20 +6002,59 @@ def main_validate(args):
         portal_instance = load_portal_info(args.portal_info_dir, logger,
                                            offline=True)
     else:
-        portal_instance = load_portal_info(server_url, logger)
+        portal_info_cache = None
+        if cache_dir:
+            portal_info_ttl = getattr(args, 'portal_info_ttl', None)
+            if portal_info_ttl is None:
+                portal_info_ttl = PORTAL_INFO_TTL
+            portal_info_cache = PortalInfoCache(cache_dir, server_url,
+                                                portal_info_ttl)
+        portal_timeout = getattr(args, 'portal_timeout', None)
+        if portal_timeout is None:
+            portal_timeout = PORTAL_API_TIMEOUT
+        portal_retries = getattr(args, 'portal_retries', None)
+        if portal_retries is None:
+            portal_retries = PORTAL_API_RETRIES
+        portal_instance = load_portal_info(server_url, logger,
+                                           cache=portal_info_cache,
+                                           timeout=portal_timeout,
+                                           retries=portal_retries)
 
     if args.config_file:
         portal_instance.load_genome_info_from_arg(args)
     else:
         portal_instance.load_genome_info(args.portal_properties)
 
-    validate_study(study_dir, portal_instance, logger, relaxed_mode)
+    cache = None
+    if cache_dir:
+        # let the worker processes map the same gene index file
+        share_gene_index(portal_instance, cache_dir)
+        try:
+            cache = ValidationCache(cache_dir, portal_instance)
+        except sqlite3.Error as e:
+            print >> sys.stderr, 'validation cache cannot be opened: ' + str(e)
+            return 2, None
+    try:
+        study_plan = validate_study(
+            study_dir, portal_instance, logger, relaxed_mode, jobs,
+            max_errors_per_file=max_errors_per_file,
+            max_errors_per_message=max_errors_per_message,
+            fail_fast=fail_fast, cache=cache)
+    finally:
+        if cache is not None:
+            cache.close()
 
     if html_handler is not None:
-        collapsing_html_handler.flush()
+        collapsing_handler.flush()
         html_handler.generateHtml()
 
-    return exit_status_handler.get_exit_status()
+    exit_status = exit_status_handler.get_exit_status()
+    # only a study that can be imported gets a plan
+    if exit_status not in (0, 3):
+        study_plan = None
+    if study_plan is not None and study_plan_filename:
+        study_plan.save(study_plan_filename)
+    return exit_status, study_plan
 
 
 # ------------------------------------------------------------------------------